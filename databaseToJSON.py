@@ -10,12 +10,6 @@ from collections import defaultdict
 
 from version_guard import isString
 
-import zlib
-try:
-    import cPickle as pickle
-except:
-    import pickle
-
 try:
     import ujson as json
 except:
@@ -24,6 +18,7 @@ except:
 
 from rmBitmasks import *
 from renderJustification import printOp
+from rmDatabase import readDatabase
 
 Version = u'5.1'
 DatabaseVersion = u'5.1'
@@ -137,10 +132,7 @@ class Justification:
             self.composite = composite
         
 def loadDatabase(databaseName, quiet=False):
-    with open(databaseName, mode='rb') as databaseFile:
-        compressedDatabase = databaseFile.read()
-        pickledDatabase = zlib.decompress(compressedDatabase)
-        setDatabase(pickle.loads(pickledDatabase))
+    setDatabase(readDatabase(databaseName))
 
 def getDatabase():
     return {'version': DatabaseVersion,
@@ -1,17 +1,11 @@
 from __future__ import print_function, unicode_literals
 
+from collections import OrderedDict
+
 from rmBitmasks import Form, Reduction
 
 from version_guard import lru_cache, isString
 
-_justLineMarker = u'*'
-_justIndentMarker = u'@'
-justMarker = _justLineMarker + _justIndentMarker
-_justIndented = justMarker + _justIndentMarker
-_justFormat = justMarker + u'{0}: '
-def indentJust(jst):
-    return jst.replace(justMarker, _justIndented)
-
 @lru_cache(maxsize=1024)
 def printOp(op):
     if isString(op):
@@ -44,30 +38,126 @@ def printFact(a, op, b):
             op = (op[0], u'<=>')
     return u'{0} {1} {2}'.format(a, printOp(op), b)
 
-printedJustify = {}
-def printJustification(fact, justify, formatted=True):
-    a,op,b = fact
+class LRUCache(object):
+    # Mapping that only keeps its most recently used items
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+    
+    def __getitem__(self, key):
+        value = self._items.pop(key)
+        self._items[key] = value
+        return value
+    
+    def __setitem__(self, key, value):
+        self._items.pop(key, None)
+        self._items[key] = value
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+    
+    def __contains__(self, key):
+        return key in self._items
     
-    r = ''
+    def __len__(self):
+        return len(self._items)
+    
+    def clear(self):
+        self._items.clear()
+
+_justIndent = u'    '
+
+# Line and premises of each recently printed fact
+printedJustify = LRUCache(maxsize=4096)
+def justificationNode(fact, justify):
     try:
-        r = printedJustify[fact]
+        return printedJustify[fact]
     except KeyError:
-        if op == u'form':
-            r = justMarker + printFact(*fact)
+        pass
+    
+    a,op,b = fact
+    if op == u'form':
+        node = (printFact(*fact), ())
+    else:
+        try:
+            jst = justify[fact]
+        except KeyError:
+            raise Exception(u'ERROR: Referenced fact "{0}" not justified!'.format(printFact(*fact)))
+        
+        if isString(jst):
+            node = (printFact(*fact) + u': ' + jst, ())
         else:
-            try:
-                jst = justify[fact]
-            except KeyError:
-                raise Exception(u'ERROR: Referenced fact "{0}" not justified!'.format(printFact(*fact)))
+            node = (printFact(*fact) + u': ', jst)
+    printedJustify[fact] = node
+    return node
+
+def writeJustification(fact, justify, write):
+    # Write the justification of fact, with those of its premises indented below it; the
+    #  premises are expanded from an explicit stack, so long chains cannot overflow it
+    stack = [(fact, 1)]
+    while stack:
+        fact, depth = stack.pop()
+        if isString(fact):
+            write(u'\n' + _justIndent * depth + fact)
+            continue
+        
+        line, premises = justificationNode(fact, justify)
+        write(u'\n' + _justIndent * depth + line)
+        for f in reversed(premises):
+            stack.append((f, depth + 1))
+
+def printJustification(fact, justify):
+    r = []
+    writeJustification(fact, justify, r.append)
+    return u''.join(r)
+
+def proofSteps(facts, justify):
+    # Number the given facts and all of their premises, so that each is listed once and
+    #  after its premises; returns the list of steps, and the numbers of the given facts
+    number = {}
+    steps = []
+    for fact in facts:
+        stack = [(fact, False)]
+        while stack:
+            fact, expanded = stack.pop()
+            if fact in number: continue
             
-            if isString(jst):
-                r = _justFormat.format(printFact(*fact)) + jst
+            a,op,b = fact
+            if op == u'form':
+                jst = None
             else:
-                r = _justFormat.format(printFact(*fact)) \
-                    + u''.join((_justIndented+f if isString(f) else indentJust(printJustification(f, justify, formatted=False))) for f in jst)
-        printedJustify[fact] = r
-    
-    if formatted:
-        return r.replace(_justLineMarker, u'\n').replace(_justIndentMarker, u'    ')
-    else:
-        return r
\ No newline at end of file
+                try:
+                    jst = justify[fact]
+                except KeyError:
+                    raise Exception(u'ERROR: Referenced fact "{0}" not justified!'.format(printFact(*fact)))
+            
+            if jst is None or isString(jst) or expanded:
+                step = {'id': len(steps) + 1, 'fact': printFact(*fact)}
+                if isString(jst):
+                    step['citation'] = jst
+                elif jst is not None:
+                    step['premises'] = [(f if isString(f) else number[f]) for f in jst]
+                steps.append(step)
+                number[fact] = step['id']
+            else:
+                stack.append((fact, True))
+                for f in reversed(jst):
+                    if not isString(f) and f not in number:
+                        stack.append((f, False))
+    return steps, [number[fact] for fact in facts]
+
+def writeProof(facts, justify, write):
+    # Write the justifications of the given facts as numbered steps, each referring to
+    #  the steps for its premises
+    steps, conclusions = proofSteps(facts, justify)
+    for step in steps:
+        line = u'\n{0}[{1}] {2}'.format(_justIndent, step['id'], step['fact'])
+        if 'citation' in step:
+            line += u': ' + step['citation']
+        elif 'premises' in step:
+            line += u': from ' + u', '.join((u'[{0}]'.format(p) if isinstance(p, int) else p) for p in step['premises'])
+        write(line)
+
+def printProof(facts, justify):
+    r = []
+    writeProof(facts, justify, r.append)
+    return u''.join(r)
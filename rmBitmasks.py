@@ -2,8 +2,6 @@ from __future__ import print_function, unicode_literals
 
 from enum import Enum
 
-from version_guard import lru_cache
-
 class BitmaskEnum(int, Enum):
     def __new__(cls, value=None):
         if value is None:
@@ -20,26 +18,8 @@ class BitmaskEnum(int, Enum):
     def isPresent(x,magic_num):
         return (x & magic_num) != 0
     
-    @classmethod
-    @lru_cache(maxsize=256)
-    def strongest(cls,magic_num):
-        if magic_num == 0:
-            return cls(0)
-        else:
-            return cls(1 << (magic_num.bit_length() - 1))
-    
-    @classmethod
-    @lru_cache(maxsize=256)
-    def weakest(cls,magic_num):
-        if magic_num == 0:
-            return cls.none
-        else:
-            return cls(magic_num & -magic_num)
-    
-    @classmethod
-    @lru_cache(maxsize=256)
-    def list(cls,magic_num):
-        return [x for x in cls if cls.isPresent(x, magic_num)]
+    # Each subclass also has strongest, weakest, and list, which look up a raw mask
+    #  in the tables built by _maskTables
     
     @classmethod
     def fromString(cls,s):
@@ -48,6 +28,39 @@ class BitmaskEnum(int, Enum):
         except AttributeError:
             raise NotImplementedError("The {0} `{1}` is not implemented.".format(cls.__name__, s))
 
+def _maskTables(enum):
+    # Precompute, for every raw mask, the members it contains (in the order of the
+    #  enum), and the strongest and weakest of them; each lookup is then a single
+    #  indexing operation, with no Enum construction or caching
+    members = [x for x in enum if x != enum.none]
+    size = 1 << len(members)
+    
+    lists = [None] * size
+    lists[0] = []
+    masks = [0]
+    for x in reversed(members):
+        for magic_num in masks:
+            lists[magic_num | x] = [x] + lists[magic_num]
+        masks += [magic_num | x for magic_num in masks]
+    
+    strongest = [enum.none] * size
+    weakest = [enum.none] * size
+    for x in sorted(members):
+        strongest[x:2*x] = [x] * x # Masks whose highest bit is x
+        weakest[x::2*x] = [x] * len(range(x, size, 2*x)) # Masks whose lowest bit is x
+    
+    enum.list = lists.__getitem__
+    enum.strongest = strongest.__getitem__
+    enum.weakest = weakest.__getitem__
+
+def _closureTable(enum, closure):
+    # Extend closure from single members to every raw mask, as plain integers
+    table = [0] * (1 << (len(enum) - 1))
+    for magic_num in range(1, len(table)):
+        lowest = magic_num & -magic_num
+        table[magic_num] = table[magic_num ^ lowest] | closure[lowest]
+    return table
+
 class Reduction(BitmaskEnum):
     none = 0
     w = 1 << 0
@@ -71,6 +84,8 @@ class Reduction(BitmaskEnum):
 Reduction.alias = {u'': Reduction.RCA,
                    u'gc': Reduction.w}
 
+_maskTables(Reduction)
+
 def noReduction():
     return Reduction.none
 
@@ -88,6 +103,8 @@ class Form(BitmaskEnum):
     Pi12 = 1 << 1
     Pi13 = 1 << 0
 
+_maskTables(Form)
+
 def noForm():
     return Form.none
 
@@ -128,8 +145,8 @@ _completeImplications(Reduction, _R_WEAKER)
 
 _R_STRONGER = _reverseImplications(Reduction, _R_WEAKER)
 
-Reduction.weaker = lambda r: _R_WEAKER[r]
-Reduction.stronger = lambda r: _R_STRONGER[r]
+Reduction.weaker = _closureTable(Reduction, _R_WEAKER).__getitem__
+Reduction.stronger = _closureTable(Reduction, _R_STRONGER).__getitem__
 
 _F_STRONGER = {f:f for f in Form}
 
@@ -153,5 +170,5 @@ _completeImplications(Form, _F_STRONGER)
 
 _F_WEAKER = _reverseImplications(Form, _F_STRONGER)
 
-Form.weaker = lambda f: _F_WEAKER[f]
-Form.stronger = lambda f: _F_STRONGER[f]
\ No newline at end of file
+Form.weaker = _closureTable(Form, _F_WEAKER).__getitem__
+Form.stronger = _closureTable(Form, _F_STRONGER).__getitem__
\ No newline at end of file
@@ -0,0 +1,635 @@
+from __future__ import print_function, unicode_literals
+
+import os, sys, time, mmap, struct, bisect
+
+import zlib
+try:
+    import cPickle as pickle
+except:
+    import pickle
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+from rmBitmasks import Form, Reduction
+
+from version_guard import isString
+
+version, versionPoint = sys.version_info[0:2]
+if version >= 3 and versionPoint >= 3:
+    timekeeper = time.perf_counter
+else:
+    timekeeper = time.clock
+
+##################################################################################
+#
+#   Binary database layout (all integers little-endian):
+#
+#   - header: magic, format version, number of sections;
+#   - section table: name, codec, offset, stored length and decoded length of each
+#     section;
+#   - sections, each starting on an 8-byte boundary.
+#
+#   Each section is compressed independently, and only decoded when first needed.
+#   The principle names are stored in sorted order, and each relation table as a
+#   packed n-by-n matrix in row-major order, so an uncompressed section answers
+#   individual lookups straight from the memory map.
+#
+#   The justifications form a DAG over the justified facts, which are identified by
+#   their positions in the sorted list of their keys ('justifyKeys'). Each
+#   justification is a run of 32-bit words in 'justify', starting at the word given
+#   in 'justifyOffsets': either a single word naming a citation, or the number of
+#   premises followed by the position of each premise. Citations are stored once
+#   each, in 'citations', starting at the bytes given in 'citationOffsets'. The
+#   complexity of each justification is stored alongside ('complexity'), or 0 if
+#   it was not known when the database was written.
+#
+##################################################################################
+
+_MAGIC = b'RMZOO\x00db'
+FormatVersion = 4
+
+_header = struct.Struct(str('<8sHH'))
+_sectionEntry = struct.Struct(str('<16sB7xQQQ'))
+
+class FormatError(Exception):
+    def __init__(self, databaseName, formatVersion):
+        super(FormatError, self).__init__(u'"{0}" uses binary database format v{1}, but this version reads v{2}'.format(databaseName, formatVersion, FormatVersion))
+
+def _compressFast(data):
+    return zlib.compress(data, 1)
+
+# Codecs, in the order of their identifiers: (name, compress, decompress)
+_codecs = [(u'none', None, None),
+           (u'zlib', zlib.compress, zlib.decompress),
+           (u'zlib-fast', _compressFast, zlib.decompress)]
+if lzma is not None:
+    _codecs.append((u'lzma', lzma.compress, lzma.decompress))
+codecNames = [name for name,compress,decompress in _codecs]
+_codecIndex = dict((name, i) for i,name in enumerate(codecNames))
+
+sectionNames = ('version', 'principles', 'implies', 'notImplies', 'conservative', 'nonConservative',
+                'form', 'primary', 'justifyKeys', 'justifyOffsets', 'justify', 'citationOffsets', 'citations',
+                'complexity', 'results')
+
+# Sections that are only read whole are compressed by default; the others are left
+#  uncompressed, so that they can be read in place.
+defaultCodecs = {'primary': u'zlib',
+                 'results': u'zlib'}
+
+_relationSections = (('implies', 'implication', 0, str('<B'), Reduction.none),
+                     ('notImplies', 'implication', 1, str('<B'), Reduction.none),
+                     ('conservative', 'conservation', 0, str('<H'), Form.none),
+                     ('nonConservative', 'conservation', 1, str('<H'), Form.none))
+
+# Facts are keyed by a single integer:
+#     (index of a) << 39 | (index of b, or form) << 15 | (context) << 3 | (operator)
+_opCores = (u'<->', u'->', u'-|>', u'c', u'nc', u'form')
+_opCode = dict((opCore, i) for i,opCore in enumerate(_opCores))
+_FORM_OP = _opCode[u'form']
+
+_reductions = dict((r.value, r) for r in Reduction)
+_forms = dict((f.value, f) for f in Form)
+
+_key = struct.Struct(str('<Q'))
+_word = struct.Struct(str('<I'))
+
+# In a justification, a word with this bit set names a citation (in place of the
+#  number of premises), or a form premise (in place of the position of a premise):
+#     (index of a) << 11 | (form)
+_MARKED = 0x80000000
+
+def factKey(fact, index):
+    a,op,b = fact
+    if op == u'form':
+        return (index[a] << 39) | (int(b) << 15) | _FORM_OP
+    else:
+        opCtx,opCore = op
+        return (index[a] << 39) | (index[b] << 15) | (int(opCtx) << 3) | _opCode[opCore]
+
+def _keyFact(key, names):
+    opCode = key & 0x7
+    ctx = (key >> 3) & 0xFFF
+    b = (key >> 15) & 0xFFFFFF
+    a = names[key >> 39]
+    if opCode == _FORM_OP:
+        return (a, u'form', _forms[b])
+    
+    opCore = _opCores[opCode]
+    if opCore in (u'c', u'nc'):
+        return (a, (_forms[ctx], opCore), names[b])
+    else:
+        return (a, (_reductions[ctx], opCore), names[b])
+
+class _PackedArray(object):
+    # Read-only sequence of fixed-size integers stored in a database section, for use
+    #  with bisect; the section is only decoded on first access
+    def __init__(self, database, section, itemStruct):
+        self._database = database
+        self._section = section
+        self._struct = itemStruct
+        self._count = database.sectionLength(section) // itemStruct.size
+        self._buf = None
+        
+        itemFormat = itemStruct.format
+        if not isString(itemFormat):
+            itemFormat = itemFormat.decode('ascii')
+        self._format = str('<{0}{1}').format(self._count, itemFormat[-1])
+    
+    def __len__(self):
+        return self._count
+    
+    def __getitem__(self, i):
+        if i < 0 or i >= self._count:
+            raise IndexError(i)
+        if self._buf is None:
+            self._buf, self._offset = self._database.section(self._section)
+        return self._struct.unpack_from(self._buf, self._offset + i * self._struct.size)[0]
+    
+    def unpack(self):
+        # All of the items, decoded at once
+        if self._buf is None:
+            self._buf, self._offset = self._database.section(self._section)
+        return struct.unpack_from(self._format, self._buf, self._offset)
+
+class SparseRelation(object):
+    # Relation indexed by pairs of principle names (or by principle names), keeping
+    #  only the related keys; reading an unrelated key returns the default without
+    #  storing it
+    def __init__(self, default, cells=()):
+        self._cells = {}
+        self._default = default
+        for key,relation in cells:
+            self[key] = relation
+    
+    def __getitem__(self, key):
+        return self._cells.get(key, self._default)
+    
+    def __setitem__(self, key, relation):
+        if relation != 0:
+            self._cells[key] = relation
+        else:
+            self._cells.pop(key, None)
+    
+    def __contains__(self, key):
+        return key in self._cells
+    
+    def __len__(self):
+        return len(self._cells)
+    
+    def get(self, key, default=None):
+        return self._cells.get(key, default)
+    
+    def items(self):
+        return self._cells.items()
+
+def _sparseRelation(relation, default):
+    # Databases written by earlier versions hold their relations in defaultdicts,
+    #  which gain an entry on every read
+    if isinstance(relation, SparseRelation):
+        return relation
+    return SparseRelation(default, relation.items())
+
+class RelationView(object):
+    # Relation table indexed by pairs of principle names, read from the database on
+    #  demand; pairs involving unknown principles are unrelated
+    def __init__(self, database, section, itemStruct, default):
+        self._cells = _PackedArray(database, section, itemStruct)
+        self._names = database.names
+        self._index = database.index
+        self._default = default
+    
+    def __getitem__(self, pair):
+        a,b = pair
+        try:
+            i = self._index[a] * len(self._names) + self._index[b]
+        except KeyError:
+            return self._default
+        return self._cells[i]
+    
+    def get(self, pair, default=None):
+        return self[pair]
+    
+    def items(self):
+        n = len(self._names)
+        for i in range(n * n):
+            relation = self._cells[i]
+            if relation != 0:
+                yield ((self._names[i // n], self._names[i % n]), relation)
+
+class FormView(object):
+    # Form of each principle, read from the database on demand
+    def __init__(self, database):
+        self._forms = _PackedArray(database, 'form', struct.Struct(str('<H')))
+        self._names = database.names
+        self._index = database.index
+    
+    def __getitem__(self, a):
+        try:
+            return self._forms[self._index[a]]
+        except KeyError:
+            return Form.none
+    
+    def __contains__(self, a):
+        return a in self._index
+    
+    def get(self, a, default=None):
+        if a in self._index:
+            return self[a]
+        return default
+    
+    def items(self):
+        for i,a in enumerate(self._names):
+            frm = self._forms[i]
+            if frm != Form.none:
+                yield (a, frm)
+
+class JustificationView(object):
+    # Justifications of known facts, decoded on demand; justifications added to the
+    #  view are kept in memory
+    def __init__(self, database):
+        self._keys = _PackedArray(database, 'justifyKeys', _key)
+        self._offsets = _PackedArray(database, 'justifyOffsets', _word)
+        self._words = _PackedArray(database, 'justify', _word)
+        self._citationOffsets = _PackedArray(database, 'citationOffsets', _word)
+        self._citationBuf = None
+        self._citations = {}
+        self._database = database
+        self._names = database.names
+        self._index = database.index
+        self._added = {}
+    
+    def _find(self, fact):
+        try:
+            key = factKey(fact, self._index)
+        except (KeyError, ValueError, TypeError):
+            return None
+        i = bisect.bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            return i
+        return None
+    
+    def _citation(self, c):
+        try:
+            return self._citations[c]
+        except KeyError:
+            pass
+        
+        if self._citationBuf is None:
+            self._citationBuf, self._citationOffset = self._database.section('citations')
+        start = self._citationOffset + self._citationOffsets[c]
+        end = self._citationOffset + self._citationOffsets[c + 1]
+        self._citations[c] = bytes(self._citationBuf[start:end]).decode('utf-8')
+        return self._citations[c]
+    
+    def _premise(self, word):
+        if word & _MARKED:
+            word &= ~_MARKED
+            return (self._names[word >> 11], u'form', _forms[word & 0x7FF])
+        return _keyFact(self._keys[word], self._names)
+    
+    def _read(self, i):
+        offset = self._offsets[i]
+        head = self._words[offset]
+        if head & _MARKED:
+            return self._citation(head & ~_MARKED)
+        else:
+            return tuple(self._premise(self._words[offset + 1 + j]) for j in range(head))
+    
+    def __getitem__(self, fact):
+        try:
+            return self._added[fact]
+        except KeyError:
+            pass
+        i = self._find(fact)
+        if i is None:
+            raise KeyError(fact)
+        return self._read(i)
+    
+    def __setitem__(self, fact, jst):
+        self._added[fact] = jst
+    
+    def __contains__(self, fact):
+        return fact in self._added or self._find(fact) is not None
+    
+    def __len__(self):
+        return len(self._keys) + sum(1 for fact in self._added if self._find(fact) is None)
+    
+    def get(self, fact, default=None):
+        try:
+            return self[fact]
+        except KeyError:
+            return default
+    
+    def items(self):
+        # Decode everything at once; premises are shared with the facts they name
+        offsets = self._offsets.unpack()
+        words = self._words.unpack()
+        facts = self._database.facts()
+        for i,fact in enumerate(facts):
+            if fact in self._added: continue
+            
+            offset = offsets[i]
+            head = words[offset]
+            if head & _MARKED:
+                yield (fact, self._citation(head & ~_MARKED))
+            else:
+                yield (fact, tuple((self._premise(word) if word & _MARKED else facts[word])
+                                   for word in words[offset + 1:offset + 1 + head]))
+        for item in self._added.items():
+            yield item
+    
+    def __iter__(self):
+        for fact,jst in self.items():
+            yield fact
+
+class ComplexityView(object):
+    # Complexities of the justifications of known facts
+    def __init__(self, database):
+        self._database = database
+        self._complexity = _PackedArray(database, 'complexity', _word)
+    
+    def items(self):
+        for fact,cplx in zip(self._database.facts(), self._complexity.unpack()):
+            if cplx != 0:
+                yield (fact, cplx)
+
+class BinaryDatabase(object):
+    # Memory-mapped binary database; each section is only decoded when first needed
+    def __init__(self, databaseName):
+        with open(databaseName, mode='rb') as databaseFile:
+            self._buf = mmap.mmap(databaseFile.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        magic, formatVersion, nSections = _header.unpack_from(self._buf, 0)
+        if magic != _MAGIC:
+            raise ValueError(u'"{0}" is not a binary RM Zoo database.'.format(databaseName))
+        if formatVersion != FormatVersion:
+            raise FormatError(databaseName, formatVersion)
+        
+        self._sections = {}
+        for i in range(nSections):
+            name, codec, offset, length, rawLength = _sectionEntry.unpack_from(self._buf, _header.size + i * _sectionEntry.size)
+            self._sections[name.rstrip(b'\x00').decode('ascii')] = (codec, offset, length, rawLength)
+        self._decoded = {}
+        
+        self.names = self._bytes('principles').decode('utf-8').split(u'\n')
+        self.index = dict((p, i) for i,p in enumerate(self.names))
+        self._parts = {}
+        self._facts = None
+    
+    def codec(self, name):
+        return codecNames[self._sections[name][0]]
+    
+    def sectionLength(self, name):
+        return self._sections[name][3]
+    
+    def section(self, name):
+        # The buffer holding the decoded section, and the offset at which it starts
+        try:
+            return self._decoded[name]
+        except KeyError:
+            pass
+        
+        codec, offset, length, rawLength = self._sections[name]
+        if codec == 0:
+            self._decoded[name] = (self._buf, offset)
+        else:
+            decompress = _codecs[codec][2]
+            self._decoded[name] = (decompress(self._buf[offset:offset + length]), 0)
+        return self._decoded[name]
+    
+    def facts(self):
+        # All justified facts, in the order of their keys
+        if self._facts is None:
+            keys = _PackedArray(self, 'justifyKeys', _key).unpack()
+            self._facts = [_keyFact(key, self.names) for key in keys]
+        return self._facts
+    
+    def _bytes(self, name):
+        buf, offset = self.section(name)
+        return bytes(buf[offset:offset + self.sectionLength(name)])
+    
+    def _load(self, key):
+        if key == 'version':
+            return self._bytes('version').decode('ascii')
+        elif key == 'principles':
+            return set(self.names)
+        elif key == 'implication':
+            return (RelationView(self, 'implies', struct.Struct(str('<B')), Reduction.none),
+                    RelationView(self, 'notImplies', struct.Struct(str('<B')), Reduction.none))
+        elif key == 'conservation':
+            return (RelationView(self, 'conservative', struct.Struct(str('<H')), Form.none),
+                    RelationView(self, 'nonConservative', struct.Struct(str('<H')), Form.none))
+        elif key == 'form':
+            return FormView(self)
+        elif key in ('primary', 'results'):
+            return pickle.loads(self._bytes(key))
+        elif key == 'justify':
+            return JustificationView(self)
+        elif key == 'complexity':
+            return ComplexityView(self)
+        else:
+            raise KeyError(key)
+    
+    def __getitem__(self, key):
+        try:
+            return self._parts[key]
+        except KeyError:
+            self._parts[key] = self._load(key)
+            return self._parts[key]
+    
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+def isBinaryDatabase(databaseName):
+    with open(databaseName, mode='rb') as databaseFile:
+        return databaseFile.read(len(_MAGIC)) == _MAGIC
+
+def readDatabase(databaseName):
+    if isBinaryDatabase(databaseName):
+        return BinaryDatabase(databaseName)
+    
+    with open(databaseName, mode='rb') as databaseFile:
+        compressedDatabase = databaseFile.read()
+        pickledDatabase = zlib.decompress(compressedDatabase)
+        database = pickle.loads(pickledDatabase)
+    
+    database['implication'] = tuple(_sparseRelation(relation, Reduction.none) for relation in database['implication'])
+    database['conservation'] = tuple(_sparseRelation(relation, Form.none) for relation in database['conservation'])
+    database['form'] = _sparseRelation(database['form'], Form.none)
+    return database
+
+def _packArray(values, itemStruct):
+    packed = bytearray(len(values) * itemStruct.size)
+    for i,value in enumerate(values):
+        if value != 0:
+            itemStruct.pack_into(packed, i * itemStruct.size, value)
+    return bytes(packed)
+
+def _packWords(words):
+    return struct.pack(str('<{0}I').format(len(words)), *words)
+
+def _packJustify(justify, complexity, index):
+    keys = sorted((factKey(fact, index), fact) for fact in justify)
+    position = dict((fact, i) for i,(key,fact) in enumerate(keys))
+    
+    citation = {}
+    citations = []
+    words = []
+    offsets = []
+    for key,fact in keys:
+        offsets.append(len(words))
+        jst = justify[fact]
+        if isString(jst):
+            try:
+                c = citation[jst]
+            except KeyError:
+                c = len(citations)
+                citation[jst] = c
+                citations.append(jst.encode('utf-8'))
+            words.append(_MARKED | c)
+        else:
+            words.append(len(jst))
+            for f in jst:
+                if f[1] == u'form':
+                    words.append(_MARKED | (index[f[0]] << 11) | int(f[2]))
+                else:
+                    try:
+                        words.append(position[f])
+                    except KeyError:
+                        raise ValueError(u'The premise "{0}" of "{1}" is not justified.'.format(f, fact))
+    
+    if complexity is None:
+        complexity = {}
+    else:
+        complexity = dict(complexity.items())
+    complexities = [complexity.get(fact, 0) for key,fact in keys]
+    
+    citationOffsets = [0]
+    for data in citations:
+        citationOffsets.append(citationOffsets[-1] + len(data))
+    
+    return {'justifyKeys': b''.join(_key.pack(key) for key,fact in keys),
+            'justifyOffsets': _packWords(offsets),
+            'justify': _packWords(words),
+            'citationOffsets': _packWords(citationOffsets),
+            'citations': b''.join(citations),
+            'complexity': _packWords(complexities)}
+
+def packDatabase(database):
+    # The uncompressed sections of the database, by name
+    names = sorted(database['principles'])
+    index = dict((p, i) for i,p in enumerate(names))
+    n = len(names)
+    
+    sections = {}
+    sections['version'] = database['version'].encode('ascii')
+    sections['principles'] = u'\n'.join(names).encode('utf-8')
+    for sectionName, key, i, itemFormat, default in _relationSections:
+        cells = [0] * (n * n)
+        for (a,b),relation in database[key][i].items():
+            if relation != 0:
+                cells[index[a] * n + index[b]] = relation
+        sections[sectionName] = _packArray(cells, struct.Struct(itemFormat))
+    sections['form'] = _packArray([database['form'].get(a, Form.none) for a in names], struct.Struct(str('<H')))
+    sections['primary'] = pickle.dumps(database['primary'], protocol=2)
+    
+    sections.update(_packJustify(database['justify'], database.get('complexity'), index))
+    sections['results'] = pickle.dumps(database.get('results'), protocol=2)
+    return sections
+
+def writeSections(sections, databaseName, codecs=None):
+    # Write packed sections, compressing each with its chosen codec
+    parts = [None]
+    offset = _header.size + len(sectionNames) * _sectionEntry.size
+    table = []
+    for name in sectionNames:
+        data = sections[name]
+        rawLength = len(data)
+        
+        codec = defaultCodecs.get(name, u'none')
+        if codecs is not None:
+            codec = codecs.get(name, codec)
+        compress = _codecs[_codecIndex[codec]][1]
+        if compress is not None:
+            data = compress(data)
+        
+        padding = -offset % 8
+        parts.append(b'\x00' * padding)
+        offset += padding
+        
+        table.append(_sectionEntry.pack(name.encode('ascii'), _codecIndex[codec], offset, len(data), rawLength))
+        parts.append(data)
+        offset += len(data)
+    parts[0] = _header.pack(_MAGIC, FormatVersion, len(sectionNames)) + b''.join(table)
+    _replace(databaseName, b''.join(parts))
+
+def _replace(databaseName, data):
+    # Replace the database atomically, since readers may have it memory-mapped
+    temporaryName = databaseName + os.extsep + 'tmp'
+    with open(temporaryName, mode='wb') as databaseFile:
+        databaseFile.write(data)
+    getattr(os, 'replace', os.rename)(temporaryName, databaseName)
+
+def writeDatabase(database, databaseName, binary=True, codecs=None):
+    if binary:
+        writeSections(packDatabase(database), databaseName, codecs)
+    else:
+        _replace(databaseName, zlib.compress(pickle.dumps(database, protocol=2)))
+
+def benchmarkCodecs(databaseName, repeats=5):
+    # Report the size of each section, and the time taken to decode it, under each codec
+    print(u'Packing "{0}"...'.format(databaseName))
+    sections = packDatabase(readDatabase(databaseName))
+    
+    benchmarkName = databaseName + os.extsep + 'benchmark'
+    try:
+        for codec in codecNames:
+            start = timekeeper()
+            writeSections(sections, benchmarkName, dict((name, codec) for name in sectionNames))
+            writeTime = timekeeper() - start
+            
+            openTimes = []
+            loadTimes = dict((name, []) for name in sectionNames)
+            for i in range(repeats):
+                start = timekeeper()
+                database = BinaryDatabase(benchmarkName)
+                openTimes.append(timekeeper() - start)
+                for name in sectionNames:
+                    start = timekeeper()
+                    database.section(name)
+                    loadTimes[name].append(timekeeper() - start)
+                del database
+            
+            print(u'\nCodec: {0} (written in {1:.6f} s, {2:,d} bytes)'.format(codec, writeTime, os.path.getsize(benchmarkName)))
+            print(u'\t{0:<16} {1:>12}'.format(u'(open)', u'{0:.6f} s'.format(min(openTimes))))
+            for name in sectionNames:
+                print(u'\t{0:<16} {1:>12} {2:>14,d} bytes'.format(name, u'{0:.6f} s'.format(min(loadTimes[name])), len(sections[name])))
+    finally:
+        if os.path.exists(benchmarkName):
+            os.remove(benchmarkName)
+
+if __name__ == '__main__':
+    from optparse import OptionParser
+    parser = OptionParser(u'Usage: %prog [options] [database_title]')
+    parser.add_option('-n', dest='repeats', type='int', default=5,
+        help = u'Time each load N times, reporting the fastest. (Default: 5)', metavar='N')
+    (options, args) = parser.parse_args()
+    if len(args) > 1:
+        parser.error(u'Too many arguments.')
+    if len(args) > 0:
+        databaseTitle = args[0]
+    else:
+        databaseTitle = 'database'
+    
+    if os.path.splitext(databaseTitle)[1] == '':
+        databaseName = databaseTitle + os.extsep + 'dat'
+    else:
+        databaseName = databaseTitle
+    
+    benchmarkCodecs(databaseName, options.repeats)
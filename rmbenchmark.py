@@ -0,0 +1,352 @@
+#! /usr/bin/env python
+
+##################################################################################
+#
+#   The Reverse Mathematics Zoo Benchmarks
+#   Builds databases from synthetic results files of increasing size, timing the
+#   parser and the inference rules of rmupdater.
+#   Documentation and support: http://rmzoo.uconn.edu
+#
+##################################################################################
+
+from __future__ import print_function
+
+import sys, os, json, random, subprocess
+
+from io import open
+from collections import OrderedDict
+
+import rmupdater
+from rmupdater import eprint, timekeeper
+from rmBitmasks import *
+from renderJustification import printOp
+
+Version = u'5.1'
+
+##################################################################################
+#
+#   SYNTHETIC RESULTS
+#
+##################################################################################
+
+# The synthetic zoo is a model of its own facts: each principle proves a set of
+#  atomic sentences, each atom has a syntactic form, and
+#     a X-> b    iff the atoms of b are atoms of a (in every reduction X),
+#     a Fc b     iff the atoms of a that are F-sentences are atoms of b,
+#     a form F   iff all atoms of a are F-sentences,
+#  with conjunctions proving the union of their conjuncts' atoms. Every generated fact
+#  holds in the model, so the results never contradict each other.
+
+_forms = [f for f in Form if f != Form.none]
+_reductions = [x for x in Reduction if x != Reduction.none]
+
+def _sentenceForms(atomForms, atoms):
+    # The forms F such that every atom in atoms is an F-sentence
+    forms = sum(_forms)
+    for t in range(len(atomForms)):
+        if atoms & (1 << t):
+            forms &= Form.weaker(atomForms[t])
+    return forms
+
+def _fSentences(atomForms, atoms, frm):
+    # The atoms in atoms that are F-sentences, for F = frm
+    return sum(1 << t for t in range(len(atomForms)) if atoms & (1 << t) and Form.isPresent(frm, Form.weaker(atomForms[t])))
+
+def syntheticResults(n, conjunctions=0.2, forms=0.3, implications=2.0, nonImplications=0.5, conservation=0.2, seed=0):
+    # A results file with n principles (and n*conjunctions conjunctions of them), with
+    #  forms declared for a fraction of them, about n*implications implications, and
+    #  non-implications and conservation facts in the given ratios to the implications
+    rng = random.Random(seed)
+    
+    # Each principle proves some of the earlier principles, and (usually) something new
+    atomForms = []
+    atoms = []
+    for i in range(n):
+        a = 0
+        for j in rng.sample(range(i), min(i, rng.randint(0, 2))):
+            a |= atoms[j]
+        if a == 0 or rng.random() < 0.8:
+            a |= 1 << len(atomForms)
+            atomForms.append(rng.choice(_forms))
+        atoms.append(a)
+    names = [u'P{0}'.format(i) for i in range(n)]
+    
+    for k in range(int(n * conjunctions)):
+        i, j = rng.sample(range(n), 2)
+        name = u'+'.join(sorted([names[i], names[j]]))
+        if name not in names:
+            names.append(name)
+            atoms.append(atoms[i] | atoms[j])
+    m = len(names)
+    
+    def fact(a, op, b):
+        return u'{0} {1} {2} "synthetic"'.format(names[a], printOp(op), names[b])
+    def reduction():
+        # Mostly implications over RCA, with some in the other reductions
+        if rng.random() < 0.7:
+            return Reduction.RCA
+        return rng.choice(_reductions)
+    
+    lines = []
+    for a in range(n):
+        if rng.random() < forms:
+            frms = Form.list(_sentenceForms(atomForms, atoms[a]))
+            if len(frms) > 0:
+                lines.append(u'{0} form {1}'.format(names[a], rng.choice(frms).name))
+    
+    pairs = [(a,b) for a in range(m) for b in range(m) if a != b]
+    implied = [(a,b) for a,b in pairs if atoms[b] & ~atoms[a] == 0]
+    notImplied = [(a,b) for a,b in pairs if atoms[b] & ~atoms[a] != 0]
+    nImplications = min(len(implied), int(n * implications))
+    for a,b in rng.sample(implied, nImplications):
+        lines.append(fact(a, (reduction(), u'->'), b))
+    for a,b in rng.sample(notImplied, min(len(notImplied), int(nImplications * nonImplications))):
+        lines.append(fact(a, (reduction(), u'-|>'), b))
+    
+    nConservation = int(nImplications * conservation)
+    for k in range(nConservation):
+        a,b = rng.choice(notImplied)
+        frm = rng.choice(_forms)
+        if _fSentences(atomForms, atoms[a], frm) & ~atoms[b] == 0:
+            lines.append(fact(a, (frm, u'c'), b))
+        else:
+            lines.append(fact(a, (frm, u'nc'), b))
+    
+    rng.shuffle(lines)
+    return u''.join(line + u'\n' for line in lines)
+
+##################################################################################
+#
+#   BENCHMARKS
+#
+##################################################################################
+
+def ruleSummary(records):
+    # Total the records of rmupdater.ruleStats by inference rule
+    rules = OrderedDict()
+    for record in records:
+        stats = rules.setdefault(record['rule'], OrderedDict([('calls', 0), ('time', 0.0)] + [(name, 0) for name in rmupdater.counterNames]))
+        stats['calls'] += 1
+        stats['time'] += record['time']
+        for name in rmupdater.counterNames:
+            stats[name] += record[name]
+    return rules
+
+def peakMemory():
+    # Peak resident memory of this process, in KiB, if known
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin': # Reported in bytes
+        peak //= 1024
+    return peak
+
+def runBenchmark(n, resultsString):
+    # Build a database from resultsString, from scratch
+    rmupdater.resetDatabase()
+    rmupdater.ruleStats = []
+    
+    start = timekeeper()
+    rmupdater.parseResults(resultsString, quiet=True)
+    parseTime = timekeeper() - start
+    
+    start = timekeeper()
+    rmupdater.deriveInferences(quiet=True)
+    deriveTime = timekeeper() - start
+    
+    facts = OrderedDict((opCore, 0) for opCore in (u'<->', u'->', u'-|>', u'c', u'nc'))
+    for a,op,b in rmupdater.justify:
+        if op != u'form':
+            facts[op[1]] += 1
+    
+    return OrderedDict([('size', n),
+                        ('principles', len(rmupdater.principlesList)),
+                        ('parse', parseTime),
+                        ('derive', deriveTime),
+                        ('peakMemory', peakMemory()),
+                        ('facts', facts),
+                        ('rules', ruleSummary(rmupdater.ruleStats))])
+
+def benchmark(n, parameters, settings):
+    # Run each benchmark in a fresh interpreter, so that it starts from the same state and
+    #  its peak memory is its own (a forked process would start from the harness's)
+    command = [sys.executable, os.path.abspath(__file__), '--run', str(n),
+               '--conjunctions', repr(parameters['conjunctions']), '--forms', repr(parameters['forms']),
+               '--implications', repr(parameters['implications']), '--nonimplications', repr(parameters['nonImplications']),
+               '--conservation', repr(parameters['conservation']), '--seed', str(parameters['seed']),
+               '--closure', settings['closure'], '-j', str(settings['jobs'])]
+    if settings['condense']:
+        command.append('--condense')
+    
+    proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, errors = proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(u'The benchmark of size {0} failed with status {1}:\n{2}'.format(n, proc.returncode, errors.decode('utf-8', 'replace').strip()))
+    return json.loads(out.decode('utf-8'), object_pairs_hook=OrderedDict)
+
+def compareRuns(runs, baseline, tolerance, minimum):
+    # Report the runs that are slower, larger or different from the baseline; returns
+    #  whether there were any
+    regressed = False
+    baselineRuns = dict((run['size'], run) for run in baseline['runs'])
+    for run in runs:
+        old = baselineRuns.get(run['size'])
+        if old is None:
+            eprint(u'Size {0}: not in the baseline.'.format(run['size']))
+            continue
+        
+        problems = []
+        if run['facts'] != old['facts']:
+            problems.append(u'derived {0} facts, not {1}'.format(
+                                sum(run['facts'].values()), sum(old['facts'].values())))
+        for key in ('parse', 'derive'):
+            if run[key] > old[key] * (1 + tolerance) and run[key] - old[key] > minimum:
+                problems.append(u'{0} took {1:.3f} s, not {2:.3f} s'.format(key, run[key], old[key]))
+        if run['peakMemory'] and old['peakMemory'] and run['peakMemory'] > old['peakMemory'] * (1 + tolerance):
+            problems.append(u'peak memory {0:,d} KiB, not {1:,d} KiB'.format(run['peakMemory'], old['peakMemory']))
+        
+        if len(problems) > 0:
+            regressed = True
+            eprint(u'Size {0}: REGRESSION: {1}.'.format(run['size'], u'; '.join(problems)))
+        else:
+            eprint(u'Size {0}: ok (derive {1:.3f} s, baseline {2:.3f} s).'.format(run['size'], run['derive'], old['derive']))
+    return regressed
+
+def printRun(run, verbose=False):
+    memory = u'{0:,d} KiB'.format(run['peakMemory']) if run['peakMemory'] else u'unknown'
+    eprint(u'Size {0}: {1:,d} principles, {2:,d} facts; parse {3:.3f} s, derive {4:.3f} s, peak memory {5}'.format(
+                run['size'], run['principles'], sum(run['facts'].values()), run['parse'], run['derive'], memory))
+    if verbose:
+        for name, stats in run['rules'].items():
+            eprint(u'\t{0}: {1:.3f} s, {2:,d} facts added, {3:,d} improved ({4:,d} calls, {5:,d} combinations examined)'.format(
+                        name, stats['time'], stats['added'], stats['improved'], stats['calls'], stats['examined']))
+
+##################################################################################
+#
+#   GET OPTIONS
+#
+##################################################################################
+
+from optparse import OptionParser, SUPPRESS_HELP
+
+def main():
+    eprint(u'\nRM Zoo Benchmarks (v{0})\n'.format(Version))
+    
+    parser = OptionParser(u'Usage: %prog [options]', version=u'%prog {0}'.format(Version))
+    
+    parser.set_defaults(sizes=u'25,50,100,200', conjunctions=0.2, forms=0.3, implications=2.0, nonimplications=0.5, conservation=0.2, seed=0,
+                        closure=u'delta', condense=False, jobs=1, tolerance=0.25, minimum=0.05, verbose=False)
+    
+    parser.add_option('--sizes', dest='sizes', metavar='N,N,...',
+        help = u'Build synthetic zoos with each number of principles. (default: 25,50,100,200)')
+    parser.add_option('--conjunctions', dest='conjunctions', type='float', metavar='RATIO',
+        help = u'Add RATIO conjunctions per principle. (default: 0.2)')
+    parser.add_option('--forms', dest='forms', type='float', metavar='RATIO',
+        help = u'Declare the form of a RATIO of the principles. (default: 0.3)')
+    parser.add_option('--implications', dest='implications', type='float', metavar='RATIO',
+        help = u'Give RATIO implications per principle. (default: 2.0)')
+    parser.add_option('--nonimplications', dest='nonimplications', type='float', metavar='RATIO',
+        help = u'Give RATIO non-implications per implication. (default: 0.5)')
+    parser.add_option('--conservation', dest='conservation', type='float', metavar='RATIO',
+        help = u'Give RATIO conservation and non-conservation facts per implication. (default: 0.2)')
+    parser.add_option('--seed', dest='seed', type='int',
+        help = u'Seed the generator of synthetic results with SEED. (default: 0)')
+    parser.add_option('--generate', dest='generate', type='int', metavar='N',
+        help = u'Write the synthetic results file for N principles to standard output, and exit.')
+    parser.add_option('--run', dest='run', type='int', help=SUPPRESS_HELP) # A single benchmark, run by benchmark()
+    
+    parser.add_option('--closure', dest='closure', choices=sorted(rmupdater.closureAlgorithms), metavar='ALGORITHM',
+        help = u'Compute transitive closures with ALGORITHM, as in rmupdater. (default: delta)')
+    parser.add_option('--condense', action='store_true', dest='condense',
+        help = u'Condense equivalent principles while deriving facts, as in rmupdater.')
+    parser.add_option('-j', '--jobs', dest='jobs', type='int', metavar='N',
+        help = u'Derive facts with N processes, as in rmupdater. (default: 1)')
+    
+    parser.add_option('-o', dest='output', metavar='FILE',
+        help = u'Write the measurements to FILE, as JSON; use this to record a baseline.')
+    parser.add_option('--baseline', dest='baseline', metavar='FILE',
+        help = u'Compare the measurements with the baseline in FILE, and fail if any is worse.')
+    parser.add_option('--tolerance', dest='tolerance', type='float', metavar='RATIO',
+        help = u'Allow times and peak memory up to RATIO above the baseline. (default: 0.25)')
+    parser.add_option('--minimum', dest='minimum', type='float', metavar='SECONDS',
+        help = u'Ignore slowdowns of less than SECONDS. (default: 0.05)')
+    parser.add_option('-v', action='store_true', dest='verbose',
+        help = u'Report the time taken, combinations examined and facts added by each inference rule.')
+    
+    (options, args) = parser.parse_args()
+    if len(args) > 0:
+        parser.error(u'Too many arguments provided.')
+    try:
+        sizes = [int(n) for n in options.sizes.split(u',')]
+    except ValueError:
+        parser.error(u'Option --sizes requires a comma-separated list of numbers.')
+    if any(n < 2 for n in sizes):
+        parser.error(u'Option --sizes requires at least 2 principles.')
+    if options.jobs < 1:
+        parser.error(u'Option -j requires at least 1 process.')
+    if options.closure == u'numpy' and not rmupdater.importNumpy():
+        parser.error(u'Option --closure numpy requires the NumPy module.')
+    
+    parameters = OrderedDict([('conjunctions', options.conjunctions),
+                              ('forms', options.forms),
+                              ('implications', options.implications),
+                              ('nonImplications', options.nonimplications),
+                              ('conservation', options.conservation),
+                              ('seed', options.seed)])
+    # The updater's settings, which a baseline must share with the runs compared to it
+    settings = OrderedDict([('closure', options.closure),
+                            ('condense', options.condense),
+                            ('jobs', options.jobs)])
+    
+    if options.generate is not None:
+        sys.stdout.write(syntheticResults(options.generate, **parameters))
+        return
+    
+    rmupdater.closureAlgorithm = options.closure
+    rmupdater.condenseEquivalences = options.condense
+    rmupdater.derivationJobs = options.jobs
+    
+    if options.run is not None:
+        sys.stdout.write(json.dumps(runBenchmark(options.run, syntheticResults(options.run, **parameters))))
+        return
+    
+    baseline = None
+    if options.baseline:
+        with open(options.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline['parameters'] != parameters:
+            parser.error(u'The baseline was measured on different synthetic results.')
+        if 'settings' not in baseline:
+            eprint(u'Warning: the baseline does not record the settings of the updater.\n')
+        elif baseline['settings'] != settings:
+            different = [u'{0} {1} (not {2})'.format(key, json.dumps(baseline['settings'].get(key)), json.dumps(value))
+                         for key, value in settings.items() if baseline['settings'].get(key) != value]
+            parser.error(u'The baseline was measured with different settings: {0}.'.format(u', '.join(different)))
+    
+    runs = []
+    try:
+        for n in sizes:
+            run = benchmark(n, parameters, settings)
+            printRun(run, options.verbose)
+            runs.append(run)
+    except RuntimeError as e:
+        eprint(e)
+        sys.exit(1)
+    
+    if options.output:
+        measurements = OrderedDict([('version', Version),
+                                    ('parameters', parameters),
+                                    ('settings', settings),
+                                    ('runs', runs)])
+        with open(options.output, mode='w', encoding='utf-8') as f:
+            f.write(json.dumps(measurements, indent=2) + u'\n')
+    
+    if baseline is not None:
+        eprint(u'\nComparing with the baseline:')
+        if compareRuns(runs, baseline, options.tolerance, options.minimum):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
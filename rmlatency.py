@@ -0,0 +1,268 @@
+#! /usr/bin/env python
+
+##################################################################################
+#
+#   The Reverse Mathematics Zoo Latency Checks
+#   Builds databases from synthetic results files, and times fresh runs of rmzoo
+#   answering queries and drawing diagrams.
+#   Documentation and support: http://rmzoo.uconn.edu
+#
+##################################################################################
+
+from __future__ import print_function
+
+import sys, os, json, math, random, shutil, subprocess, tempfile
+
+from io import open
+from collections import OrderedDict
+
+from rmupdater import eprint, timekeeper
+from rmBitmasks import *
+from renderJustification import printOp
+from rmbenchmark import syntheticResults
+
+Version = u'5.1'
+
+scriptDirectory = os.path.dirname(os.path.abspath(__file__))
+
+_forms = [f for f in Form if f != Form.none]
+_reductions = [x for x in Reduction if x != Reduction.none]
+
+##################################################################################
+#
+#   RUNNING THE ZOO
+#
+##################################################################################
+
+def runTimed(args):
+    # Run a script in a fresh interpreter, discarding its output; returns the time
+    #  taken and its peak resident memory in KiB (if known)
+    command = [sys.executable, os.path.join(scriptDirectory, args[0])] + list(args[1:])
+    with open(os.devnull, mode='wb') as devnull, tempfile.TemporaryFile() as errors:
+        start = timekeeper()
+        proc = subprocess.Popen(command, stdin=devnull, stdout=devnull, stderr=errors)
+        peak = None
+        if hasattr(os, 'wait4'):
+            # Wait for this process alone, to learn its own peak memory
+            pid, status, usage = os.wait4(proc.pid, 0)
+            elapsed = timekeeper() - start
+            if os.WIFEXITED(status):
+                proc.returncode = os.WEXITSTATUS(status)
+            else:
+                proc.returncode = -os.WTERMSIG(status)
+            peak = usage.ru_maxrss
+            if sys.platform == 'darwin': # Reported in bytes
+                peak //= 1024
+        else:
+            proc.wait()
+            elapsed = timekeeper() - start
+        
+        if proc.returncode != 0:
+            errors.seek(0)
+            message = errors.read().decode('utf-8', 'replace').strip()
+            raise RuntimeError(u'"{0}" failed with status {1}:\n{2}'.format(u' '.join(args), proc.returncode, message))
+    return elapsed, peak
+
+def buildDatabase(directory, n, parameters):
+    # Build the database for the synthetic zoo with n principles; returns its name and
+    #  the names of its principles
+    resultsString = syntheticResults(n, **parameters)
+    resultsName = os.path.join(directory, u'results{0}.txt'.format(n))
+    with open(resultsName, mode='w', encoding='utf-8') as f:
+        f.write(resultsString)
+    
+    databaseName = os.path.join(directory, u'zoo{0}.dat'.format(n))
+    elapsed, peak = runTimed(['rmupdater.py', '-q', resultsName, databaseName])
+    eprint(u'Size {0}: built database in {1:.3f} s.'.format(n, elapsed))
+    
+    names = set()
+    for line in resultsString.splitlines():
+        names.add(line.split()[0])
+    return databaseName, sorted(names)
+
+def randomFact(rng, names):
+    # A fact about two random principles; most will be neither known nor contradicted
+    a, b = rng.sample(names, 2)
+    if rng.random() < 0.6:
+        op = (Reduction.RCA, u'->')
+    elif rng.random() < 0.5:
+        op = (rng.choice(_reductions), rng.choice([u'->', u'-|>']))
+    else:
+        op = (rng.choice(_forms), rng.choice([u'c', u'nc']))
+    return u'{0} {1} {2}'.format(a, printOp(op), b)
+
+# The runs of rmzoo to time, by name; the diagram options other than -w, -s, and -c -f
+#  need a diagram to draw
+caseNames = [u'-q', u'-F', u'-i -n', u'-w', u'-s', u'-c -f', u'-i -o', u'-i -t W', u'-i -r']
+
+def latencyCases(directory, names, queries, rng):
+    # The arguments for each case, with queries and restrictions drawn from names
+    queryName = os.path.join(directory, u'queries.txt')
+    with open(queryName, mode='w', encoding='utf-8') as f:
+        for k in range(queries):
+            f.write(randomFact(rng, names) + u'\n')
+    restriction = u' '.join(rng.sample(names, max(2, len(names) // 4)))
+    
+    return zip(caseNames, [['-q', randomFact(rng, names)],
+                           ['-F', queryName],
+                           ['-i', '-n'],
+                           ['-w'],
+                           ['-s'],
+                           ['-c', '-f'],
+                           ['-i', '-o'],
+                           ['-i', '-t', 'W'],
+                           ['-i', '-r', restriction]])
+
+def percentile(times, p):
+    # The p-th percentile of times, by the nearest-rank method
+    ordered = sorted(times)
+    rank = int(math.ceil(p / 100.0 * len(ordered)))
+    return ordered[max(rank, 1) - 1]
+
+def measureCase(databaseName, args, repeat):
+    # Time repeat fresh runs of rmzoo on the database
+    times = []
+    peaks = []
+    for k in range(repeat):
+        elapsed, peak = runTimed(['rmzoo.py'] + args + [databaseName])
+        times.append(elapsed)
+        if peak is not None:
+            peaks.append(peak)
+    return OrderedDict([('runs', repeat),
+                        ('p50', percentile(times, 50)),
+                        ('p90', percentile(times, 90)),
+                        ('p99', percentile(times, 99)),
+                        ('max', max(times)),
+                        ('peakMemory', max(peaks) if len(peaks) > 0 else None)])
+
+##################################################################################
+#
+#   BUDGETS
+#
+##################################################################################
+
+def checkBudgets(results, budgets, memoryBudget, p):
+    # Report the cases whose p-th percentile latency or peak memory exceeds its budget;
+    #  returns whether there were any
+    key = u'p{0:g}'.format(p)
+    exceeded = False
+    for n, cases in results.items():
+        for case, stats in cases.items():
+            budget = budgets.get(case, budgets.get(None))
+            if budget is not None and stats[key] > budget:
+                exceeded = True
+                eprint(u'Size {0}, {1}: OVER BUDGET: {2} latency {3:.3f} s, budget {4:.3f} s.'.format(n, case, key, stats[key], budget))
+            if memoryBudget is not None and stats['peakMemory'] is not None and stats['peakMemory'] > memoryBudget:
+                exceeded = True
+                eprint(u'Size {0}, {1}: OVER BUDGET: peak memory {2:,d} KiB, budget {3:,d} KiB.'.format(n, case, stats['peakMemory'], memoryBudget))
+    if not exceeded:
+        eprint(u'All cases within budget.')
+    return exceeded
+
+def printCase(n, case, stats):
+    memory = u'{0:,d} KiB'.format(stats['peakMemory']) if stats['peakMemory'] else u'unknown'
+    eprint(u'Size {0}, {1}: p50 {2:.3f} s, p90 {3:.3f} s, p99 {4:.3f} s, max {5:.3f} s; peak memory {6}'.format(
+                n, case, stats['p50'], stats['p90'], stats['p99'], stats['max'], memory))
+
+##################################################################################
+#
+#   GET OPTIONS
+#
+##################################################################################
+
+from optparse import OptionParser
+
+def main():
+    eprint(u'\nRM Zoo Latency Checks (v{0})\n'.format(Version))
+    
+    parser = OptionParser(u'Usage: %prog [options]', version=u'%prog {0}'.format(Version))
+    
+    parser.set_defaults(sizes=u'50,100,200', repeat=5, queries=100, seed=0, percentile=90.0, budgets=[], memory=None)
+    
+    parser.add_option('--sizes', dest='sizes', metavar='N,N,...',
+        help = u'Build synthetic zoos with each number of principles. (default: 50,100,200)')
+    parser.add_option('--repeat', dest='repeat', type='int', metavar='N',
+        help = u'Run each case N times. (default: 5)')
+    parser.add_option('--queries', dest='queries', type='int', metavar='N',
+        help = u'Query N facts with -F. (default: 100)')
+    parser.add_option('--seed', dest='seed', type='int',
+        help = u'Seed the generator of synthetic results and queries with SEED. (default: 0)')
+    parser.add_option('-d', dest='directory', metavar='DIR',
+        help = u'Keep the synthetic results and databases in DIR. (default: a temporary directory)')
+    
+    parser.add_option('--percentile', dest='percentile', type='float', metavar='P',
+        help = u'Compare the P-th percentile latency with the budgets; one of 50, 90, or 99. (default: 90)')
+    parser.add_option('--budget', action='append', dest='budgets', metavar='[CASE=]SECONDS',
+        help = u'Fail if the latency of CASE (or of any case) exceeds SECONDS; may be repeated.')
+    parser.add_option('--memory', dest='memory', type='int', metavar='KIB',
+        help = u'Fail if the peak memory of any run exceeds KIB kibibytes.')
+    parser.add_option('-o', dest='output', metavar='FILE',
+        help = u'Write the measurements to FILE, as JSON.')
+    
+    (options, args) = parser.parse_args()
+    if len(args) > 0:
+        parser.error(u'Too many arguments provided.')
+    try:
+        sizes = [int(n) for n in options.sizes.split(u',')]
+    except ValueError:
+        parser.error(u'Sizes must be a comma-separated list of integers.')
+    if min(sizes) < 2:
+        parser.error(u'Each size must be at least 2.')
+    if options.repeat < 1 or options.queries < 1:
+        parser.error(u'Options --repeat and --queries must be at least 1.')
+    if options.percentile not in (50, 90, 99):
+        parser.error(u'Option --percentile must be one of 50, 90, or 99.')
+    
+    budgets = {}
+    for budgetString in options.budgets:
+        if u'=' in budgetString:
+            case, seconds = budgetString.split(u'=', 1)
+            if case not in caseNames:
+                parser.error(u'Unknown case "{0}"; expected one of: {1}.'.format(case, u', '.join(caseNames)))
+        else:
+            case, seconds = None, budgetString
+        try:
+            budgets[case] = float(seconds)
+        except ValueError:
+            parser.error(u'Budgets must be given in seconds.')
+    
+    parameters = OrderedDict([('seed', options.seed)])
+    if options.directory:
+        directory = options.directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+    else:
+        directory = tempfile.mkdtemp(prefix='rmzoo')
+    
+    results = OrderedDict()
+    try:
+        for n in sizes:
+            databaseName, names = buildDatabase(directory, n, parameters)
+            rng = random.Random(options.seed)
+            results[n] = OrderedDict()
+            for case, caseArgs in latencyCases(directory, names, options.queries, rng):
+                results[n][case] = measureCase(databaseName, caseArgs, options.repeat)
+                printCase(n, case, results[n][case])
+            eprint(u'')
+    except RuntimeError as e:
+        eprint(e)
+        sys.exit(1)
+    finally:
+        if not options.directory:
+            shutil.rmtree(directory)
+    
+    if options.output:
+        measurements = OrderedDict([('version', Version),
+                                    ('parameters', parameters),
+                                    ('repeat', options.repeat),
+                                    ('queries', options.queries),
+                                    ('sizes', OrderedDict((str(n), cases) for n, cases in results.items()))])
+        with open(options.output, mode='w', encoding='utf-8') as f:
+            f.write(json.dumps(measurements, indent=2) + u'\n')
+    
+    if len(budgets) > 0 or options.memory is not None:
+        if checkBudgets(results, budgets, options.memory, options.percentile):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
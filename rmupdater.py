@@ -21,21 +21,32 @@
 
 from __future__ import print_function
 
-import itertools
+import heapq
+import os
+import re
 import sys
-import 
+import time
 
-from io import open
-from collections import defaultdict
-
-from version_guard import isString, lru_cache
-
-import zlib
 try:
     import cPickle as pickle
 except:
     import pickle
 
+from io import open
+from collections import defaultdict, deque, OrderedDict
+
+from version_guard import isString
+
+# NumPy is only imported for --closure numpy, since rmzoo imports this module to parse queries
+np = None
+def importNumpy():
+    global np
+    try:
+        import numpy as np
+    except ImportError:
+        return False
+    return True
+
 def eprint(*args, **kwargs):
     print(*args, file=sys.stderr, **kwargs)
 
@@ -51,54 +62,123 @@ else:
 
 from rmBitmasks import *
 from renderJustification import *
+from rmDatabase import readDatabase, writeDatabase, FormatError, SparseRelation, codecNames, sectionNames
 
 RCAprinciple = u'RCA'
 
-principlesList = [RCAprinciple]
-principles = set(principlesList)
+# The inference rules test relations against plain integers, since reading a member of
+#  an Enum class costs about as much as a function call
+_RCA = int(Reduction.RCA)
+_forms = [f for f in Form if f != Form.none]
+
+# Principles are interned as dense integer indices: the relation tables are lists of rows
+#  indexed by principle, and facts refer to principles by index. Names are restored only
+#  for printing and serialization.
+principleNames = []
+principleIndex = {}
+
+principles = set() # names
+principlesList = [] # indices, in the order the inference rules consider them
+
+equivalent = []
+implies = []
+notImplies = []
+
+conservative = []
+nonConservative = []
+
+form = []
+
+# Equivalence classes of principles under each reduction, as union-find forests rooted at
+#  the least principle of each class
+classParent = dict((x, []) for x in Reduction if x != Reduction.none)
+
+def findClass(x, a):
+    parent = classParent[x]
+    while parent[a] != a:
+        parent[a] = parent[parent[a]]
+        a = parent[a]
+    return a
+
+def unionClasses(x, a, b):
+    parent = classParent[x]
+    a = findClass(x, a)
+    b = findClass(x, b)
+    if a < b:
+        parent[b] = a
+    elif b < a:
+        parent[a] = b
+
+def internPrinciple(a):
+    try:
+        return principleIndex[a]
+    except KeyError:
+        pass
+    
+    i = len(principleNames)
+    principleNames.append(a)
+    principleIndex[a] = i
+    principles.add(a)
+    principlesList.append(i)
+    conjunction.clear()
+    
+    for array in (equivalent, implies, notImplies, conservative, nonConservative):
+        for row in array:
+            row.append(0)
+        array.append([0] * (i + 1))
+    form.append(0)
+    for parent in classParent.values():
+        parent.append(i)
+    return i
 
 def addPrinciple(a):
     setA = set(a.split(u'+'))
     a = u'+'.join(sorted(setA))
-    principles.add(a)
-    principles.update(setA)
+    for p in sorted(setA | set([a])):
+        internPrinciple(p)
     return a
 
+def namedFact(fact):
+    a,op,b = fact
+    if op == u'form':
+        return (principleNames[a], op, b)
+    else:
+        return (principleNames[a], op, principleNames[b])
+
+def indexedFact(fact):
+    a,op,b = fact
+    if op == u'form':
+        return (principleIndex[a], op, b)
+    else:
+        return (principleIndex[a], op, principleIndex[b])
+
 conjunction = {}
 def joinPrinciples(a, b):
     try:
         return conjunction[a,b]
     except KeyError:
-        p = u'+'.join(sorted(set(a.split(u'+')) | set(b.split(u'+'))))
-        if p not in principles:
-            p = None
+        p = u'+'.join(sorted(set(principleNames[a].split(u'+')) | set(principleNames[b].split(u'+'))))
+        p = principleIndex.get(p)
         conjunction[a,b] = p
         conjunction[b,a] = p
         return p
 
-equivalent = defaultdict(noReduction)
-implies = defaultdict(noReduction)
-notImplies = defaultdict(noReduction)
+internPrinciple(RCAprinciple)
 
 def addEquivalent(a,reduction,b):
-    equivalent[a,b] |= Reduction.weaker(reduction)
+    equivalent[a][b] |= Reduction.weaker(reduction)
 
 def addReduction(a,reduction,b):
-    implies[a,b] |= Reduction.weaker(reduction)
+    implies[a][b] |= Reduction.weaker(reduction)
 
 def addNonReduction(a,reduction,b):
-    notImplies[a,b] |= Reduction.stronger(reduction)
-
-conservative = defaultdict(noForm)
-nonConservative = defaultdict(noForm)
+    notImplies[a][b] |= Reduction.stronger(reduction)
 
 def addConservative(a,frm,b):
-    conservative[a,b] |= Form.stronger(frm)
+    conservative[a][b] |= Form.stronger(frm)
 
 def addNonConservative(a,frm,b):
-    nonConservative[a,b] |= Form.weaker(frm)
-
-form = defaultdict(noForm)
+    nonConservative[a][b] |= Form.weaker(frm)
 
 primary = set()
 primaryIndex = []
@@ -113,16 +193,32 @@ def addPrimary(a):
 justify = {}
 justComplexity = {}
 
+# Facts whose justifications have been updated since they were last taken, by operator
+recent = defaultdict(set)
+
 def updateJustification(fact, jst, cplx):
     try:
         if cplx >= justComplexity[fact]:
             return False
+        ruleCounters['improved'] += 1
     except KeyError:
-        pass
+        ruleCounters['added'] += 1
     justify[fact] = jst
     justComplexity[fact] = cplx
+    if _unsynced is not None:
+        _unsynced.add(fact)
+    
+    a,op,b = fact
+    recent[op[1]].add((a,b))
     return True
 
+def takeDelta(*opCores):
+    # Take the recently updated facts for each operator, for use in semi-naive evaluation
+    delta = {}
+    for opCore in opCores:
+        delta[opCore] = sorted(recent.pop(opCore, ()))
+    return delta
+
 def unoptimizedJustification(fact, jst, cplx):
     if fact in justify:
         return False
@@ -130,6 +226,10 @@ def unoptimizedJustification(fact, jst, cplx):
         justify[fact] = jst
         return True
 
+class VersionError(Exception):
+    def __init__(self, targetVersion, actualVersion):
+        super(VersionError, self).__init__(u'Version mismatch: found v{0}, targeting v{1}'.format(actualVersion, targetVersion))
+
 class UnjustifiedFactError(Exception):
     def __init__(self, a, op, b):
         super(UnjustifiedFactError, self).__init__(u'The fact "{0}" is not justified.'.format(printFact(a, op, b)))
@@ -137,11 +237,78 @@ class UnjustifiedFactError(Exception):
 def addUnjustified(a, op, b):
     raise UnjustifiedFactError(a, op, b)
 
+def namedJustifications(facts):
+    # The justifications of the given facts and all of their premises, by name
+    named = {}
+    toName = list(facts)
+    while toName:
+        fact = toName.pop()
+        if fact[1] == u'form': continue
+        
+        name = namedFact(fact)
+        if name in named: continue
+        
+        jst = justify[fact]
+        if isString(jst):
+            named[name] = jst
+        else:
+            named[name] = tuple(namedFact(f) for f in jst)
+            toName.extend(jst)
+    return named
+
 class ContradictionError(Exception):
     def __init__(self, fact1, fact2):
+        named = namedJustifications([fact1, fact2])
         super(ContradictionError, self).__init__(u'The following facts are contradictory:\n\n' +
-                                                 printJustification(fact1, justify) + u'\n\n' +
-                                                 printJustification(fact2, justify))
+                                                 printJustification(namedFact(fact1), named) + u'\n\n' +
+                                                 printJustification(namedFact(fact2), named))
+
+# Facts waiting to be propagated, with their best pending justifications
+pendingFacts = deque()
+pendingJustify = {}
+
+# Propagation statistics, for the verbose report
+factsProcessed = defaultdict(int) # by operator
+maxQueueDepth = 0
+
+# Work done by the inference rules, for their instrumentation: the combinations of
+#  principles examined, calls to addFact, and facts added or given better justifications
+ruleCounters = defaultdict(int)
+
+def queueFact(a, op, b, jst, cplx):
+    fact = (a, op, b)
+    try:
+        if cplx >= justComplexity[fact]:
+            return False
+    except KeyError:
+        pass
+    
+    try:
+        if cplx >= pendingJustify[fact][1]:
+            return False
+    except KeyError:
+        pendingFacts.append(fact)
+    pendingJustify[fact] = (jst, cplx)
+    return True
+
+def addFact(a, op, b, jst, cplx):
+    ruleCounters['addFact'] += 1
+    if not queueFact(a, op, b, jst, cplx):
+        return False
+    
+    global maxQueueDepth
+    try:
+        while pendingFacts:
+            maxQueueDepth = max(maxQueueDepth, len(pendingFacts))
+            
+            fact = pendingFacts.popleft()
+            jst, cplx = pendingJustify.pop(fact)
+            propagateFact(fact, jst, cplx)
+    except:
+        pendingFacts.clear()
+        pendingJustify.clear()
+        raise
+    return True
 
 # Noted side-effects:
 #     Changing '<->' can affect '->'
@@ -149,11 +316,12 @@ class ContradictionError(Exception):
 #     Changing 'c' can affect '->'
 #     Changing '-|>' can affect 'nc'
 #     Changing 'nc' can affect '-|>'
-def addFact(a, op, b, jst, cplx):
-    fact = (a, op, b)
+def propagateFact(fact, jst, cplx):
     if not updateJustification(fact, jst, cplx):
         return False
+    a,op,b = fact
     opCtx,opCore = op
+    factsProcessed[opCore] += 1
     
     ref = (fact,)
     refCplx = 1 + cplx
@@ -163,99 +331,119 @@ def addFact(a, op, b, jst, cplx):
         #     IF (a X<-> b), THEN (b X<-> a).
         updateJustification((b, op, a), jst, cplx)
         
+        addEquivalent(a, opCtx, b)
+        addEquivalent(b, opCtx, a)
         for x in Reduction.list(Reduction.weaker(opCtx)):
+            unionClasses(x, a, b)
             newOp = (x, u'<->')
             
-            addEquivalent(a, x, b)
             updateJustification((a, newOp, b), ref, refCplx)
             
             # Symmetry:
             #     IF (a X<-> b), THEN (b X<-> a).
-            addEquivalent(b, x, a)
             updateJustification((b, newOp, a), ref, refCplx)
         
         # Definition of equivalence:
         #     IF (a X<-> b), THEN (a X-> b) AND (b X-> a).
         impliesOp = (opCtx, u'->')
-        addFact(a, impliesOp, b, (fact,), refCplx)
-        addFact(b, impliesOp, a, (fact,), refCplx)
+        queueFact(a, impliesOp, b, ref, refCplx)
+        queueFact(b, impliesOp, a, ref, refCplx)
     elif opCore == u'->': # implication
-        for x in Reduction.list(Reduction.weaker(opCtx)):
-            addReduction(a, x, b)
+        weaker = Reduction.weaker(opCtx)
+        addReduction(a, opCtx, b)
+        
+        contradictions = weaker & notImplies[a][b]
+        if contradictions != 0:
+            x = Reduction.weakest(contradictions)
             updateJustification((a, (x, u'->'), b), ref, refCplx)
-            
-            if Reduction.isPresent(x, notImplies[a,b]):
-                raise ContradictionError((a, (x, u'->'), b), (a, (x, u'-|>'), b))
+            raise ContradictionError((a, (x, u'->'), b), (a, (x, u'-|>'), b))
         
-            if x == Reduction.RCA:
-                if x == opCtx:
-                    newRef = ref
-                    newRefCplx = refCplx
-                else:
-                    newRef = ((a, (x, u'->'), b),)
-                    newRefCplx = 1 + refCplx
-                
-                # Trivial conservation:
-                #     IF (a RCA-> b), THEN (b Fc a).
-                for f in Form:
-                    if f != Form.none:
-                        addFact(b, (f, u'c'), a, newRef, newRefCplx)
+        for x in Reduction.list(weaker):
+            updateJustification((a, (x, u'->'), b), ref, refCplx)
+        
+        if weaker & _RCA:
+            if opCtx == Reduction.RCA:
+                newRef = ref
+                newRefCplx = refCplx
+            else:
+                newRef = ((a, (Reduction.RCA, u'->'), b),)
+                newRefCplx = 1 + refCplx
+            
+            # Trivial conservation:
+            #     IF (a RCA-> b), THEN (b Fc a).
+            for f in _forms:
+                queueFact(b, (f, u'c'), a, newRef, newRefCplx)
         
         # Definition of conjunction (special case):
         #     IF (a X-> b), THEN (a X<-> a+b).
         ab = joinPrinciples(a,b)
         if ab is not None:
-            addFact(a, (opCtx, u'<->'), ab, ref, refCplx)
+            queueFact(a, (opCtx, u'<->'), ab, ref, refCplx)
     elif opCore == u'-|>': # non-implication
-        for x in Reduction.list(Reduction.stronger(opCtx)):
-            addNonReduction(a, x, b)
+        stronger = Reduction.stronger(opCtx)
+        addNonReduction(a, opCtx, b)
+        
+        contradictions = stronger & implies[a][b]
+        if contradictions != 0:
+            x = Reduction.weakest(contradictions)
             updateJustification((a, (x, u'-|>'), b), ref, refCplx)
-            
-            if Reduction.isPresent(x, implies[a,b]):
-                raise ContradictionError((a, (x, u'-|>'), b), (a, (x, u'->'), b))
+            raise ContradictionError((a, (x, u'-|>'), b), (a, (x, u'->'), b))
         
-            if x == Reduction.RCA:
-                if x == opCtx:
-                    newFact = fact
-                    newCplx = 1 + refCplx
-                else:
-                    newFact = (a, (x, u'-|>'), b)
-                    newCplx = 2 + refCplx
-                
-                # Definition of non-conservation (special case):
-                #     IF (a RCA-|> b) AND (b form F), THEN (b nFc a).
-                for f in Form.list(form[b]):
-                    addFact(b, (f, u'nc'), a, (newFact, (b, u'form', f)), newCplx)
+        for x in Reduction.list(stronger):
+            updateJustification((a, (x, u'-|>'), b), ref, refCplx)
+        
+        if stronger & _RCA:
+            if opCtx == Reduction.RCA:
+                newFact = fact
+                newCplx = 1 + refCplx
+            else:
+                newFact = (a, (Reduction.RCA, u'-|>'), b)
+                newCplx = 2 + refCplx
+            
+            # Definition of non-conservation (special case):
+            #     IF (a RCA-|> b) AND (b form F), THEN (b nFc a).
+            for f in Form.list(form[b]):
+                queueFact(b, (f, u'nc'), a, (newFact, (b, u'form', f)), newCplx)
     elif opCore == u'c': # conservation
-        for f in Form.list(Form.stronger(opCtx)):
+        stronger = Form.stronger(opCtx)
+        addConservative(a, opCtx, b)
+        
+        contradictions = stronger & nonConservative[a][b]
+        if contradictions != 0:
+            f = Form.strongest(contradictions)
+            updateJustification((a, (f, u'c'), b), ref, refCplx)
+            raise ContradictionError((a, (f, u'c'), b), (a, (f, u'nc'), b))
+        
+        for f in Form.list(stronger):
             newFact = (a, (f, u'c'), b)
             
-            addConservative(a, f, b)
             updateJustification(newFact, ref, refCplx)
             
-            if Form.isPresent(f, nonConservative[a,b]):
-                raise ContradictionError((a, (f, u'c'), b), (a, (f, u'nc'), b))
-            
             # Definition of conservation (special case):
             #     IF (a Fc b) AND (a form F), THEN (b RCA-> a).
-            if Form.isPresent(f, form[a]):
+            if form[a] & f:
                 if f == opCtx:
                     newCplx = 1 + refCplx
                 else:
                     newCplx = 2 + refCplx
                 
-                addFact(b, (Reduction.RCA, u'->'), a, (newFact, (a, u'form', f)), newCplx)
+                queueFact(b, (Reduction.RCA, u'->'), a, (newFact, (a, u'form', f)), newCplx)
     elif opCore == u'nc': # non-conservation
-        for f in Form.list(Form.weaker(opCtx)):
-            addNonConservative(a, f, b)
+        weaker = Form.weaker(opCtx)
+        addNonConservative(a, opCtx, b)
+        
+        contradictions = weaker & conservative[a][b]
+        if contradictions != 0:
+            f = Form.strongest(contradictions)
+            updateJustification((a, (f, u'nc'), b), ref, refCplx)
+            raise ContradictionError((a, (f, u'nc'), b), (a, (f, u'c'), b))
+        
+        for f in Form.list(weaker):
             updateJustification((a, (f, u'nc'), b), ref, refCplx)
-            
-            if Form.isPresent(f, conservative[a,b]):
-                raise ContradictionError((a, (f, u'nc'), b), (a, (f, u'c'), b))
         
         # Trivial conservation (contrapositive):
         #     IF (a nFc b), THEN (b RCA-|> a).
-        addFact(b, (Reduction.RCA, u'-|>'), a, ref, refCplx)
+        queueFact(b, (Reduction.RCA, u'-|>'), a, ref, refCplx)
     else:
         raise ValueError(u'Unrecognized operator: ' + opCore)
     
@@ -275,12 +463,20 @@ def standardizeFact(a, op, b):
             a,b = b,a
     return a, op, b
 
+def emptyResults():
+    return {'principles': set(), 'facts': [], 'forms': [], 'primary': []}
+
 from pyparsing import *
-def parseResults(resultsString, quiet=False):
-    start = timekeeper()
-    if not quiet: eprint(u'Parsing results...')
+def _readResultsGrammar(resultsString):
+    # Parse a results file with the full grammar
+    found = emptyResults()
+    
     # Name parsed strings
-    name = Word( alphas+"_+^{}\\$", alphanums+"_+^{}$\\").setParseAction(lambda s,l,t: addPrinciple(t[0]))
+    def _nameParseAction(s,l,t):
+        a = standardizePrinciple(t[0])
+        found['principles'].add(a)
+        return a
+    name = Word( alphas+"_+^{}\\$", alphanums+"_+^{}$\\").setParseAction(_nameParseAction)
     
     parenth = Literal('"')
     justification = QuotedString('"""',multiline=True) | quotedString.setParseAction(removeQuotes)
@@ -317,14 +513,15 @@ def parseResults(resultsString, quiet=False):
     # Results file lines
     unjustified = (name + Group(operator) + name + ~justification).setParseAction(lambda s,l,t: addUnjustified(*standardizeFact(t[0], tuple(t[1]), t[2])))
     
-    factsToAdd = []
+    # Repeated citations share a single string
+    citations = {}
     def _addFactParseAction(s,l,t):
         a,op,b = standardizeFact(t[0], tuple(t[1]), t[2])
-        factsToAdd.append(((a, op, b), t[3]))
+        found['facts'].append(((a, op, b), citations.setdefault(t[3], t[3])))
     fact = (name + Group(operator) + name + justification).setParseAction(_addFactParseAction)
-
-    formDef = (name + Literal("form") + formType).setParseAction(lambda s,l,t: addForm(t[0], t[2]))
-    primary = (name + Literal("is primary")).setParseAction(lambda s,l,t: addPrimary(t[0]))
+    
+    formDef = (name + Literal("form") + formType).setParseAction(lambda s,l,t: found['forms'].append((t[0], t[2])))
+    primary = (name + Literal("is primary")).setParseAction(lambda s,l,t: found['primary'].append(t[0]))
     
     comments = Suppress(Literal( "#" ) + SkipTo(LineEnd()))
     
@@ -333,17 +530,367 @@ def parseResults(resultsString, quiet=False):
     results = ZeroOrMore( entry ) + StringEnd()
     
     results.parseString(resultsString)
+    return found
+
+# The lines of a results file that can be read without the full grammar: blank lines,
+#  comments, primary and form declarations, and facts justified by a simple string.
+#  Anything else (escapes, unusual spacing, entries split over several lines) is left
+#  to the grammar.
+_resultsName = r'[A-Za-z_+^{}\\$][A-Za-z0-9_+^{}$\\]*'
+_resultsSpace = r'[ \t\r]'
+_reductionNames = u'|'.join(sorted([r.name for r in Reduction if r != Reduction.none] + [r for r in Reduction.alias if r != u''], key=len, reverse=True))
+_formNames = u'|'.join(f.name for f in Form if f != Form.none)
+_resultsLine = re.compile(u''.join([
+    u'{s}*(?:(?P<a>{name}){s}+(?:',
+        u'(?P<primary>is primary)',
+        u'|form{s}+(?P<form>{forms})',
+        u'|(?:(?P<prefix>{reductions})?(?P<op>->|-\\|>|<->)',
+            u'|(?P<arrow>=>|=/>|<=>|<=|</=)(?:_(?P<postfix>{reductions}))?',
+            u'|(?P<nc>n)?(?P<frm>{forms})c)',
+        u'{s}+(?P<b>{name}){s}+',
+        u'(?:"""(?P<long>(?:""(?!")|"(?!"")|[^"\\\\])*)"""|"(?P<short>(?:[^"\\n\\r\\\\]|\\\\[^x"\\n\\r\\\\])*)")',
+    u'){s}*)?(?:#[^\\n]*)?\\Z']).format(s=_resultsSpace, name=_resultsName, forms=_formNames, reductions=_reductionNames))
+
+_arrowOps = {u'=>': u'->', u'=/>': u'-|>', u'<=>': u'<->', u'<=': u'<=', u'</=': u'</='}
+
+def _extendResults(found, more):
+    found['principles'].update(more['principles'])
+    for key in ('facts', 'forms', 'primary'):
+        found[key].extend(more[key])
+
+def _readResultsFallback(resultsString, start, end):
+    # Parse the entries on the line [start, end) with the grammar, or all remaining entries
+    #  if one continues past the line; returns them and the end of the text parsed
+    try:
+        return _readResultsGrammar(resultsString[start:end]), end
+    except (ParseBaseException, UnjustifiedFactError):
+        return _readResultsGrammar(resultsString[start:]), len(resultsString)
+
+def _scanResults(resultsString, start, end, fallback=True):
+    # Read the entries on the lines starting in [start, end); returns them and the position
+    #  after the last line read, which lies past end if an entry continues. Without the
+    #  fallback, stops at the first line that needs the grammar.
+    found = emptyResults()
+    principles = found['principles']
+    facts = found['facts']
+    
+    pos = start
+    while pos < end:
+        lineEnd = resultsString.find(u'\n', pos)
+        if lineEnd < 0:
+            lineEnd = len(resultsString)
+        entryEnd = lineEnd
+        
+        m = _resultsLine.match(resultsString, pos, lineEnd)
+        if m is None:
+            # A long justification may continue onto later lines
+            quote = resultsString.find(u'"""', pos, lineEnd)
+            if quote >= 0:
+                close = resultsString.find(u'"""', quote + 3)
+                if close >= 0:
+                    entryEnd = resultsString.find(u'\n', close + 3)
+                    if entryEnd < 0:
+                        entryEnd = len(resultsString)
+                    m = _resultsLine.match(resultsString, pos, entryEnd)
+        
+        if m is None:
+            if not fallback:
+                return found, pos
+            
+            more, entryEnd = _readResultsFallback(resultsString, pos, lineEnd)
+            _extendResults(found, more)
+        elif m.group('a') is not None:
+            a = standardizePrinciple(m.group('a'))
+            principles.add(a)
+            if m.group('primary') is not None:
+                found['primary'].append(a)
+            elif m.group('form') is not None:
+                found['forms'].append((a, Form.fromString(m.group('form'))))
+            else:
+                if m.group('op') is not None:
+                    op = (Reduction.fromString(m.group('prefix') or u''), m.group('op'))
+                elif m.group('arrow') is not None:
+                    op = (Reduction.fromString(m.group('postfix') or u''), _arrowOps[m.group('arrow')])
+                else:
+                    op = (Form.fromString(m.group('frm')), u'nc' if m.group('nc') else u'c')
+                jst = m.group('long')
+                if jst is None:
+                    jst = m.group('short')
+                
+                b = standardizePrinciple(m.group('b'))
+                principles.add(b)
+                facts.append((standardizeFact(a, op, b), jst))
+        pos = entryEnd + 1
+    return found, pos
+
+# Results files larger than this are read in parallel, when running several jobs
+parallelResultsSize = 1 << 20
+
+# The results file being read, for the worker processes
+_scanning = None
+
+def _scanShard(bounds):
+    start, end = bounds
+    return _scanResults(_scanning, start, end, fallback=False)
+
+def readResults(resultsString):
+    # Parse a results file into its principles, facts, and form and primary declarations,
+    #  without changing the database
+    n = len(resultsString)
+    bounds = [(0, n)]
+    if derivationJobs > 1 and n >= parallelResultsSize:
+        # Split the file at line boundaries
+        starts = [0]
+        for i in range(1, derivationJobs):
+            starts.append(resultsString.find(u'\n', i * n // derivationJobs) + 1 or n)
+        starts.append(n)
+        bounds = [(starts[i], starts[i+1]) for i in range(derivationJobs) if starts[i] < starts[i+1]]
+    
+    global _scanning
+    pool = None
+    if len(bounds) > 1:
+        _scanning = resultsString
+        pool = _forkPool(len(bounds))
+    
+    if pool is None:
+        found, pos = _scanResults(resultsString, 0, n)
+    else:
+        try:
+            shards = pool.map(_scanShard, bounds)
+        finally:
+            pool.terminate()
+            _scanning = None
+        
+        # Each shard is valid if the previous one ended where it starts; otherwise, and
+        #  wherever a shard stopped early, read on from the end of the previous shard
+        found = emptyResults()
+        pos = 0
+        for (start, end), (more, stop) in zip(bounds, shards):
+            if pos == start:
+                _extendResults(found, more)
+                pos = stop
+            if pos < end:
+                more, pos = _scanResults(resultsString, pos, end)
+                _extendResults(found, more)
+    
+    # Repeated citations share a single string
+    citations = {}
+    found['facts'] = [(fact, citations.setdefault(jst, jst)) for fact, jst in found['facts']]
+    return found
+
+# Results already added to the database, or None if unknown
+knownResults = emptyResults()
+
+def resultsAdded(results):
+    # The parts of results not yet added to the database, or None if the database
+    #  depends on results that are no longer present
+    if knownResults is None:
+        return None
+    
+    if not knownResults['principles'] <= results['principles']:
+        return None
+    
+    knownFacts = set(knownResults['facts'])
+    if not knownFacts.issubset(results['facts']):
+        return None
+    
+    knownForms = set(knownResults['forms'])
+    if not knownForms.issubset(results['forms']):
+        return None
+    
+    # The order of primary declarations matters
+    nPrimary = len(knownResults['primary'])
+    if results['primary'][:nPrimary] != knownResults['primary']:
+        return None
+    
+    return {'principles': results['principles'] - knownResults['principles'],
+            'facts': [f for f in results['facts'] if f not in knownFacts],
+            'forms': [f for f in results['forms'] if f not in knownForms],
+            'primary': results['primary'][nPrimary:]}
+
+def introducePrinciples(newPrinciples):
+    # Re-examine known facts that interact with new conjunctions
+    newIndices = set(principleIndex[n] for n in newPrinciples)
+    for nName in sorted(newPrinciples):
+        splitN = set(nName.split(u'+'))
+        if len(splitN) == 1: continue
+        n = principleIndex[nName]
+        
+        # Allow (a X-> n) to be derived from implications of its conjuncts
+        conjuncts = [principleIndex[p] for p in sorted(splitN)]
+        for a in principlesList:
+            aRow = implies[a]
+            for p in conjuncts:
+                if aRow[p] != 0:
+                    recent[u'->'].add((a,p))
+        
+        # Definition of conjunction (special case):
+        #     IF (a X-> b), THEN (a X<-> a+b).
+        parts = [p for p in principlesList if p != n and set(principleNames[p].split(u'+')) <= splitN]
+        for a in parts:
+            for b in parts:
+                if b == a or joinPrinciples(a,b) != n: continue
+                
+                for x in Reduction.list(implies[a][b]):
+                    aImpB = (a, (x, u'->'), b)
+                    addFact(a, (x, u'<->'), n, (aImpB,), 1 + justComplexity[aImpB])
+        
+        # Allow known non-implications to split over n
+        for bc in principlesList:
+            if bc in newIndices or not splitN < set(principleNames[bc].split(u'+')): continue
+            
+            for a in principlesList:
+                if notImplies[a][bc] != 0:
+                    recent[u'-|>'].add((a,bc))
+
+def introduceForm(a, frm):
+    added = Form.weaker(frm) & ~form[a]
+    addForm(a, frm)
+    if added == 0: return
+    
+    for b in principlesList:
+        # Definition of conservation (special case):
+        #     IF (a Fc b) AND (a form F), THEN (b RCA-> a).
+        for f in Form.list(added & conservative[a][b]):
+            aConsB = (a, (f, u'c'), b)
+            addFact(b, (Reduction.RCA, u'->'), a, (aConsB, (a, u'form', f)), 2 + justComplexity[aConsB])
+        
+        # Definition of non-conservation (special case):
+        #     IF (b RCA-|> a) AND (a form F), THEN (a nFc b).
+        if notImplies[b][a] & _RCA:
+            bNotImpA = (b, (Reduction.RCA, u'-|>'), a)
+            for f in Form.list(added):
+                addFact(a, (f, u'nc'), b, (bNotImpA, (a, u'form', f)), 2 + justComplexity[bNotImpA])
+        
+        # Allow the inference rules to use the new form
+        if implies[b][a] != 0:
+            recent[u'->'].add((b,a))
+        if notImplies[b][a] != 0:
+            recent[u'-|>'].add((b,a))
+
+def addResults(results):
+    # Add parsed results to the database
+    newPrinciples = set()
+    for a in results['principles']:
+        newPrinciples.update(p for p in [a] + a.split(u'+') if p not in principles)
+    for p in sorted(newPrinciples):
+        internPrinciple(p)
+    if len(newPrinciples) > 0:
+        introducePrinciples(newPrinciples)
+    
+    for a, frm in results['forms']:
+        introduceForm(principleIndex[a], frm)
     
-    global principlesList
-    principlesList = sorted(principles)
+    for a in results['primary']:
+        addPrimary(a)
     
-    for (a, op, b), jst in factsToAdd:
+    for fact, jst in results['facts']:
+        a,op,b = indexedFact(fact)
         addFact(a, op, b, jst, 1)
     
+    if knownResults is not None:
+        knownResults['principles'].update(results['principles'])
+        for key in ('facts', 'forms', 'primary'):
+            knownResults[key].extend(results[key])
+
+def parseResults(resultsString, quiet=False):
+    start = timekeeper()
+    if not quiet: eprint(u'Parsing results...')
+    addResults(readResults(resultsString))
+    
+    if not quiet: eprint(u'Principles found: {0:,d}'.format(len(principlesList)))
+    if not quiet: eprint(u'Elapsed: {0:.6f} s\n'.format(timekeeper() - start))
+
+def updateResults(resultsString, quiet=False, verbose=False):
+    # Bring the database up to date with the results file, deriving inferences only from
+    #  the new results if possible
+    start = timekeeper()
+    if not quiet: eprint(u'Parsing results...')
+    results = readResults(resultsString)
+    
+    added = resultsAdded(results)
+    if added is None:
+        if not quiet: eprint(u'Previous results changed or removed; rebuilding from scratch.')
+        resetDatabase()
+        added = results
+    else:
+        # The database is already closed under the inference rules
+        recent.clear()
+        if not quiet: eprint(u'New results: {0:,d} facts, {1:,d} forms, {2:,d} primary principles'.format(len(added['facts']), len(added['forms']), len(added['primary'])))
+    addResults(added)
+    
     if not quiet: eprint(u'Principles found: {0:,d}'.format(len(principlesList)))
     if not quiet: eprint(u'Elapsed: {0:.6f} s\n'.format(timekeeper() - start))
+    
+    deriveInferences(quiet=quiet, verbose=verbose)
+
+# Each call of an inference rule can be recorded, with the time it took and the work it
+#  did; each rule can also be profiled separately.
+counterNames = ('examined', 'addFact', 'added', 'improved')
+
+# The records of rule calls, if recording
+ruleStats = None
+
+# A cProfile profile for each rule, if profiling
+ruleProfiles = None
+
+# The phase of deriveInferences, and its iteration
+rulePhase = (u'setup', 0)
+
+def inferenceRule(rule):
+    def recordedRule(*args):
+        if ruleStats is None and ruleProfiles is None:
+            return rule(*args)
+        
+        before = dict((name, ruleCounters[name]) for name in counterNames)
+        profile = None
+        if ruleProfiles is not None:
+            import cProfile
+            profile = ruleProfiles.setdefault(rule.__name__, cProfile.Profile())
+        
+        start = timekeeper()
+        if profile is not None: profile.enable()
+        try:
+            return rule(*args)
+        finally:
+            if profile is not None: profile.disable()
+            elapsed = timekeeper() - start
+            if ruleStats is not None:
+                record = OrderedDict([('phase', rulePhase[0]),
+                                      ('iteration', rulePhase[1]),
+                                      ('rule', rule.__name__),
+                                      ('relation', u' '.join(arg for arg in args if isString(arg))),
+                                      ('time', elapsed)])
+                for name in counterNames:
+                    record[name] = ruleCounters[name] - before[name]
+                ruleStats.append(record)
+    recordedRule.__name__ = rule.__name__
+    return recordedRule
+
+def writeRuleStats(statsName):
+    # Write the records of rule calls as CSV (if statsName ends in .csv) or JSON
+    if os.path.splitext(statsName)[1].lower() == '.csv':
+        import csv
+        fields = ['phase', 'iteration', 'rule', 'relation', 'time'] + list(counterNames)
+        with open(statsName, mode='w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(fields)
+            for record in ruleStats:
+                writer.writerow([record[field] for field in fields])
+    else:
+        import json
+        with open(statsName, mode='w', encoding='utf-8') as f:
+            f.write(json.dumps(ruleStats, indent=1) + u'\n')
+
+def writeRuleProfiles(profileDir):
+    # Write the profile of each rule to profileDir, for the pstats module
+    if not os.path.isdir(profileDir):
+        os.makedirs(profileDir)
+    for name, profile in ruleProfiles.items():
+        profile.dump_stats(os.path.join(profileDir, name + os.extsep + 'prof'))
 
 # General fact; uses nothing, affects '<->', '->', and 'c'
+@inferenceRule
 def addReflexivities():
     for a in principlesList:
         for x in Reduction:
@@ -362,25 +909,29 @@ def addReflexivities():
             addFact(a, (f, u'c'), a, u'reflexivity', 1)
 
 # General fact; uses nothing, affects '->'
+@inferenceRule
 def addRCABottom():
     # (a X-> RCA)
+    rca = principleIndex[RCAprinciple]
     for a in principlesList:
         for x in Reduction:
             if x == Reduction.none: continue
             
-            addFact(a, (x, u'->'), RCAprinciple, u'', 1)
+            addFact(a, (x, u'->'), rca, u'', 1)
 
 # General fact; uses nothing, affects '->'
+@inferenceRule
 def definitionOfConjunction():
     # IF (a == b+...), THEN (a X-> b).
     for a in principlesList:
-        splitA = set(a.split(u'+'))
+        splitA = set(principleNames[a].split(u'+'))
         if len(splitA) == 1: continue
         
+        ruleCounters['examined'] += len(principlesList)
         for b in principlesList:
             if b == a: continue
             
-            splitB = set(b.split(u'+'))
+            splitB = set(principleNames[b].split(u'+'))
             if splitB <= splitA:
                 for x in Reduction:
                     if x == Reduction.none: continue
@@ -388,16 +939,20 @@ def definitionOfConjunction():
                     addFact(a, (x, u'->'), b, u'', 1)
 
 # Uses '->', affects '<->'
-def definitionOfEquivalence():
+@inferenceRule
+def definitionOfEquivalence(delta):
     #a X<-> b
     #WHEN
     #    (a X-> b) AND (b X-> a)
     
+    pairs = sorted(set((min(a,b), max(a,b)) for a,b in delta[u'->'] if a != b))
+    ruleCounters['examined'] += len(pairs)
+    
     r = False
-    for a,b in itertools.combinations(principlesList, 2):
-        equiv = implies[a,b] & implies[b,a]
+    for a,b in pairs:
+        equiv = implies[a][b] & implies[b][a]
         
-        if equiv != Reduction.none:
+        if equiv != 0:
             for x in Reduction.list(equiv):
                 imp = (x, u'->')
                 aImpB = (a, imp, b)
@@ -407,338 +962,1179 @@ def definitionOfEquivalence():
                              (aImpB, bImpA), 1 + justComplexity[aImpB] + justComplexity[bImpA])
     return r
 
+def _addTransitive(a, c, b, transitive, opName, clsCtx):
+    r = False
+    for x in clsCtx.list(transitive):
+        op = (x, opName)
+        aOpC = (a, op, c)
+        cOpB = (c, op, b)
+        
+        r |= addFact(a, op, b,
+                     (aOpC, cOpB), 1 + justComplexity[aOpC] + justComplexity[cOpB])
+    return r
+
+# The rules that do independent work in each context first derive candidate facts from
+#  the current state, keeping only those that would improve a justification (and any
+#  earlier candidate for the same fact); then the candidates are added in order. Each
+#  candidate is (key, fact, premises), with keys ascending in the order of derivation.
+
+# Position of each context in its enumeration, for the keys of candidates
+contextRank = dict((clsCtx, dict((x, i) for i,x in enumerate(clsCtx))) for clsCtx in (Reduction, Form))
+
+def _complexity(premises):
+    # Form premises count as 1
+    cplx = 1
+    for p in premises:
+        if p[1] == u'form':
+            cplx += 1
+        else:
+            cplx += justComplexity[p]
+    return cplx
+
+# Complexity of the justification of an unknown fact
+unknownComplexity = float('inf')
+
+def addCandidates(candidates):
+    r = False
+    for key, (a, op, b), premises in candidates:
+        r |= addFact(a, op, b, premises, _complexity(premises))
+    return r
+
+# Number of processes deriving candidates (and reading large results files)
+derivationJobs = 1
+
+def _forkContext():
+    # The multiprocessing context that forks its processes, or None without fork
+    import multiprocessing
+    try:
+        return multiprocessing.get_context('fork')
+    except AttributeError: # Python 2 always forks
+        return multiprocessing
+    except ValueError: # No fork on this platform
+        return None
+
+def _forkPool(jobs):
+    context = _forkContext()
+    if context is None:
+        return None
+    return context.Pool(jobs)
+
+# The processes deriving candidates, forked once by deriveInferences and kept until it
+#  ends, each with its own copy of the state read by the candidate generators; with
+#  their connections.
+_workers = []
+
+# The facts whose complexities changed since the workers were last brought up to date
+#  (None without workers)
+_unsynced = None
+
+def _relationTable(opCore):
+    return {u'<->': equivalent, u'->': implies, u'-|>': notImplies, u'c': conservative, u'nc': nonConservative}[opCore]
+
+class _SharedTable(object):
+    # Stands for a relation table in the arguments sent to the workers, which have their
+    #  own copies
+    def __init__(self, opCore):
+        self.opCore = opCore
+
+def _sharedArg(arg):
+    for opCore in (u'<->', u'->', u'-|>', u'c', u'nc'):
+        if arg is _relationTable(opCore):
+            return _SharedTable(opCore)
+    return arg
+
+def _takeUpdates():
+    # The complexities and relations changed since the workers were last brought up to
+    #  date, and the current class representatives
+    complexities = [(fact, justComplexity[fact]) for fact in _unsynced]
+    cells = set((op[1], a, b) for a,op,b in _unsynced if op != u'form')
+    _unsynced.clear()
+    relations = [(opCore, a, b, _relationTable(opCore)[a][b]) for opCore,a,b in cells]
+    return complexities, relations, dict(classRepresents)
+
+def _deriveWorker(connection):
+    # Receive the updates to the state, the generator with its arguments, and this
+    #  worker's contexts; reply with the candidates (and combinations examined) in each
+    while True:
+        updates, generate, args = pickle.loads(connection.recv_bytes())
+        contexts = connection.recv()
+        
+        complexities, relations, represents = updates
+        justComplexity.update(complexities)
+        for opCore,a,b,relation in relations:
+            _relationTable(opCore)[a][b] = relation
+        classRepresents.update(represents)
+        args = tuple(_relationTable(arg.opCore) if isinstance(arg, _SharedTable) else arg for arg in args)
+        
+        try:
+            shards = []
+            for x in contexts:
+                ruleCounters.clear()
+                candidates = list(generate(*(args + (x,))))
+                shards.append((candidates, ruleCounters['examined']))
+            connection.send((shards, None))
+        except Exception as e:
+            connection.send((None, e))
+
+def _allContexts(clsCtx):
+    allContexts = clsCtx.none
+    for x in clsCtx:
+        allContexts |= x
+    return allContexts
+
+def startWorkers():
+    # Fork the workers for deriveCandidates, if using several jobs
+    global _unsynced
+    jobs = min(derivationJobs, max(len(clsCtx.list(_allContexts(clsCtx))) for clsCtx in (Reduction, Form)))
+    context = _forkContext() if jobs > 1 else None
+    if context is None:
+        return
+    
+    _unsynced = set()
+    for k in range(jobs):
+        connection, workerConnection = context.Pipe()
+        process = context.Process(target=_deriveWorker, args=(workerConnection,))
+        process.daemon = True
+        process.start()
+        workerConnection.close()
+        _workers.append((process, connection))
+
+def stopWorkers():
+    global _unsynced
+    for process, connection in _workers:
+        connection.close()
+        process.terminate()
+        process.join()
+    del _workers[:]
+    _unsynced = None
+
+def deriveCandidates(generate, clsCtx, *args):
+    # The candidates from generate(*args, contexts), in all contexts. With workers, each
+    #  derives in its share of the contexts, and the shards are merged by key, in the
+    #  same order as a serial derivation.
+    allContexts = _allContexts(clsCtx)
+    if len(_workers) == 0:
+        return list(generate(*(args + (allContexts,))))
+    
+    contexts = clsCtx.list(allContexts)
+    message = pickle.dumps((_takeUpdates(), generate, tuple(_sharedArg(arg) for arg in args)),
+                           pickle.HIGHEST_PROTOCOL)
+    for k, (process, connection) in enumerate(_workers):
+        connection.send_bytes(message)
+        connection.send(contexts[k::len(_workers)])
+    
+    shards = []
+    for process, connection in _workers:
+        workerShards, error = connection.recv()
+        if error is not None:
+            raise error
+        shards.extend(workerShards)
+    ruleCounters['examined'] += sum(examined for candidates, examined in shards)
+    return list(heapq.merge(*[candidates for candidates, examined in shards]))
+
+def _transitiveCandidates(array, opName, clsCtx, delta, contexts):
+    best = {} # the best candidate for each fact
+    represents = classRepresents[clsCtx]
+    rank = contextRank[clsCtx]
+    
+    for i,(a,c) in enumerate(delta[opName]):
+        if a == c: continue
+        
+        #a op b
+        #WHEN
+        #    (a op c) [recently updated] AND (c op b)
+        acRelation = array[a][c] & represents[c] & contexts
+        if acRelation == 0: continue
+        cRow = array[c]
+        ruleCounters['examined'] += len(principlesList)
+        for b in principlesList:
+            if b == a or b == c: continue
+            
+            transitive = acRelation & cRow[b]
+            if transitive == 0: continue
+            
+            for x in clsCtx.list(transitive):
+                op = (x, opName)
+                aOpC = (a, op, c)
+                cOpB = (c, op, b)
+                aOpB = (a, op, b)
+                cplx = 1 + justComplexity[aOpC] + justComplexity[cOpB]
+                if cplx < justComplexity.get(aOpB, unknownComplexity) and cplx < best.get(aOpB, unknownComplexity):
+                    best[aOpB] = cplx
+                    yield ((0, i, b, rank[x]), aOpB, (aOpC, cOpB))
+    recentPairs = set(delta[opName])
+    for i,(c,b) in enumerate(delta[opName]):
+        if b == c: continue
+        
+        #a op b
+        #WHEN
+        #    (a op c) [not recently updated] AND (c op b) [recently updated]
+        cbRelation = array[c][b] & represents[c] & contexts
+        if cbRelation == 0: continue
+        ruleCounters['examined'] += len(principlesList)
+        for a in principlesList:
+            if a == b or a == c: continue
+            if (a,c) in recentPairs: continue
+            
+            transitive = array[a][c] & cbRelation
+            if transitive == 0: continue
+            
+            for x in clsCtx.list(transitive):
+                op = (x, opName)
+                aOpC = (a, op, c)
+                cOpB = (c, op, b)
+                aOpB = (a, op, b)
+                cplx = 1 + justComplexity[aOpC] + justComplexity[cOpB]
+                if cplx < justComplexity.get(aOpB, unknownComplexity) and cplx < best.get(aOpB, unknownComplexity):
+                    best[aOpB] = cplx
+                    yield ((1, i, a, rank[x]), aOpB, (aOpC, cOpB))
+
+# Uses array, affects array
+def deltaTransitiveClosure(array, opName, clsCtx, delta):
+    # Extend the transitive closure of array to cover the recently updated facts
+    return addCandidates(deriveCandidates(_transitiveCandidates, clsCtx, array, opName, clsCtx, delta))
+
 # Uses array, affects array
 def transitiveClosure(array, opName, clsCtx):
     # Complete (current) transitive closure of array, using Floyd-Warshall
+    represents = classRepresents[clsCtx]
     
     r = False
     for c in principlesList:
+        cRepresents = represents[c]
+        if cRepresents == 0: continue
+        
+        cRow = array[c]
         for a in principlesList:
             if a == c: continue
             
-            acRelation = array[a,c]
-            if acRelation == clsCtx.none: continue
+            acRelation = array[a][c] & cRepresents
+            if acRelation == 0: continue
             
+            ruleCounters['examined'] += len(principlesList)
             for b in principlesList:
                 if b == a or b == c: continue
                 
-                transitive = acRelation & array[c,b]
-                if transitive == clsCtx.none: continue
+                transitive = acRelation & cRow[b]
+                if transitive == 0: continue
                 
-                for x in clsCtx.list(transitive):
-                    op = (x, opName)
-                    aOpC = (a, op, c)
-                    cOpB = (c, op, b)
-                    
-                    r |= addFact(a, op, b,
-                                 (aOpC, cOpB), 1 + justComplexity[aOpC] + justComplexity[cOpB])
+                r |= _addTransitive(a, c, b, transitive, opName, clsCtx)
+    return r
+
+def _complexityMatrix(array, op):
+    # The complexity of each known fact (a op b), as a matrix; infinite where unknown
+    x, opName = op
+    matrix = np.full((len(principlesList), len(principlesList)), np.inf)
+    for a in principlesList:
+        aRow = array[a]
+        for b in principlesList:
+            if aRow[b] & x:
+                matrix[a,b] = justComplexity[a, op, b]
+    return matrix
+
+# Uses array, affects array
+def numpyTransitiveClosure(array, opName, clsCtx):
+    # Complete (current) transitive closure of array, using a vectorized Floyd-Warshall
+    #  over the complexities of the facts in each context, so that each fact is justified
+    #  (or improved) by the same shortest routes as in the other algorithms
+    represents = classRepresents[clsCtx]
+    allContexts = clsCtx.none
+    for x in clsCtx:
+        allContexts |= x
+    
+    r = False
+    for x in clsCtx.list(allContexts):
+        op = (x, opName)
+        matrix = _complexityMatrix(array, op)
+        for c in principlesList:
+            if not represents[c] & x: continue
+            
+            ruleCounters['examined'] += len(principlesList) ** 2
+            transitive = matrix[:,c,np.newaxis] + matrix[np.newaxis,c,:] + 1
+            improved = transitive < matrix
+            improved[c,:] = False
+            improved[:,c] = False
+            np.fill_diagonal(improved, False)
+            
+            for a,b in zip(*np.nonzero(improved)):
+                a,b = int(a),int(b)
+                r |= _addTransitive(a, c, b, x, opName, clsCtx)
+                matrix[a,b] = justComplexity[a, op, b]
+    return r
+
+def _bits(mask):
+    # Positions of the bits set in mask
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+def _components(successors):
+    # Strongly connected components of the graph with the given successor bitsets, using
+    #  Tarjan's algorithm without recursion; they are found in reverse topological order.
+    n = len(successors)
+    index = [None] * n
+    low = [0] * n
+    onStack = [False] * n
+    stack = []
+    components = []
+    
+    counter = 0
+    for root in range(n):
+        if index[root] is not None: continue
+        
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        onStack[root] = True
+        work = [(root, _bits(successors[root]))]
+        while work:
+            v, children = work[-1]
+            for w in children:
+                if index[w] is None:
+                    index[w] = low[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    onStack[w] = True
+                    work.append((w, _bits(successors[w])))
+                    break
+                elif onStack[w]:
+                    low[v] = min(low[v], index[w])
+            else:
+                work.pop()
+                if work:
+                    u = work[-1][0]
+                    low[u] = min(low[u], low[v])
+                
+                if low[v] == index[v]:
+                    component = []
+                    while True:
+                        w = stack.pop()
+                        onStack[w] = False
+                        component.append(w)
+                        if w == v: break
+                    components.append(component)
+    return components
+
+# Uses array, affects array
+def sccTransitiveClosure(array, opName, clsCtx):
+    # Complete (current) transitive closure of array, separately in each context: find the
+    #  strongly connected components, then close them in reverse topological order, each as
+    #  the union of the closures of its successors (Purdom's algorithm). Only facts that
+    #  were not already known are justified, each by the first route found to it; unlike
+    #  the other algorithms, this may not be the shortest.
+    allContexts = clsCtx.none
+    for x in clsCtx:
+        allContexts |= x
+    
+    r = False
+    for x in clsCtx.list(allContexts):
+        successors = []
+        for a in principlesList:
+            aRow = array[a]
+            aSuccessors = 0
+            ruleCounters['examined'] += len(principlesList)
+            for b in principlesList:
+                if aRow[b] & x and b != a:
+                    aSuccessors |= 1 << b
+            successors.append(aSuccessors)
+        
+        closure = [0] * len(successors)
+        for component in _components(successors):
+            members = 0
+            for a in component:
+                members |= 1 << a
+            
+            reached = members if len(component) > 1 else 0
+            for a in component:
+                for c in _bits(successors[a] & ~members):
+                    reached |= (1 << c) | closure[c]
+            for a in component:
+                closure[a] = reached & ~(1 << a)
+            
+            # Justify the new facts, searching outwards from each principle of the
+            #  component; the closures of later components are already known.
+            for a in component:
+                if closure[a] & ~successors[a] == 0: continue
+                
+                known = successors[a] | (1 << a)
+                queue = deque(_bits(successors[a]))
+                while queue:
+                    c = queue.popleft()
+                    if members & (1 << c):
+                        for b in _bits(successors[c] & ~known):
+                            #a op b
+                            #WHEN
+                            #    (a op c) AND (c op b)
+                            r |= _addTransitive(a, c, b, x, opName, clsCtx)
+                            known |= 1 << b
+                            queue.append(b)
+                    else:
+                        for b in _bits(closure[c] & ~known):
+                            r |= _addTransitive(a, c, b, x, opName, clsCtx)
+                            known |= 1 << b
+    return r
+
+closureAlgorithms = {u'delta': deltaTransitiveClosure,
+                     u'floyd': transitiveClosure,
+                     u'numpy': numpyTransitiveClosure,
+                     u'scc': sccTransitiveClosure}
+closureAlgorithm = u'delta'
+
+# Time spent taking each transitive closure, for the verbose report
+closureTime = defaultdict(float) # by operator
+
+@inferenceRule
+def takeClosure(array, opName, clsCtx, delta):
+    if len(delta[opName]) == 0:
+        return False
+    
+    start = timekeeper()
+    if closureAlgorithm == u'delta':
+        r = deltaTransitiveClosure(array, opName, clsCtx, delta)
+    else:
+        r = closureAlgorithms[closureAlgorithm](array, opName, clsCtx)
+    closureTime[opName] += timekeeper() - start
+    return r
+
+# The inference rules only join facts through principles that represent their equivalence
+#  classes. For each principle: the contexts in which it represents its class, and in
+#  the other contexts, the class root that its facts are moved onto.
+classRepresents = {Reduction: [], Form: []}
+classRoots = {Reduction: [], Form: []}
+
+# Condensing shortens derivation, but justifications may then take longer routes
+#  through the class roots; it is off unless requested
+condenseEquivalences = False
+
+def resetCondensation():
+    allReductions = Reduction.none
+    for x in Reduction:
+        allReductions |= x
+    allForms = Form.none
+    for f in Form:
+        allForms |= f
+    
+    classRepresents[Reduction] = [allReductions] * len(principlesList)
+    classRepresents[Form] = [allForms] * len(principlesList)
+    classRoots[Reduction] = [{} for a in principlesList]
+    classRoots[Form] = [{} for a in principlesList]
+
+def condenseClasses():
+    # Condense each principle into the root of its class, once their equivalence is
+    #  known; returns the newly condensed principles, for each kind of context.
+    #  (Equivalence over RCA preserves conservation of every form.)
+    newlyCondensed = {Reduction: set(), Form: set()}
+    if not condenseEquivalences:
+        return newlyCondensed
+    
+    for a in principlesList:
+        represents = classRepresents[Reduction][a]
+        roots = classRoots[Reduction][a]
+        for x in classParent:
+            root = findClass(x, a)
+            if root == a or root == roots.get(x): continue
+            if not equivalent[a][root] & x: continue
+            
+            if represents & x:
+                represents &= ~x
+                newlyCondensed[Reduction].add(a)
+            roots[x] = root
+        classRepresents[Reduction][a] = represents
+        
+        rcaRoot = roots.get(Reduction.RCA)
+        if rcaRoot is not None:
+            if classRepresents[Form][a] != 0:
+                classRepresents[Form][a] = Form.none
+                newlyCondensed[Form].add(a)
+            for f in Form:
+                if f != Form.none:
+                    classRoots[Form][a][f] = rcaRoot
+    return newlyCondensed
+
+def condensedPairs(array, clsCtx, pairs, newlyCondensed):
+    # The given pairs that relate condensed principles, and all related pairs of newly
+    #  condensed principles
+    represents = classRepresents[clsCtx]
+    
+    condensed = set()
+    for a,b in pairs:
+        if array[a][b] & ~(represents[a] & represents[b]) != 0:
+            condensed.add((a,b))
+    for d in newlyCondensed:
+        for p in principlesList:
+            if array[d][p] != 0:
+                condensed.add((d,p))
+            if array[p][d] != 0:
+                condensed.add((p,d))
+    return sorted(condensed)
+
+# Uses array, affects array
+@inferenceRule
+def condenseTransitive(array, opName, clsCtx, pairs):
+    # Move facts about condensed principles onto their class roots, by transitivity
+    #  through the known equivalences
+    represents = classRepresents[clsCtx]
+    roots = classRoots[clsCtx]
+    ruleCounters['examined'] += len(pairs)
+    
+    r = False
+    for a,b in pairs:
+        relation = array[a][b]
+        
+        #a op root
+        #WHEN
+        #    (a op b) AND (b op root)
+        for x in clsCtx.list(relation & ~represents[b]):
+            root = roots[b][x]
+            if root != a:
+                r |= _addTransitive(a, b, root, x, opName, clsCtx)
+        
+        #root op b
+        #WHEN
+        #    (root op a) AND (a op b)
+        for x in clsCtx.list(relation & ~represents[a]):
+            root = roots[a][x]
+            if root != b:
+                r |= _addTransitive(root, a, b, x, opName, clsCtx)
     return r
 
+def conjunctionIndex():
+    # For each principle p, the conjunctions with p as a conjunct
+    containing = defaultdict(list)
+    for b in principlesList:
+        splitB = principleNames[b].split(u'+')
+        if len(splitB) == 1: continue # b is not a conjunction
+        
+        for p in splitB:
+            containing[principleIndex[p]].append(b)
+    return containing
+
 # Uses '->', affects '->'
-def unifyOverConjunctions():
+@inferenceRule
+def unifyOverConjunctions(delta, containing):
     #a X-> b
     #WHEN
     #    (b == c+d) AND (a X-> c) AND (a X-> d) "Definition of conjunction"
     
+    pairs = sorted(set((a,b) for a,p in delta[u'->'] for b in containing[p]))
+    ruleCounters['examined'] += len(pairs)
+    
     r = False
-    for b in principlesList:
-        splitB = b.split(u'+')
-        if len(splitB) == 1: continue # b is not a conjunction
+    for a,b in pairs:
+        splitB = [principleIndex[p] for p in principleNames[b].split(u'+')]
         
-        for a in principlesList:
-            aImpliesAll = ~Reduction.none
-            for p in splitB:
-                aImpliesAll &= implies[a,p]
-            if aImpliesAll == Reduction.none: continue
-            
-            for x in Reduction.list(aImpliesAll):
-                aImpConjuncts = tuple([(a, (x, u'->'), t) for t in splitB])
-                r |= addFact(a, (x, u'->'), b,
-                             aImpConjuncts, 1 + sum(justComplexity[aImpX] for aImpX in aImpConjuncts))
+        aRow = implies[a]
+        aImpliesAll = ~Reduction.none
+        for p in splitB:
+            aImpliesAll &= aRow[p]
+        if aImpliesAll == 0: continue
+        
+        for x in Reduction.list(aImpliesAll):
+            aImpConjuncts = tuple([(a, (x, u'->'), t) for t in splitB])
+            r |= addFact(a, (x, u'->'), b,
+                         aImpConjuncts, 1 + sum(justComplexity[aImpX] for aImpX in aImpConjuncts))
+    return r
+
+def _conservativeImplication(a, b, c, frms):
+    cImpB = (c, (Reduction.RCA, u'->'), b)
+    refCplxCB = 2 + justComplexity[cImpB]
+    
+    r = False
+    for f in Form.list(frms):
+        cConsA = (c, (f, u'c'), a)
+        
+        r |= addFact(a, (Reduction.RCA, u'->'), b,
+                     (cConsA, cImpB, (b, u'form', f)), refCplxCB + justComplexity[cConsA])
     return r
 
 #REDUNDANT
 # Uses 'c' and '->', affects '->'
-def definitionOfConservation():
+@inferenceRule
+def definitionOfConservation(delta):
     #a RCA-> b
     #WHEN
     #    (c Fc a) AND (c RCA-> b) AND (b has form F) "Definition of conservation"
     
+    represents = classRepresents[Form]
+    
     r = False
-    for c in principlesList:
-        for b in principlesList:
-            if b == c: continue
+    for c,b in delta[u'->']:
+        if b == c: continue
+        
+        if implies[c][b] & _RCA:
+            formB = form[b] & represents[c]
+            if formB == 0: continue
             
-            if Reduction.isPresent(Reduction.RCA, implies[c,b]):
-                formB = form[b]
-                if formB == Form.none: continue
+            ruleCounters['examined'] += len(principlesList)
+            for a in principlesList:
+                if a == b or a == c: continue
                 
-                cImpB = (c, (Reduction.RCA, u'->'), b)
-                refCplxCB = 2 + justComplexity[cImpB]
+                frms = formB & conservative[c][a]
+                if frms == 0: continue
                 
-                for a in principlesList:
-                    if a == b or a == c: continue
-                    
-                    frms = formB & conservative[c,a]
-                    if frms == Form.none: continue
-                    
-                    for f in Form.list(frms):
-                        cConsA = (c, (f, u'c'), a)
-                        
-                        r |= addFact(a, (Reduction.RCA, u'->'), b,
-                                     (cConsA, cImpB, (b, u'form', f)), refCplxCB + justComplexity[cConsA])
+                r |= _conservativeImplication(a, b, c, frms)
+    recentImplications = set(delta[u'->'])
+    for c,a in delta[u'c']:
+        if a == c: continue
+        
+        cConsA = conservative[c][a] & represents[c]
+        if cConsA == 0: continue
+        ruleCounters['examined'] += len(principlesList)
+        for b in principlesList:
+            if b == a or b == c: continue
+            if (c,b) in recentImplications: continue
+            
+            frms = form[b] & cConsA
+            if frms == 0: continue
+            
+            if implies[c][b] & _RCA:
+                r |= _conservativeImplication(a, b, c, frms)
     return r
 
-# Uses posArray and negArray, affects negArray
-def contrapositiveTransitivity(posArray, posOpName, negArray, negOpName, clsCtx):
+#a nop b
+#WHEN
+#    (c op a) AND (c nop b)
+def _addWeakerSource(a, b, c, contexts, posOpName, negOpName, clsCtx):
     r = False
-    for c in principlesList:
+    for ctx in clsCtx.list(contexts):
+        nop = (ctx, negOpName)
+        
+        cOpA = (c, (ctx, posOpName), a)
+        cNOpB = (c, nop, b)
+        
+        r |= addFact(a, nop, b,
+                     (cOpA, cNOpB), 1 + justComplexity[cOpA] + justComplexity[cNOpB])
+    return r
+
+#a nop b
+#WHEN
+#    (a nop c) AND (b op c)
+def _addStrongerTarget(a, b, c, contexts, posOpName, negOpName, clsCtx):
+    r = False
+    for ctx in clsCtx.list(contexts):
+        nop = (ctx, negOpName)
+        
+        aNOpC = (a, nop, c)
+        bOpC = (b, (ctx, posOpName), c)
+        
+        r |= addFact(a, nop, b,
+                     (aNOpC, bOpC), 1 + justComplexity[aNOpC] + justComplexity[bOpC])
+    return r
+
+def _contrapositiveCandidates(posArray, posOpName, negArray, negOpName, clsCtx, delta, contexts):
+    best = {} # the best candidate for each fact
+    represents = classRepresents[clsCtx]
+    rank = contextRank[clsCtx]
+    
+    #a nop b
+    #WHEN
+    #    (c op a) AND (c nop b)
+    def weakerSource(key, a, b, c, ctxs):
+        for ctx in clsCtx.list(ctxs):
+            nop = (ctx, negOpName)
+            cOpA = (c, (ctx, posOpName), a)
+            cNOpB = (c, nop, b)
+            aNOpB = (a, nop, b)
+            cplx = 1 + justComplexity[cOpA] + justComplexity[cNOpB]
+            if cplx < justComplexity.get(aNOpB, unknownComplexity) and cplx < best.get(aNOpB, unknownComplexity):
+                best[aNOpB] = cplx
+                yield (key + (rank[ctx],), aNOpB, (cOpA, cNOpB))
+    for i,(c,b) in enumerate(delta[negOpName]):
+        if b == c: continue
+        
+        cbNRelation = negArray[c][b] & represents[c] & contexts
+        if cbNRelation == 0: continue
+        cRow = posArray[c]
+        ruleCounters['examined'] += len(principlesList)
         for a in principlesList:
-            if a == c: continue
+            if a == c or b == a: continue
             
-            #a nop b
-            #WHEN
-            #    (c op a) AND (c nop b)
-            caRelation = posArray[c,a]
-            if caRelation != clsCtx.none:
-                for b in principlesList:
-                    if b == a or b == c: continue
-                    
-                    contexts = caRelation & negArray[c,b]
-                    if contexts == clsCtx.none: continue
-                    
-                    for ctx in clsCtx.list(contexts):
-                        nop = (ctx, negOpName)
-                        
-                        cOpA = (c, (ctx, posOpName), a)
-                        cNOpB = (c, nop, b)
-                        
-                        r |= addFact(a, nop, b,
-                                     (cOpA, cNOpB), 1 + justComplexity[cOpA] + justComplexity[cNOpB])
-            
-            #a nop b
-            #WHEN
-            #    (a nop c) AND (b op c)
-            acNRelation = negArray[a,c]
-            if acNRelation != clsCtx.none:
-                for b in principlesList:
-                    if b == a or b == c: continue
-                    
-                    contexts = acNRelation & posArray[b,c]
-                    if contexts == clsCtx.none: continue
-                    
-                    for ctx in clsCtx.list(contexts):
-                        nop = (ctx, negOpName)
-                        
-                        aNOpC = (a, nop, c)
-                        bOpC = (b, (ctx, posOpName), c)
-                        
-                        r |= addFact(a, nop, b,
-                                     (aNOpC, bOpC), 1 + justComplexity[aNOpC] + justComplexity[bOpC])
+            ctxs = cRow[a] & cbNRelation
+            if ctxs != 0:
+                for candidate in weakerSource((0, i, a), a, b, c, ctxs):
+                    yield candidate
+    for i,(c,a) in enumerate(delta[posOpName]):
+        if a == c: continue
+        
+        caRelation = posArray[c][a] & represents[c] & contexts
+        if caRelation == 0: continue
+        cNRow = negArray[c]
+        ruleCounters['examined'] += len(principlesList)
+        for b in principlesList:
+            if b == a or b == c: continue
+            
+            ctxs = caRelation & cNRow[b]
+            if ctxs != 0:
+                for candidate in weakerSource((1, i, b), a, b, c, ctxs):
+                    yield candidate
+    
+    #a nop b
+    #WHEN
+    #    (a nop c) AND (b op c)
+    def strongerTarget(key, a, b, c, ctxs):
+        for ctx in clsCtx.list(ctxs):
+            nop = (ctx, negOpName)
+            aNOpC = (a, nop, c)
+            bOpC = (b, (ctx, posOpName), c)
+            aNOpB = (a, nop, b)
+            cplx = 1 + justComplexity[aNOpC] + justComplexity[bOpC]
+            if cplx < justComplexity.get(aNOpB, unknownComplexity) and cplx < best.get(aNOpB, unknownComplexity):
+                best[aNOpB] = cplx
+                yield (key + (rank[ctx],), aNOpB, (aNOpC, bOpC))
+    for i,(a,c) in enumerate(delta[negOpName]):
+        if a == c: continue
+        
+        acNRelation = negArray[a][c] & represents[c] & contexts
+        if acNRelation == 0: continue
+        ruleCounters['examined'] += len(principlesList)
+        for b in principlesList:
+            if b == a or b == c: continue
+            
+            ctxs = acNRelation & posArray[b][c]
+            if ctxs != 0:
+                for candidate in strongerTarget((2, i, b), a, b, c, ctxs):
+                    yield candidate
+    for i,(b,c) in enumerate(delta[posOpName]):
+        if b == c: continue
+        
+        bcRelation = posArray[b][c] & represents[c] & contexts
+        if bcRelation == 0: continue
+        ruleCounters['examined'] += len(principlesList)
+        for a in principlesList:
+            if a == b or a == c: continue
+            
+            ctxs = negArray[a][c] & bcRelation
+            if ctxs != 0:
+                for candidate in strongerTarget((3, i, a), a, b, c, ctxs):
+                    yield candidate
+
+# Uses posArray and negArray, affects negArray
+@inferenceRule
+def contrapositiveTransitivity(posArray, posOpName, negArray, negOpName, clsCtx, delta):
+    # NOTE: posArray does not change while deriving negative facts, so its recent updates
+    #  only need to be considered in the first round.
+    return addCandidates(deriveCandidates(_contrapositiveCandidates, clsCtx,
+                                          posArray, posOpName, negArray, negOpName, clsCtx, delta))
+
+# Uses negArray, affects negArray
+@inferenceRule
+def condenseContrapositive(posOpName, negArray, negOpName, clsCtx, pairs):
+    # Move negative facts about condensed principles onto their class roots, through the
+    #  known equivalences
+    represents = classRepresents[clsCtx]
+    roots = classRoots[clsCtx]
+    ruleCounters['examined'] += len(pairs)
+    
+    r = False
+    for a,b in pairs:
+        nRelation = negArray[a][b]
+        
+        #a nop root
+        #WHEN
+        #    (a nop b) AND (root op b)
+        for x in clsCtx.list(nRelation & ~represents[b]):
+            root = roots[b][x]
+            if root != a:
+                r |= _addStrongerTarget(a, root, b, x, posOpName, negOpName, clsCtx)
+        
+        #root nop b
+        #WHEN
+        #    (a op root) AND (a nop b)
+        for x in clsCtx.list(nRelation & ~represents[a]):
+            root = roots[a][x]
+            if root != b:
+                r |= _addWeakerSource(root, b, a, x, posOpName, negOpName, clsCtx)
     return r
 
+def conjunctionSplits():
+    # For each principle bc, the pairs (b, c) with b+c == bc
+    splits = defaultdict(list)
+    for c in principlesList:
+        for b in principlesList:
+            if b == c: continue
+            
+            bc = joinPrinciples(b,c)
+            if bc is None: continue
+            
+            splits[bc].append((b,c))
+    return splits
+
 # Uses '->' and '-|>', affects '-|>'
-def contrapositiveConjunction():
+@inferenceRule
+def contrapositiveConjunction(delta, splits):
     #a X-|> b
     #WHEN
     #    (a X-> c) AND (a X-|> b+c)
     
+    def splitConjunction(a, b, c, bc):
+        r = False
+        if a == c: # Special-case
+            reds = notImplies[a][bc]
+            if reds == 0: return r
+            
+            for x in Reduction.list(reds):
+                notImp = (x, u'-|>')
+                
+                aNotImpBC = (a, notImp, bc)
+                
+                r |= addFact(a, notImp, b,
+                             (aNotImpBC,), 1 + justComplexity[aNotImpBC])
+        else:
+            reds = implies[a][c] & notImplies[a][bc]
+            if reds == 0: return r
+            
+            for x in Reduction.list(reds):
+                notImp = (x, u'-|>')
+                
+                aImpC = (a, (x, u'->'), c)
+                aNotImpBC = (a, notImp, bc)
+                
+                r |= addFact(a, notImp, b,
+                             (aImpC, aNotImpBC), 1 + justComplexity[aImpC] + justComplexity[aNotImpBC])
+        return r
+    
     r = False
-    for c in principlesList:
+    for a,bc in delta[u'-|>']:
+        ruleCounters['examined'] += len(splits[bc])
+        for b,c in splits[bc]:
+            if a == b: continue
+            
+            r |= splitConjunction(a, b, c, bc)
+    for a,c in delta[u'->']:
+        if a == c: continue
+        
+        ruleCounters['examined'] += len(principlesList)
         for b in principlesList:
-            if b == c: continue
+            if b == a or b == c: continue
             
             bc = joinPrinciples(b,c)
             if bc is None: continue
             
-            for a in principlesList:
-                if a == b: continue
-                
-                if a == c: # Special-case
-                    reds = notImplies[a,bc]
-                    if reds == Reduction.none: continue
-                    
-                    for x in Reduction.list(reds):
-                        notImp = (x, u'-|>')
-                        
-                        aNotImpBC = (a, notImp, bc)
-                        
-                        r |= addFact(a, notImp, b,
-                                     (aNotImpBC,), 1 + justComplexity[aNotImpBC])
-                else:
-                    reds = implies[a,c] & notImplies[a,bc]
-                    if reds == Reduction.none: continue
-                    
-                    for x in Reduction.list(reds):
-                        notImp = (x, u'-|>')
-                        
-                        aImpC = (a, (x, u'->'), c)
-                        aNotImpBC = (a, notImp, bc)
-                        
-                        r |= addFact(a, notImp, b,
-                                     (aImpC, aNotImpBC), 1 + justComplexity[aImpC] + justComplexity[aNotImpBC])
+            r |= splitConjunction(a, b, c, bc)
     return r
 
 #REDUNDANT
 # Uses 'c' and '-|>', affects '-|>'
-def contrapositiveConservation():    
+@inferenceRule
+def contrapositiveConservation(delta):
     #a RCA-|> b
     #WHEN
     #    (a Fc c) AND (c RCA-|> b) AND (b has form F)
     notImp = (Reduction.RCA, u'-|>')
     
+    def conservativeNonImplication(a, b, c, frms):
+        cNotImpB = (c, notImp, b)
+        refCplxCB = 2 + justComplexity[cNotImpB]
+        
+        r = False
+        for f in Form.list(frms):
+            aConsC = (a, (f, u'c'), c)
+            
+            r |= addFact(a, notImp, b,
+                         (aConsC, cNotImpB, (b, u'form', f)), justComplexity[aConsC] + refCplxCB)
+        return r
+    
+    represents = classRepresents[Form]
+    
     r = False
-    for c in principlesList:
-        for b in principlesList:
-            if b == c: continue
+    for c,b in delta[u'-|>']:
+        if b == c: continue
+        
+        if notImplies[c][b] & _RCA:
+            formB = form[b] & represents[c]
+            if formB == 0: continue
             
-            if Reduction.isPresent(Reduction.RCA, notImplies[c,b]):
-                formB = form[b]
-                if formB == Form.none: continue
-                
-                cNotImpB = (c, notImp, b)
-                refCplxCB = 2 + justComplexity[cNotImpB]
+            ruleCounters['examined'] += len(principlesList)
+            for a in principlesList:
+                if a == b or a == c: continue
                 
-                for a in principlesList:
-                    if a == b or a == c: continue
-                    
-                    frms = conservative[a,c] & formB
-                    if frms == Form.none: continue
-                    
-                    for f in Form.list(frms):
-                        aConsC = (a, (f, u'c'), c)
-                        
-                        r |= addFact(a, notImp, b,
-                                     (aConsC, cNotImpB, (b, u'form', f)), justComplexity[aConsC] + refCplxCB)
+                frms = conservative[a][c] & formB
+                if frms != 0:
+                    r |= conservativeNonImplication(a, b, c, frms)
+    for a,c in delta[u'c']:
+        if a == c: continue
+        
+        acRelation = conservative[a][c] & represents[c]
+        if acRelation == 0: continue
+        ruleCounters['examined'] += len(principlesList)
+        for b in principlesList:
+            if b == a or b == c: continue
+            
+            frms = acRelation & form[b]
+            if frms == 0: continue
+            
+            if notImplies[c][b] & _RCA:
+                r |= conservativeNonImplication(a, b, c, frms)
     return r
 
-#REDUNDANT
-# Uses 'c' and '->', affects 'c'
-def liftConservation():
-    r = False
-    for c in principlesList:
-        #a Fc b
-        #WHEN
-        #    (c RCA-> a) AND (c Fc b) [aka "Weaker principles prove less"]
+def _liftConservationCandidates(delta, contexts):
+    best = {} # the best candidate for each fact
+    imp = (Reduction.RCA, u'->')
+    represents = classRepresents[Reduction]
+    rank = contextRank[Form]
+    
+    #a Fc b
+    #WHEN
+    #    (c RCA-> a) AND (c Fc b) [aka "Weaker principles prove less"]
+    def weakerProvesLess(key, a, b, c):
+        cImpA = (c, imp, a)
+        refCplxCA = 1 + justComplexity[cImpA]
+        for f in Form.list(conservative[c][b] & contexts):
+            fc = (f, u'c')
+            cConsB = (c, fc, b)
+            aConsB = (a, fc, b)
+            cplx = refCplxCA + justComplexity[cConsB]
+            if cplx < justComplexity.get(aConsB, unknownComplexity) and cplx < best.get(aConsB, unknownComplexity):
+                best[aConsB] = cplx
+                yield (key + (rank[f],), aConsB, (cImpA, cConsB))
+    for i,(c,a) in enumerate(delta[u'->']):
+        if a == c: continue
+        
+        if implies[c][a] & represents[c] & _RCA:
+            ruleCounters['examined'] += len(principlesList)
+            for b in principlesList:
+                if b == a or b == c: continue
+                
+                if conservative[c][b] & contexts != 0:
+                    for candidate in weakerProvesLess((0, i, b), a, b, c):
+                        yield candidate
+    recentImplications = set(delta[u'->'])
+    for i,(c,b) in enumerate(delta[u'c']):
+        if b == c: continue
+        if not represents[c] & _RCA: continue
+        if conservative[c][b] & contexts == 0: continue
+        
+        ruleCounters['examined'] += len(principlesList)
         for a in principlesList:
-            if a == c: continue
+            if a == b or a == c: continue
+            if (c,a) in recentImplications: continue
             
-            if Reduction.isPresent(Reduction.RCA, implies[c,a]):
-                cImpA = (c, (Reduction.RCA, u'->'), a)
-                refCplxCA = 1 + justComplexity[cImpA]
+            if implies[c][a] & _RCA:
+                for candidate in weakerProvesLess((1, i, a), a, b, c):
+                    yield candidate
+    
+    #a Fc b
+    #WHEN
+    #    (a Fc c) AND (b RCA-> c) [aka "Stronger principles prove more"]
+    def strongerProvesMore(key, a, b, c):
+        bImpC = (b, imp, c)
+        refCplxBC = 1 + justComplexity[bImpC]
+        for f in Form.list(conservative[a][c] & contexts):
+            fc = (f, u'c')
+            aConsC = (a, fc, c)
+            aConsB = (a, fc, b)
+            cplx = justComplexity[aConsC] + refCplxBC
+            if cplx < justComplexity.get(aConsB, unknownComplexity) and cplx < best.get(aConsB, unknownComplexity):
+                best[aConsB] = cplx
+                yield (key + (rank[f],), aConsB, (aConsC, bImpC))
+    for i,(b,c) in enumerate(delta[u'->']):
+        if b == c: continue
+        
+        if implies[b][c] & represents[c] & _RCA:
+            ruleCounters['examined'] += len(principlesList)
+            for a in principlesList:
+                if a == b or a == c: continue
                 
-                for b in principlesList:
-                    if b == a or b == c: continue
-                    
-                    for f in Form.list(conservative[c,b]):
-                        fc = (f, u'c')
-                        cConsB = (c, fc, b)
-                        
-                        r |= addFact(a, fc, b,
-                                     (cImpA, cConsB), refCplxCA + justComplexity[cConsB])
-        
-        #a Fc b
-        #WHEN
-        #    (a Fc c) AND (b RCA-> c) [aka "Stronger principles prove more"]
+                if conservative[a][c] & contexts != 0:
+                    for candidate in strongerProvesMore((2, i, a), a, b, c):
+                        yield candidate
+    for i,(a,c) in enumerate(delta[u'c']):
+        if a == c: continue
+        if not represents[c] & _RCA: continue
+        if conservative[a][c] & contexts == 0: continue
+        
+        ruleCounters['examined'] += len(principlesList)
         for b in principlesList:
-            if b == c: continue
+            if b == a or b == c: continue
+            if (b,c) in recentImplications: continue
             
-            if Reduction.isPresent(Reduction.RCA, implies[b,c]):
-                bImpC = (b, (Reduction.RCA, u'->'), c)
-                refCplxBC = 1 + justComplexity[bImpC]
-                
-                for a in principlesList:
-                    if a == b or a == c: continue
-                    
-                    for f in Form.list(conservative[a,c]):
-                        fc = (f, u'c')
-                        aConsC = (a, fc, c)
-                        
-                        r |= addFact(a, fc, b,
-                                     (aConsC, bImpC), justComplexity[aConsC] + refCplxBC)
-    return r
+            if implies[b][c] & _RCA:
+                for candidate in strongerProvesMore((3, i, b), a, b, c):
+                    yield candidate
+
+#REDUNDANT
+# Uses 'c' and '->', affects 'c'
+@inferenceRule
+def liftConservation(delta):
+    return addCandidates(deriveCandidates(_liftConservationCandidates, Form, delta))
 
 #REDUNDANT
 # Uses '->' and '-|>', affects 'nc'
-def definitionOfNonConservation():
+@inferenceRule
+def definitionOfNonConservation(delta):
     #a nFc b
     #WHEN
     #    (a RCA-> c) AND (b RCA-|> c) AND (c has form F)
+    # NOTE: the form of c is not shared by its class, so c is not condensed here.
+    def nonConservation(a, b, c, cForms):
+        aImpC = (a, (Reduction.RCA, u'->'), c)
+        bNotImpC = (b, (Reduction.RCA, u'-|>'), c)
+        
+        cplx = 2 + justComplexity[aImpC] + justComplexity[bNotImpC]
+        
+        r = False
+        for f in cForms:
+            r |= addFact(a, (f, u'nc'), b,
+                         (aImpC, bNotImpC, (c, u'form', f)), cplx)
+        return r
+    
     r = False
-    for c in principlesList:
+    for b,c in delta[u'-|>']:
+        if b == c: continue
+        
         formC = form[c]
-        if formC == Form.none: continue
+        if formC == 0: continue
         cForms = Form.list(formC)
         
-        for a in principlesList:
-            if a == c: continue
-            
-            if Reduction.isPresent(Reduction.RCA, implies[a,c]):
-                aImpC = (a, (Reduction.RCA, u'->'), c)
-                refCplxAC = 2 + justComplexity[aImpC]
+        if notImplies[b][c] & _RCA:
+            ruleCounters['examined'] += len(principlesList)
+            for a in principlesList:
+                if a == b or a == c: continue
                 
-                for b in principlesList:
-                    if b == a or b == c: continue
-                    
-                    if Reduction.isPresent(Reduction.RCA, notImplies[b,c]):
-                        bNotImpC = (b, (Reduction.RCA, u'-|>'), c)
-                        
-                        cplx = refCplxAC + justComplexity[bNotImpC]
-                        
-                        for f in cForms:
-                            r |= addFact(a, (f, u'nc'), b,
-                                         (aImpC, bNotImpC, (c, u'form', f)), cplx)
+                if implies[a][c] & _RCA:
+                    r |= nonConservation(a, b, c, cForms)
+    for a,c in delta[u'->']:
+        if a == c: continue
+        
+        formC = form[c]
+        if formC == 0: continue
+        cForms = Form.list(formC)
+        
+        if implies[a][c] & _RCA:
+            ruleCounters['examined'] += len(principlesList)
+            for b in principlesList:
+                if b == a or b == c: continue
+                
+                if notImplies[b][c] & _RCA:
+                    r |= nonConservation(a, b, c, cForms)
     return r
 
-#REDUNDANT
-# Uses 'nc' and '->', affects 'nc'
-def liftNonConservation():
+def _liftNonConservationCandidates(delta, contexts):
+    best = {} # the best candidate for each fact
     imp = (Reduction.RCA, u'->')
+    represents = classRepresents[Reduction]
+    rank = contextRank[Form]
     
-    r = False
-    for c in principlesList:
-        #a nFc b
-        #WHEN
-        #    (a nFc c) AND (c RCA-> b) [aka "Weaker principles prove less (contrapositive)"]
+    #a nFc b
+    #WHEN
+    #    (a nFc c) AND (c RCA-> b) [aka "Weaker principles prove less (contrapositive)"]
+    def weakerProvesLess(key, a, b, c, acNonCons):
+        cImpB = (c, imp, b)
+        refCplxCB = 1 + justComplexity[cImpB]
+        for f in acNonCons:
+            nFc = (f, u'nc')
+            aNonConsC = (a, nFc, c)
+            aNonConsB = (a, nFc, b)
+            cplx = justComplexity[aNonConsC] + refCplxCB
+            if cplx < justComplexity.get(aNonConsB, unknownComplexity) and cplx < best.get(aNonConsB, unknownComplexity):
+                best[aNonConsB] = cplx
+                yield (key + (rank[f],), aNonConsB, (aNonConsC, cImpB))
+    for i,(a,c) in enumerate(delta[u'nc']):
+        if a == c: continue
+        if not represents[c] & _RCA: continue
+        
+        acNonCons = Form.list(nonConservative[a][c] & contexts)
+        if len(acNonCons) == 0: continue
+        ruleCounters['examined'] += len(principlesList)
         for b in principlesList:
-            if b == c: continue
+            if b == a or b == c: continue
             
-            if Reduction.isPresent(Reduction.RCA, implies[c,b]):
-                cImpB = (c, imp, b)
-                refCplxCB = 1 + justComplexity[cImpB]
+            if implies[c][b] & _RCA:
+                for candidate in weakerProvesLess((0, i, b), a, b, c, acNonCons):
+                    yield candidate
+    for i,(c,b) in enumerate(delta[u'->']):
+        if b == c: continue
+        
+        if implies[c][b] & represents[c] & _RCA:
+            ruleCounters['examined'] += len(principlesList)
+            for a in principlesList:
+                if a == b or a == c: continue
                 
-                for a in principlesList:
-                    if a == b or a == c: continue
-                    
-                    for f in Form.list(nonConservative[a,c]):
-                        nFc = (f, u'nc')
-                        aNonConsC = (a, nFc, c)
-                        
-                        r |= addFact(a, nFc, b,
-                                     (aNonConsC, cImpB), justComplexity[aNonConsC] + refCplxCB)
-        
-        #a nFc b
-        #WHEN
-        #    (a RCA-> c) AND (c nFc b) [aka "Stronger principles prove more (contrapositive)"]
+                acNonCons = nonConservative[a][c] & contexts
+                if acNonCons != 0:
+                    for candidate in weakerProvesLess((1, i, a), a, b, c, Form.list(acNonCons)):
+                        yield candidate
+    
+    #a nFc b
+    #WHEN
+    #    (a RCA-> c) AND (c nFc b) [aka "Stronger principles prove more (contrapositive)"]
+    def strongerProvesMore(key, a, b, c, cbNonCons):
+        aImpC = (a, imp, c)
+        refCplxAC = 1 + justComplexity[aImpC]
+        for f in cbNonCons:
+            nFc = (f, u'nc')
+            cNonConsB = (c, nFc, b)
+            aNonConsB = (a, nFc, b)
+            cplx = refCplxAC + justComplexity[cNonConsB]
+            if cplx < justComplexity.get(aNonConsB, unknownComplexity) and cplx < best.get(aNonConsB, unknownComplexity):
+                best[aNonConsB] = cplx
+                yield (key + (rank[f],), aNonConsB, (aImpC, cNonConsB))
+    for i,(c,b) in enumerate(delta[u'nc']):
+        if b == c: continue
+        if not represents[c] & _RCA: continue
+        
+        cbNonCons = Form.list(nonConservative[c][b] & contexts)
+        if len(cbNonCons) == 0: continue
+        ruleCounters['examined'] += len(principlesList)
         for a in principlesList:
-            if a == c: continue
+            if a == b or a == c: continue
             
-            if Reduction.isPresent(Reduction.RCA, implies[a,c]):
-                aImpC = (a, imp, c)
-                refCplxAC = 1 + justComplexity[aImpC]
+            if implies[a][c] & _RCA:
+                for candidate in strongerProvesMore((2, i, a), a, b, c, cbNonCons):
+                    yield candidate
+    for i,(a,c) in enumerate(delta[u'->']):
+        if a == c: continue
+        
+        if implies[a][c] & represents[c] & _RCA:
+            ruleCounters['examined'] += len(principlesList)
+            for b in principlesList:
+                if b == a or b == c: continue
                 
-                for b in principlesList:
-                    if b == a or b == c: continue
-                    
-                    for f in Form.list(nonConservative[c,b]):
-                        nFc = (f, u'nc')
-                        cNonConsB = (c, (f, u'nc'), b)
-                        
-                        r |= addFact(a, nFc, b,
-                                     (aImpC, cNonConsB), refCplxAC + justComplexity[cNonConsB])
-    return r
+                cbNonCons = nonConservative[c][b] & contexts
+                if cbNonCons != 0:
+                    for candidate in strongerProvesMore((3, i, b), a, b, c, Form.list(cbNonCons)):
+                        yield candidate
+
+#REDUNDANT
+# Uses 'nc' and '->', affects 'nc'
+@inferenceRule
+def liftNonConservation(delta):
+    # NOTE: implications do not change while deriving negative facts, so their recent
+    #  updates only need to be considered in the first round.
+    return addCandidates(deriveCandidates(_liftNonConservationCandidates, Form, delta))
+
+def _reportClasses():
+    eprint(u'\t\tEquivalence classes:')
+    for x in classParent:
+        eprint(u'\t\t\t{0}: {1:,d}'.format(x.name, sum(1 for a in principlesList if findClass(x, a) == a)))
+
+def _reportDelta(n, delta, names):
+    eprint(u'\t\tDuring iteration {0}:'.format(n))
+    if any(len(delta[opCore]) > 0 for opCore in names):
+        for opCore in names:
+            if len(delta[opCore]) > 0:
+                eprint(u'\t\t\t{0} updated: {1:,d}'.format(names[opCore], len(delta[opCore])))
+    else:
+        eprint(u'\t\t\tNothing updated.')
 
+# Rules are evaluated semi-naively: each round only considers derivations that use at
+#  least one fact whose justification was updated in the previous round. If
+#  condenseEquivalences is set, equivalent principles are condensed: rules only join
+#  facts through the root of each class, and the facts about other principles are moved
+#  onto their roots.
 def deriveInferences(quiet=False, verbose=False):
+    # The workers deriving candidates (with several jobs) serve all of the rules
+    startWorkers()
+    try:
+        _deriveInferences(quiet, verbose)
+    finally:
+        stopWorkers()
+
+def _deriveInferences(quiet, verbose):
+    global rulePhase
+    rulePhase = (u'setup', 0)
+    
     start = timekeeper()
     if not quiet: eprint(u'Adding reflexivity facts..')
     addReflexivities()
@@ -746,159 +2142,344 @@ def deriveInferences(quiet=False, verbose=False):
     addRCABottom()
     if not quiet: eprint(u'Recording conjunctions...')
     definitionOfConjunction()
+    containing = conjunctionIndex()
     if not quiet: eprint(u'Elapsed: {0:.6f} s\n'.format(timekeeper() - start))
     
+    # When extending an existing database, the known negative facts must also be joined
+    #  against every new positive fact.
+    oldNegatives = any(notImplies[a][b] != 0 and (a,b) not in recent[u'-|>'] for a in principlesList for b in principlesList) \
+                or any(nonConservative[a][b] != 0 and (a,b) not in recent[u'nc'] for a in principlesList for b in principlesList)
+    positiveUpdates = {u'->': set(), u'c': set()}
+    resetCondensation()
+    
     start = timekeeper()
     if not quiet: eprint(u'Deriving positive facts:')
+    positiveNames = {u'<->': u'Equivalences', u'->': u'Implications', u'c': u'Conservation facts'}
     n = 0
-    eUpdated, iUpdated, cUpdated = True, True, True
-    while eUpdated or iUpdated or cUpdated:
+    delta = takeDelta(*positiveNames)
+    while any(len(updated) > 0 for updated in delta.values()):
         n += 1
-        eChanged, iChanged, cChanged = False, False, False
+        rulePhase = (u'positive', n)
+        if oldNegatives:
+            for opCore in positiveUpdates:
+                positiveUpdates[opCore].update(delta[opCore])
+        
+        if not quiet: eprint(u'\tCondensing equivalence classes...')
+        newlyCondensed = condenseClasses()
+        condenseTransitive(equivalent, u'<->', Reduction,
+                           condensedPairs(equivalent, Reduction, delta[u'<->'], newlyCondensed[Reduction])) # Uses '<->', affects '<->'
+        condenseTransitive(implies, u'->', Reduction,
+                           condensedPairs(implies, Reduction, delta[u'->'], newlyCondensed[Reduction])) # Uses '->', affects '->'
+        condenseTransitive(conservative, u'c', Form,
+                           condensedPairs(conservative, Form, delta[u'c'], newlyCondensed[Form])) # Uses 'c', affects 'c'
         
-        if iUpdated or iChanged:
+        if len(delta[u'->']) > 0:
             if not quiet: eprint(u'\tExtracting equivalences...')
-            eChanged |= definitionOfEquivalence() # Uses '->', affects '<->'
-        if eUpdated or eChanged:
+            definitionOfEquivalence(delta) # Uses '->', affects '<->'
+        if len(delta[u'<->']) > 0:
             if not quiet: eprint(u'\tTaking the transitive closure of equivalence...')
-            eChanged |= transitiveClosure(equivalent, u'<->', Reduction) # Uses '<->', affects '<->'
+            takeClosure(equivalent, u'<->', Reduction, delta) # Uses '<->', affects '<->'
         
-        if iUpdated or iChanged:
+        if len(delta[u'->']) > 0:
             if not quiet: eprint(u'\tTaking the transitive closure of implication...')
-            iChanged |= transitiveClosure(implies, u'->', Reduction) # Uses '->', affects '->'
+            takeClosure(implies, u'->', Reduction, delta) # Uses '->', affects '->'
             if not quiet: eprint(u'\tReverse-engineering implications of conjunctions...')
-            iChanged |= unifyOverConjunctions() # Uses '->', affects '->'
-        if (cUpdated or cChanged) or (iUpdated or iChanged):
-            if not quiet: eprint(u'\tImplementing conservativity for implication...')
-            iChanged |= definitionOfConservation() # Uses 'c' and '->', affects '->'
+            unifyOverConjunctions(delta, containing) # Uses '->', affects '->'
+        if not quiet: eprint(u'\tImplementing conservativity for implication...')
+        definitionOfConservation(delta) # Uses 'c' and '->', affects '->'
         
-        if cUpdated or cChanged:
+        if len(delta[u'c']) > 0:
             if not quiet: eprint(u'\tTaking the transitive closure of conservation facts...')
-            cChanged |= transitiveClosure(conservative, u'c', Form) # Uses 'c', affects 'c'
-        if (cUpdated or cChanged) or (iUpdated or iChanged):
-            if not quiet: eprint(u'\tLifting conservation facts over implications...')
-            cChanged |= liftConservation() # Uses 'c' and '->', affects 'c'
-        
-        if verbose:
-            eprint(u'\t\tDuring iteration {0}:'.format(n))
-            if eChanged: eprint(u'\t\t\tEquivalences updated.')
-            if iChanged: eprint(u'\t\t\tImplications updated.')
-            if cChanged: eprint(u'\t\t\tConservation facts updated.')
-            if not eChanged and not iChanged and not cChanged: eprint(u'\t\t\tNothing updated.')
-        
-        eUpdated = eChanged
-        iUpdated = iChanged
-        cUpdated = cChanged
+            takeClosure(conservative, u'c', Form, delta) # Uses 'c', affects 'c'
+        if not quiet: eprint(u'\tLifting conservation facts over implications...')
+        liftConservation(delta) # Uses 'c' and '->', affects 'c'
+        
+        delta = takeDelta(*positiveNames)
+        if verbose: _reportDelta(n, delta, positiveNames)
+    if verbose: _reportClasses()
     if not quiet:
         eprint(u'Finished with positive facts.')
         eprint(u'Elapsed: {0:.6f} s (with {1} repeats)\n'.format(timekeeper() - start, n))
     
     start = timekeeper()
     if not quiet: eprint(u'Deriving negative facts:')
+    splits = conjunctionSplits()
+    negativeNames = {u'-|>': u'Non-implications', u'nc': u'Non-conservation facts'}
+    newlyCondensed = {}
+    for clsCtx in classRoots:
+        newlyCondensed[clsCtx] = [a for a in principlesList if len(classRoots[clsCtx][a]) > 0]
     n = 0
-    niUpdated, ncUpdated = True, True
-    while niUpdated or ncUpdated:
+    delta = takeDelta(*negativeNames)
+    for opCore in positiveUpdates:
+        delta[opCore] = sorted(positiveUpdates[opCore])
+    while any(len(updated) > 0 for updated in delta.values()):
         n += 1
-        niChanged, ncChanged = False, False
+        rulePhase = (u'negative', n)
+        
+        if not quiet: eprint(u'\tCondensing equivalence classes...')
+        condenseContrapositive(u'->', notImplies, u'-|>', Reduction,
+                               condensedPairs(notImplies, Reduction, delta[u'-|>'], newlyCondensed[Reduction])) # Uses '->' and '-|>', affects '-|>'
+        condenseContrapositive(u'c', nonConservative, u'nc', Form,
+                               condensedPairs(nonConservative, Form, delta[u'nc'], newlyCondensed[Form])) # Uses 'c' and 'nc', affects 'nc'
+        newlyCondensed = {Reduction: (), Form: ()}
         
-        if niUpdated or niChanged:
+        if len(delta[u'-|>']) > 0 or len(delta[u'->']) > 0 or len(delta[u'c']) > 0:
             if not quiet: eprint(u'\tApplying transivitity to non-implications...')
-            niChanged |= contrapositiveTransitivity(implies, u'->', notImplies, u'-|>', Reduction) # Uses '->' and '-|>', affects '-|>'
+            contrapositiveTransitivity(implies, u'->', notImplies, u'-|>', Reduction, delta) # Uses '->' and '-|>', affects '-|>'
             if not quiet: eprint(u'\tSplitting non-implications over conjunctions...')
-            niChanged |= contrapositiveConjunction() # Uses '->' and '-|>', affects '-|>'
+            contrapositiveConjunction(delta, splits) # Uses '->' and '-|>', affects '-|>'
             if not quiet: eprint(u'\tImplementing conservativity for non-implication...')
-            niChanged |= contrapositiveConservation() # Uses 'c' and '-|>', affects '-|>'
+            contrapositiveConservation(delta) # Uses 'c' and '-|>', affects '-|>'
         
-        if ncUpdated or ncChanged:
+        if len(delta[u'nc']) > 0 or len(delta[u'c']) > 0:
             if not quiet: eprint(u'\tApplying transivitity to non-conservation facts...')
-            ncChanged |= contrapositiveTransitivity(conservative, u'c', nonConservative, u'nc', Form) # Uses 'c' and 'nc', affects 'nc'
-        if niUpdated or niChanged:
+            contrapositiveTransitivity(conservative, u'c', nonConservative, u'nc', Form, delta) # Uses 'c' and 'nc', affects 'nc'
+        if len(delta[u'-|>']) > 0 or len(delta[u'->']) > 0:
             if not quiet: eprint(u'\tExtracting non-conservation facts from non-implications...')
-            ncChanged |= definitionOfNonConservation() # Uses '->' and '-|>', affects 'nc'
-        if ncUpdated or ncChanged:
+            definitionOfNonConservation(delta) # Uses '->' and '-|>', affects 'nc'
+        if len(delta[u'nc']) > 0 or len(delta[u'->']) > 0:
             if not quiet: eprint(u'\tLifting non-conservation facts over implications...')
-            ncChanged |= liftNonConservation() # Uses 'nc' and '->', affects 'nc'
+            liftNonConservation(delta) # Uses 'nc' and '->', affects 'nc'
         
-        if verbose:
-            eprint(u'\t\tDuring iteration {0}:'.format(n))
-            if niChanged: eprint(u'\t\t\tNon-implications updated.')
-            if ncChanged: eprint(u'\t\t\tNon-conservation facts updated.')
-            if not niChanged and not ncChanged: eprint(u'\t\t\tNothing updated.')
-        
-        niUpdated = niChanged
-        ncUpdated = ncChanged
+        delta = takeDelta(*negativeNames)
+        for opCore in positiveUpdates:
+            delta[opCore] = []
+        if verbose: _reportDelta(n, delta, negativeNames)
     if not quiet:
         eprint(u'Finished with negative facts.')
         eprint(u'Elapsed: {0:.6f} s (with {1} repeats)\n'.format(timekeeper() - start, n))
 
+def _namedArray(array, default):
+    named = SparseRelation(default)
+    for a,row in enumerate(array):
+        aName = principleNames[a]
+        for b,relation in enumerate(row):
+            if relation != 0:
+                named[aName, principleNames[b]] = relation
+    return named
+
+def _indexedArray(named):
+    array = [[0] * len(principleNames) for a in principleNames]
+    for (a,b),relation in named.items():
+        if relation != 0:
+            array[principleIndex[a]][principleIndex[b]] = relation
+    return array
+
 def getDatabase():
+    # Restore principle names; each named fact is built once, so that it is shared
+    #  between justify's keys and the justifications referring to it
+    names = {}
+    def name(fact):
+        try:
+            return names[fact]
+        except KeyError:
+            names[fact] = namedFact(fact)
+            return names[fact]
+    
+    # The complexities are found again from the final justifications, since improving
+    #  a justification leaves the complexities of the facts that rely on it too high
+    complexity = rebuildComplexity({})
+    
+    namedJustify = {}
+    namedComplexity = {}
+    for fact,jst in justify.items():
+        if not isString(jst):
+            jst = tuple(name(f) for f in jst)
+        namedJustify[name(fact)] = jst
+        namedComplexity[name(fact)] = complexity[fact]
+    
+    namedForm = SparseRelation(Form.none)
+    for a,frm in enumerate(form):
+        if frm != Form.none:
+            namedForm[principleNames[a]] = frm
+    
     return {'version': DatabaseVersion,
             'principles': principles,
-            'implication': (implies, notImplies),
-            'conservation': (conservative, nonConservative),
-            'form': form,
+            'implication': (_namedArray(implies, Reduction.none), _namedArray(notImplies, Reduction.none)),
+            'conservation': (_namedArray(conservative, Form.none), _namedArray(nonConservative, Form.none)),
+            'form': namedForm,
             'primary': (primary, primaryIndex),
-            'justify': justify}
+            'justify': namedJustify,
+            'complexity': namedComplexity,
+            'results': knownResults}
+
+def resetDatabase():
+    global principleNames, principleIndex, principles, principlesList
+    principleNames = []
+    principleIndex = {}
+    principles = set()
+    principlesList = []
+    conjunction.clear()
+    
+    global equivalent, implies, notImplies
+    equivalent = []
+    implies = []
+    notImplies = []
+    
+    global conservative, nonConservative
+    conservative = []
+    nonConservative = []
+    
+    global form
+    form = []
+    
+    for parent in classParent.values():
+        del parent[:]
+    
+    internPrinciple(RCAprinciple)
+    
+    global primary, primaryIndex
+    primary = set()
+    primaryIndex = []
+    
+    global justify, justComplexity
+    justify = {}
+    justComplexity = {}
+    
+    recent.clear()
+    pendingFacts.clear()
+    pendingJustify.clear()
+    
+    global knownResults
+    knownResults = emptyResults()
 
 def setDatabase(database):
     if database['version'] != DatabaseVersion:
-        raise VersionError(database['version'], DatabaseVersion)
+        raise VersionError(DatabaseVersion, database['version'])
     
-    global principles, principlesList
-    principles = database['principles']
-    principlesList = sorted(principles)
+    global principleNames, principleIndex, principles, principlesList
+    principles = set(database['principles'])
+    principleNames = sorted(principles)
+    principleIndex = {p:i for i,p in enumerate(principleNames)}
+    principlesList = list(range(len(principleNames)))
+    conjunction.clear()
     
     global implies, notImplies
-    implies, notImplies = database['implication']
+    implies, notImplies = (_indexedArray(named) for named in database['implication'])
     
     global conservative, nonConservative
-    conservative, nonConservative = database['conservation']
+    conservative, nonConservative = (_indexedArray(named) for named in database['conservation'])
     
     global form
-    form = database['form']
+    form = [database['form'].get(a, Form.none) for a in principleNames]
     
     global primary, primaryIndex
     primary, primaryIndex = database['primary']
     
     global justify
-    justify = database['justify']
+    facts = {}
+    def index(fact):
+        try:
+            return facts[fact]
+        except KeyError:
+            facts[fact] = indexedFact(fact)
+            return facts[fact]
+    justify = {}
+    for fact,jst in database['justify'].items():
+        if not isString(jst):
+            jst = tuple(index(f) for f in jst)
+        justify[index(fact)] = jst
+    
+    global knownResults
+    knownResults = database.get('results')
+    
+    # Every known fact is new to the inference rules
+    global equivalent
+    equivalent = [[0] * len(principleNames) for a in principleNames]
+    for parent in classParent.values():
+        parent[:] = principlesList
+    recent.clear()
+    for (a,op,b) in justify:
+        recent[op[1]].add((a,b))
+        if op[1] == u'<->':
+            equivalent[a][b] |= op[0]
+            unionClasses(op[0], a, b)
     
     global justComplexity
     justComplexity = {}
-    def rebuildComplexity(fact):
-        try:
-            return justComplexity[fact]
-        except KeyError:
-            r = 1
+    complexity = database.get('complexity')
+    if complexity is not None:
+        for fact,cplx in complexity.items():
+            justComplexity[index(fact)] = cplx
+    rebuildComplexity()
+
+def rebuildComplexity(known=None):
+    # Find the complexities of justifications not yet in known (by default,
+    #  justComplexity), in one pass without recursion: each fact is finished once all
+    #  of its premises are
+    if known is None:
+        known = justComplexity
+    for fact in justify:
+        if fact in known: continue
+        
+        stack = [fact]
+        while stack:
+            fact = stack[-1]
+            if fact in known:
+                stack.pop()
+                continue
             
-            a,op,b = fact
-            if op != u'form':
-                jst = justify[fact]
-                if not isString(jst):
-                    r += sum(rebuildComplexity(f) for f in jst)
+            jst = justify[fact]
+            if isString(jst):
+                known[fact] = 1
+                stack.pop()
+                continue
             
-            justComplexity[fact] = r
-            return r
-    for fact in justify:
-        rebuildComplexity(fact)
+            pending = [f for f in jst if f[1] != u'form' and f not in known]
+            if pending:
+                stack.extend(pending)
+            else:
+                known[fact] = 1 + sum((1 if f[1] == u'form' else known[f]) for f in jst)
+                stack.pop()
+    return known
 
+binaryDatabase = True
+databaseCodecs = {}
 def dumpDatabase(databaseName, quiet=False):
     if not quiet: eprint(u'Facts known: {0:,d}\n'.format(len(justify)))
     
     start = timekeeper()
     if not quiet: eprint(u'Dumping updated database to binary file...')
-    with open(databaseName, mode='wb') as databaseFile:
-        pickledDatabase = pickle.dumps(getDatabase(), protocol=2)
-        compressedDatabase = zlib.compress(pickledDatabase)
-        databaseFile.write(compressedDatabase)
+    writeDatabase(getDatabase(), databaseName, binary=binaryDatabase, codecs=databaseCodecs)
     
     if not quiet: eprint(u'Elapsed: {0:.6f} s\n'.format(timekeeper() - start))
 
 def loadDatabase(databaseName, quiet=False):
-    with open(databaseName, mode='rb') as databaseFile:
-        compressedDatabase = databaseFile.read()
-        pickledDatabase = zlib.decompress(compressedDatabase)
-        setDatabase(pickle.loads(pickledDatabase))
+    setDatabase(readDatabase(databaseName))
+
+def watchResults(resultsFile, databaseName, quiet=False, verbose=False, interval=1.0):
+    # Keep the database in memory, and update it whenever the results file changes
+    global knownResults
+    
+    lastModified = os.path.getmtime(resultsFile)
+    eprint(u'Watching "{0}" for changes; press Ctrl-C to stop.'.format(resultsFile))
+    try:
+        while True:
+            time.sleep(interval)
+            try:
+                modified = os.path.getmtime(resultsFile)
+            except OSError:
+                continue
+            if modified == lastModified: continue
+            lastModified = modified
+            
+            start = timekeeper()
+            eprint(u'\nResults file changed; updating database...')
+            with open(resultsFile, encoding='utf-8') as f:
+                resultsString = f.read()
+            try:
+                updateResults(resultsString, quiet=quiet, verbose=verbose)
+            except (ParseBaseException, UnjustifiedFactError) as e:
+                eprint(u'Error: {0}'.format(e))
+                continue
+            except ContradictionError as e:
+                eprint(u'Error: {0}'.format(e))
+                knownResults = None # The database is inconsistent; rebuild it on the next change
+                continue
+            dumpDatabase(databaseName, quiet)
+            eprint(u'Database updated; elapsed: {0:.6f} s'.format(timekeeper() - start))
+    except KeyboardInterrupt:
+        eprint(u'\nStopped watching.')
 
 from optparse import OptionParser, OptionGroup
 def main():
@@ -907,12 +2488,30 @@ def main():
     
     parser = OptionParser(u'Usage: %prog [options] results [database_title]', version=u'%prog {0} ({1})'.format(Version, Date))
     
-    parser.set_defaults(quiet=False, verbose=False)
+    parser.set_defaults(quiet=False, verbose=False, closure=u'delta', jobs=1, condense=False, incremental=False, watch=False, pickle=False, codecs=[])
     
     parser.add_option('-q', action='store_true', dest='quiet',
         help = u'Suppress progress/timing indicators.')
     parser.add_option('-v', action='store_true', dest='verbose',
         help = u'Report additional execution information.')
+    parser.add_option('--closure', dest='closure', choices=sorted(closureAlgorithms), metavar='ALGORITHM',
+        help = u'Compute transitive closures with ALGORITHM: delta (default), floyd, numpy, or scc.')
+    parser.add_option('-j', '--jobs', dest='jobs', type='int', metavar='N',
+        help = u'Derive facts in each context, and read large results files, in parallel, with N processes (default 1).')
+    parser.add_option('--rule-stats', dest='rule_stats', metavar='FILE',
+        help = u'Record the time taken and the work done by each inference rule in each iteration, and write the records to FILE, as CSV if FILE ends in .csv and as JSON otherwise.')
+    parser.add_option('--profile-rules', dest='profile_rules', metavar='DIR',
+        help = u'Profile each inference rule separately with cProfile, writing the profiles to DIR (one RULE.prof per rule).')
+    parser.add_option('--condense', action='store_true', dest='condense',
+        help = u'Condense equivalent principles while deriving facts; faster, but justifications may take longer routes.')
+    parser.add_option('-i', action='store_true', dest='incremental',
+        help = u'Update the existing database with only the new results, if possible.')
+    parser.add_option('--watch', action='store_true', dest='watch',
+        help = u'Keep running, and update the database whenever the results file changes.')
+    parser.add_option('--pickle', action='store_true', dest='pickle',
+        help = u'Write the database as a single compressed pickle, rather than in the memory-mapped binary format.')
+    parser.add_option('--codec', action='append', dest='codecs', metavar='[SECTION=]CODEC',
+        help = u'Compress the database sections (or only SECTION) with CODEC: {0}. May be repeated.'.format(u', '.join(codecNames)))
     
     (options, args) = parser.parse_args()
     if len(args)>2:
@@ -922,8 +2521,40 @@ def main():
     
     if options.quiet and options.verbose:
         parser.error(u'Options -q and -v are incompatible.')
+    if options.closure == u'numpy' and not importNumpy():
+        parser.error(u'Option --closure numpy requires the NumPy module.')
+    if options.jobs < 1:
+        parser.error(u'Option -j requires a positive number of processes.')
+    
+    global closureAlgorithm, condenseEquivalences, derivationJobs
+    closureAlgorithm = options.closure
+    condenseEquivalences = options.condense
+    derivationJobs = options.jobs
+    
+    global ruleStats, ruleProfiles
+    if options.rule_stats:
+        ruleStats = []
+    if options.profile_rules:
+        ruleProfiles = OrderedDict()
+    
+    global binaryDatabase
+    binaryDatabase = not options.pickle
+    
+    global databaseCodecs
+    for codecString in options.codecs:
+        if u'=' in codecString:
+            section, codec = codecString.split(u'=', 1)
+            sections = [section]
+        else:
+            codec = codecString
+            sections = sectionNames
+        if codec not in codecNames:
+            parser.error(u'Unknown codec "{0}"; expected one of: {1}.'.format(codec, u', '.join(codecNames)))
+        for section in sections:
+            if section not in sectionNames:
+                parser.error(u'Unknown database section "{0}"; expected one of: {1}.'.format(section, u', '.join(sectionNames)))
+            databaseCodecs[section] = codec
     
-    import os
     resultsFile = args[0]
     if len(args) > 1:
         databaseTitle = args[1]
@@ -939,20 +2570,42 @@ def main():
     if not os.path.exists(resultsFile):
         parser.error(u'Results file "{0}" does not exist.'.format(resultsFile))
     
+    if options.incremental and os.path.exists(databaseName):
+        if not options.quiet: eprint(u'Loading previous database...')
+        try:
+            loadDatabase(databaseName, options.quiet)
+        except (VersionError, FormatError) as e:
+            if not options.quiet: eprint(u'{0}; rebuilding from scratch.'.format(e))
+            resetDatabase()
+    
     with open(resultsFile, encoding='utf-8') as f:
-        parseResults(f.read(), options.quiet)
-    deriveInferences(quiet=options.quiet, verbose=options.verbose)
+        updateResults(f.read(), quiet=options.quiet, verbose=options.verbose)
     dumpDatabase(databaseName, options.quiet)
+    if options.rule_stats:
+        writeRuleStats(options.rule_stats)
+        if not options.quiet: eprint(u'Rule statistics written to "{0}".'.format(options.rule_stats))
+    if options.profile_rules:
+        writeRuleProfiles(options.profile_rules)
+        if not options.quiet: eprint(u'Rule profiles written to "{0}".'.format(options.profile_rules))
     if not options.quiet: eprint(u'Total elapsed time: {0:.6f} s'.format(timekeeper() - absoluteStart))
     
     if options.verbose:
-        try:
-            report = []
-            report.append(u'\tReduction.list: {0}'.format(Reduction.list.cache_info()))
-            report.append(u'\tForm.list: {0}'.format(Form.list.cache_info()))
-            eprint(u'\nCache report: ')
-            eprint('\n'.join(report))
-        except AttributeError:
-            pass
+        eprint(u'\nPropagation report: ')
+        eprint(u'\tLongest queue: {0:,d}'.format(maxQueueDepth))
+        for opCore in (u'<->', u'->', u'-|>', u'c', u'nc'):
+            eprint(u'\tFacts processed ({0}): {1:,d}'.format(opCore, factsProcessed[opCore]))
+        
+        eprint(u'\nRule report: ')
+        eprint(u'\tCombinations examined: {0:,d}'.format(ruleCounters['examined']))
+        eprint(u'\tCalls to addFact: {0:,d}'.format(ruleCounters['addFact']))
+        eprint(u'\tFacts added: {0:,d}'.format(ruleCounters['added']))
+        eprint(u'\tJustifications improved: {0:,d}'.format(ruleCounters['improved']))
+        
+        eprint(u'\nClosure report ({0}): '.format(closureAlgorithm))
+        for opCore in (u'<->', u'->', u'c'):
+            eprint(u'\tTime taken ({0}): {1:.6f} s'.format(opCore, closureTime[opCore]))
+    
+    if options.watch:
+        watchResults(resultsFile, databaseName, quiet=options.quiet, verbose=options.verbose)
 if __name__ == '__main__':
     main()
@@ -21,22 +21,21 @@
 
 from __future__ import print_function
 
-import os, sys
+import os, sys, stat, time, json, shlex, threading
+
+version, versionPoint = sys.version_info[0:2]
+if version >= 3 and versionPoint >= 3:
+    timekeeper = time.perf_counter
+else:
+    timekeeper = time.clock
+importStart = timekeeper()
 
 import itertools
 from io import open
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 
 from version_guard import isString
 
-import zlib
-try:
-    import cPickle as pickle
-except:
-    import pickle
-
-from rmupdater import standardizeFact
-
 def eprint(*args, **kwargs):
     print(*args, file=sys.stderr, **kwargs)
 
@@ -55,6 +54,21 @@ DatabaseVersion = u'5.1'
 
 from rmBitmasks import *
 from renderJustification import *
+from rmDatabase import readDatabase
+
+# Time spent in each phase of startup, for --timings
+phaseTimes = OrderedDict()
+def recordPhase(phase, start):
+    phaseTimes[phase] = phaseTimes.get(phase, 0) + (timekeeper() - start)
+
+recordPhase(u'imports', importStart)
+
+def updater():
+    # rmupdater is only imported when a query or new principle needs it
+    start = timekeeper()
+    import rmupdater
+    recordPhase(u'rmupdater import', start)
+    return rmupdater
 
 _FORM_COLOR = {Form.none: "white",
   Form.weaker(Form.Pi11): "pink",
@@ -62,123 +76,25 @@ _FORM_COLOR = {Form.none: "white",
 _CONS_COLOR = {Form.none: "white",
   Form.weaker(Form.Pi11): "pink",
  Form.weaker(Form.rPi12): "cyan"}
-    
-##################################################################################
-#
-#   GET OPTIONS
-#
-##################################################################################
-    
-eprint(u'\nRM Zoo (v{0})'.format(Version))
-
-from optparse import OptionParser, OptionGroup
-
-parser = OptionParser(u'Usage: %prog [options] [database]', version=u'%prog {0} ({1})'.format(Version, Date))
-
-parser.set_defaults(implications=False,nonimplications=False,omega=False,onlyprimary=False,weak=False,strong=False,showform=False,conservation=False,add_principles=False)
-
-parser.add_option('-i', action='store_true', dest='implications',
-    help=u'Display implications between principles.')
-parser.add_option('-n', action='store_true', dest='nonimplications',
-    help=u'Display non-implications between principles.')
-parser.add_option('-w', action='store_true', dest='weak',
-    help=u'Display weakest non-redundant open implications.')
-parser.add_option('-s', action='store_true', dest='strong',
-    help=u'Display strongest non-redundant open implications.')
-parser.add_option('-t', dest='reducibility', default='RCA',
-    help=u'Display facts relative to REDUCIBILITY-implications.')
-parser.add_option('-o', action='store_const', dest='reducibility', const='w',
-    help=u'Display only facts that hold in omega models.')
-parser.add_option('-p', action='store_true', dest='onlyprimary',
-    help=u'Display only facts about primary principles.')
-    
-parser.add_option('-f', action='store_true', dest='showform',
-    help=u'Indicate syntactic forms of principles.')
-parser.add_option('-c', action='store_true', dest='conservation',
-    help=u'Display known conservation results.')
-    
-parser.add_option('-r', dest='restrict_string', metavar='CLASS',
-    help=u'Restrict to only the principles in CLASS.')
-parser.add_option('--omit', dest='omit_string', metavar='CLASS',
-    help=u'Omit all principles in CLASS.')
-
-parser.add_option('-q', dest='query_string', metavar='FACT',
-    help=u'Show whether FACT is known, and if so, its justification.')
-parser.add_option('-F', dest='query_file', metavar='FILE',
-    help=u'Query whether all facts in FILE are known, and return a list of all unknown facts.')
-
-parser.add_option('--force', action='store_true', dest='add_principles',
-    help=u'Allow queries involving novel conjunctions from the database. (WARNING: slow)')
-
-(options, args) = parser.parse_args()
-
-Implications = options.implications
-NonImplications = options.nonimplications
-Weak = options.weak
-Strong = options.strong
-Reducibility = Reduction.fromString(options.reducibility)
-OnlyPrimary = options.onlyprimary
-ShowForm = options.showform
-Conservation = options.conservation
-Restrict = options.restrict_string
-Omissions = options.omit_string
-if Restrict:
-    rSet = set()
-    for p in Restrict.split():
-        splitP = p.split(u'+')
-        setP = set(splitP)
-        p = u'+'.join(sorted(setP))
-        
-        rSet.add(p)
-        rSet.update(splitP)
-    Restrict = rSet
-if Omissions:
-    Omissions = set(Omissions.split())
-Query = options.query_string
-QueryFile = options.query_file
-AddPrinciples = options.add_principles
-    
-# Give errors if bad options chosen
-
-if not Implications and not NonImplications and not OnlyPrimary and not Restrict and not Weak and not Strong and not ShowForm and not Conservation and not Query and not QueryFile:
-    parser.error(u'No options selected.')
-if OnlyPrimary:
-    if not Implications and not NonImplications and not Weak and not Strong and not ShowForm and not Conservation:
-        parser.error(u'Option -p only works if one of -i, -n, -w, -s, -f, or -c is selected.')
-if Restrict or Omissions:
-    if Restrict and Omissions:
-        parser.error(u'Options -r and --omit are incompatible.')
-    if not Implications and not NonImplications and not Weak and not Strong and not ShowForm and not Conservation:
-        parser.error(u'Options -r and --omit only work if one of -i, -n, -w, -s, -f, or -c is selected.')
-if Query:
-    if Implications or NonImplications or Weak or Strong or ShowForm or Conservation or Restrict or OnlyPrimary or QueryFile:
-        parser.error(u'Option -q does not work with any other option (except --force).')
-if QueryFile:
-    if Implications or NonImplications or Weak or Strong or ShowForm or Conservation or Restrict or OnlyPrimary or Query:
-        parser.error(u'Option -F does not work with any other option (except --force).')
-
-if len(args) > 1:
-    parser.error(u'Too many arguments.')
-if len(args) > 0:
-    databaseTitle = args[0]
-else:
-    eprint(u'No database title specified; defaulting to "database".')
-    databaseTitle = 'database'
-
-if os.path.splitext(databaseTitle)[1] == '':
-    databaseName = databaseTitle + os.extsep + 'dat'
-else:
-    databaseName = databaseTitle
 
+def formColor(colors, frm):
+    # The color of the strongest form in frm with a color of its own; colors are keyed by
+    #  the forms implied by that form
+    colored = {}
+    for key, color in colors.items():
+        colored[Form.strongest(key)] = color
     
+    coloredForms = Form.none
+    for f in colored:
+        coloredForms |= f
+    return colored[Form.strongest(frm & coloredForms)]
+
 ##################################################################################
 #
 #   IMPORT AND ORGANIZE DATA
 #
 ##################################################################################
 
-eprint(u'Importing and organizing data...')
-
 class VersionError(Exception):
     def __init__(self, targetVersion, actualVersion):
         super(VersionError, self).__init__(u'Version mismatch: found v{0}, targeting v{1}'.format(actualVersion, targetVersion))
@@ -189,6 +105,7 @@ conservative, nonConservative = {}, {}
 form = {}
 primary, primaryIndex = {}, {}
 justify = {}
+complexity = None
 def getDatabase():
     return {'version': DatabaseVersion,
             'principles': principles,
@@ -196,9 +113,18 @@ def getDatabase():
             'conservation': (conservative, nonConservative),
             'form': form,
             'primary': (primary, primaryIndex),
-            'justify': justify}
+            'justify': justify,
+            'complexity': complexity}
+
+# Principles equivalent to each principle, under each reduction; found when needed
+equivalent = {}
+def equivalentPrinciples(a, reduction):
+    try:
+        return equivalent[(a, reduction)]
+    except KeyError:
+        equivalent[(a, reduction)] = set(b for b in principles if Reduction.isPresent(reduction, implies[(a,b)] & implies[(b,a)]))
+        return equivalent[(a, reduction)]
 
-equivalent = defaultdict(set)
 def setDatabase(database):
     if database['version'] != DatabaseVersion:
         raise VersionError(DatabaseVersion, database['version'])
@@ -208,12 +134,7 @@ def setDatabase(database):
     
     global implies, notImplies
     implies, notImplies = database['implication']
-    
-    global equivalent
-    for a in principles:
-        for b in principles:
-            for r in Reduction.list(implies[(a,b)] & implies[(b,a)]):
-                equivalent[(a, r)].add(b)
+    equivalent.clear()
     
     global conservative, nonConservative
     conservative, nonConservative = database['conservation']
@@ -224,15 +145,22 @@ def setDatabase(database):
     global primary, primaryIndex
     primary, primaryIndex = database['primary']
     
-    global justify
+    global justify, complexity
     justify = database['justify']
+    complexity = database.get('complexity')
+    printedJustify.clear()
+
+# Identifies the version of the database file that was last loaded
+databaseStamp = None
+def fileStamp(databaseName):
+    stat = os.stat(databaseName)
+    return (stat.st_ino, stat.st_mtime, stat.st_size)
 
 def loadDatabase(databaseName, quiet=False):
-    with open(databaseName, mode='rb') as databaseFile:
-        compressedDatabase = databaseFile.read()
-        pickledDatabase = zlib.decompress(compressedDatabase)
-        setDatabase(pickle.loads(pickledDatabase))
-loadDatabase(databaseName)
+    global databaseStamp
+    stamp = fileStamp(databaseName)
+    setDatabase(readDatabase(databaseName))
+    databaseStamp = stamp
 
 def knownEquivalent(a, reduction, justification=True):
     if a in principles:
@@ -249,7 +177,7 @@ def knownEquivalent(a, reduction, justification=True):
             return None
     
     aPrime = None
-    for equiv in itertools.product(*(equivalent[(p, reduction)] for p in splitA)):
+    for equiv in itertools.product(*(equivalentPrinciples(p, reduction) for p in splitA)):
         aPrime = u'+'.join(sorted(set(equiv)))
         if aPrime in principles:
             if justification:
@@ -262,8 +190,8 @@ def knownEquivalent(a, reduction, justification=True):
         return (None, None)
     else:
         return None
-    
-def queryDatabase(a, op, b, justification=True):
+
+def queryDatabase(a, op, b, justification=True, proof=u'tree'):
     if op[1] in (u'c', u'nc'):
         reduction = Reduction.RCA
     else:
@@ -305,163 +233,280 @@ def queryDatabase(a, op, b, justification=True):
         if not justification:
             return True
         else:
-            r = []
-            if a != aPrime or b != bPrime:
-                r.append(u'\n')
-                if a != aPrime:
-                    r.append(u'NOTE: {0} is not a known principle, but is equivalent to {1}\n'.format(a, aPrime))
-                if b != bPrime:
-                    r.append(u'NOTE: {0} is not a known principle, but is equivalent to {1}\n'.format(b, bPrime))
-            
+            notes = []
+            facts = []
             if a != aPrime:
-                r.append(printJustification((a, (reduction, u'<->'), aPrime), justify))
+                notes.append(u'NOTE: {0} is not a known principle, but is equivalent to {1}'.format(a, aPrime))
+                facts.append((a, (reduction, u'<->'), aPrime))
             if b != bPrime:
-                r.append(printJustification((b, (reduction, u'<->'), bPrime), justify))
-            r.append(printJustification((aPrime, op, bPrime), justify))
+                notes.append(u'NOTE: {0} is not a known principle, but is equivalent to {1}'.format(b, bPrime))
+                facts.append((b, (reduction, u'<->'), bPrime))
+            facts.append((aPrime, op, bPrime))
+            
+            if proof == u'json':
+                steps, conclusions = proofSteps(facts, justify)
+                return {'notes': notes, 'steps': steps, 'conclusions': conclusions}
+            
+            r = []
+            if len(notes) > 0:
+                r.append(u'\n')
+                r.extend(note + u'\n' for note in notes)
+            if proof == u'dag':
+                r.append(printProof(facts, justify))
+            else:
+                r.extend(printJustification(f, justify) for f in facts)
             return u''.join(r)
     else:
         return False
 
 ##################################################################################
 #
-#   IF RESTRICT OR QUERY: VALIDATE CLASS
+#   QUERY GRAMMAR
 #
 ##################################################################################
 
-if Restrict:
+# pyparsing is only imported, and the grammar only built, when a query is parsed
+_queryGrammar = None
+def queryGrammar():
+    global _queryGrammar
+    if _queryGrammar is not None:
+        return _queryGrammar
     
-    for a in Restrict:  # Give warnings if CLASS is not a subset of principles
-        if a not in principles:
-            error(+a+u' is not in the database.')
-
-if Omissions:
-    Restrict = principles - Omissions
+    start = timekeeper()
+    from pyparsing import Word, alphas, alphanums, NoMatch, Literal, Optional, Suppress, Group, StringEnd, QuotedString, quotedString, removeQuotes, restOfLine
+    recordPhase(u'pyparsing import', start)
+    
+    start = timekeeper()
+    name = Word( alphas+"_+^{}\\$", alphanums+"_+^{}$\\")
+    
+    _reductionName = NoMatch()
+    for r in Reduction:
+        if r != Reduction.none:
+            _reductionName |= Literal(r.name)
+    for r in Reduction.alias:
+        if r != u'':
+            _reductionName |= Literal(r)
+    _reductionType = _reductionName.setParseAction(lambda s,l,t: [Reduction.fromString(t[0])])
+    reductionType = Optional(_reductionType, default=Reduction.RCA)
+    postfixReductionType = Optional(Suppress(Literal("_")) + _reductionType, default=Reduction.RCA)
+    
+    implication = (reductionType + Literal("->")) | (Literal("=>") + postfixReductionType).setParseAction(lambda s,l,t: [t[1], "->"])
+    nonImplication = (reductionType + Literal("-|>")) | (Literal("=/>") + postfixReductionType).setParseAction(lambda s,l,t: [t[1], "-|>"])
+    equivalence = (reductionType + Literal("<->")) | (Literal("<=>") + postfixReductionType).setParseAction(lambda s,l,t: [t[1], "<->"])
+    
+    reduction = (Literal("<=") + postfixReductionType).setParseAction(lambda s,l,t: [t[1], "<="])
+    nonReduction = (Literal("</=") + postfixReductionType).setParseAction(lambda s,l,t: [t[1], "</="])
+    
+    _formName = NoMatch()
+    for f in Form:
+        if f != Form.none:
+            _formName |= Literal(f.name)
+    formType = _formName.setParseAction(lambda s,l,t: [Form.fromString(t[0])])
+    
+    conservation = formType + Literal("c")
+    nonConservation = (Literal("n") + formType + Literal("c")).setParseAction(lambda s,l,t: [t[1], "nc"])
+    
+    operator = implication | nonImplication | reduction | nonReduction | equivalence | conservation | nonConservation
+    
+    parenth = Literal('"')
+    justification = QuotedString('"""',multiline=True) | quotedString.setParseAction(removeQuotes)
+    
+    # Queries, lines of -F files, and requests are all facts as in the results file
+    #  (where "a is F" may also be written for "a form F")
+    formDef = (Literal('form') | Literal('is').setParseAction(lambda s,l,t: [u'form'])) + formType
+    comment = Suppress(Literal('#') + restOfLine)
+    fact = name + ((Group(operator) + name + Suppress(Optional(justification))) | formDef | (Literal('is') + Literal('primary'))) + Optional(comment) + StringEnd()
+    
+    _queryGrammar = fact
+    recordPhase(u'grammar', start)
+    return _queryGrammar
 
 ##################################################################################
 #
-#   IF QUERY: GIVE ANSWER
+#   QUERIES
 #
 ##################################################################################
 
-from pyparsing import *
-
-name = Word( alphas+"_+^{}\\$", alphanums+"_+^{}$\\")
-
-_reductionName = NoMatch()
-for r in Reduction:
-    if r != Reduction.none:
-        _reductionName |= Literal(r.name)
-for r in Reduction.alias:
-    if r != u'':
-        _reductionName |= Literal(r)
-_reductionType = _reductionName.setParseAction(lambda s,l,t: [Reduction.fromString(t[0])])
-reductionType = Optional(_reductionType, default=Reduction.RCA)
-postfixReductionType = Optional(Suppress(Literal("_")) + _reductionType, default=Reduction.RCA)
-
-implication = (reductionType + Literal("->")) | (Literal("=>") + postfixReductionType).setParseAction(lambda s,l,t: [t[1], "->"])
-nonImplication = (reductionType + Literal("-|>")) | (Literal("=/>") + postfixReductionType).setParseAction(lambda s,l,t: [t[1], "-|>"])
-equivalence = (reductionType + Literal("<->")) | (Literal("<=>") + postfixReductionType).setParseAction(lambda s,l,t: [t[1], "<->"])
-
-reduction = (Literal("<=") + postfixReductionType).setParseAction(lambda s,l,t: [t[1], "<="])
-nonReduction = (Literal("</=") + postfixReductionType).setParseAction(lambda s,l,t: [t[1], "</="])
-
-_formName = NoMatch()
-for f in Form:
-    if f != Form.none:
-        _formName |= Literal(f.name)
-formType = _formName.setParseAction(lambda s,l,t: [Form.fromString(t[0])])
-
-conservation = formType + Literal("c")
-nonConservation = (Literal("n") + formType + Literal("c")).setParseAction(lambda s,l,t: [t[1], "nc"])
-
-operator = implication | nonImplication | reduction | nonReduction | equivalence | conservation | nonConservation
-
-if Query:
-    query = name + Group(operator) + name + StringEnd()
-    Query = query.parseString(Query)
+def parseQuery(q):
+    f = parseFact(q)
+    if f is None:
+        error(u'"{0}" is not a fact to query.'.format(q))
+    return f
+
+def addPrinciples(newPrinciples):
+    rmupdater = updater()
+    rmupdater.setDatabase(getDatabase())
+    for p in newPrinciples:
+        rmupdater.addPrinciple(p)
+    rmupdater.deriveInferences(quiet=False)
+    setDatabase(rmupdater.getDatabase())
+
+def forceQuery(a, b):
+    if a in principles and b in principles:
+        return
     
-    op = Query[1]
-    if not isString(op):
-        op = tuple(op)
-    a, op, b = standardizeFact(Query[0], op, Query[2])
-    
-    if not (a in principles and b in principles) and AddPrinciples:
-        abort = False
-        for p in a.split(u'+'):
-            if p not in principles:
-                abort = True
-                break
-        for p in b.split(u'+'):
-            if p not in principles:
-                abort = True
-                break
-        if not abort:
-            eprint(u'Adding new principles...')
-            import rmupdater
-            rmupdater.setDatabase(getDatabase())
-            if a not in principles:
-                rmupdater.addPrinciple(a)
-            if b not in principles:
-                rmupdater.addPrinciple(b)
-            rmupdater.principlesList = sorted(rmupdater.principles)
-            rmupdater.deriveInferences(quiet=False)
-            setDatabase(rmupdater.getDatabase())
-    
-    jst = queryDatabase(a, op, b)
+    for p in a.split(u'+'):
+        if p not in principles:
+            return
+    for p in b.split(u'+'):
+        if p not in principles:
+            return
+    
+    eprint(u'Adding new principles...')
+    newPrinciples = []
+    if a not in principles:
+        newPrinciples.append(a)
+    if b not in principles:
+        newPrinciples.append(b)
+    addPrinciples(newPrinciples)
+
+_opposite = {u'->': u'-|>',
+             u'-|>': u'->',
+             u'c': u'nc',
+             u'nc': u'c'}
+def answerQuery(a, op, b, justification=True, proof=u'tree'):
+    answer = {'fact': printFact(a, op, b)}
+    
+    jst = queryDatabase(a, op, b, justification, proof)
     if jst:
-        print(u'Justification for the fact "{0}":\n{1}'.format(printFact(a, op, b), jst))
+        answer['status'] = u'known'
+        if justification:
+            answer['justification'] = jst
+        return answer
+    
+    # Look for a known fact contradicting this one
+    if op[1] == u'<->':
+        opp = (op[0], u'-|>')
+        contradictions = [(a, opp, b), (b, opp, a)]
+    elif op[1] in _opposite:
+        contradictions = [(a, (op[0], _opposite[op[1]]), b)]
     else:
-        print(u'\nError: Unknown fact "{0}"'.format(printFact(a, op, b)))
-        opp = None # opposite operation
-        if op[1] == u'->':
-            opp = (op[0], u'-|>')
-        elif op[1] == u'-|>':
-            opp = (op[0], u'->')
-        elif op[1] == u'c':
-            opp = (op[0], u'nc')
-        elif op[1] == u'nc':
-            opp = (op[0], u'c')
-        
-        if opp is not None:
-            jst = queryDatabase(a, opp, b)
-            if jst:
-                print(u'CONTRADICTING fact known! Justification for the fact "{0}":\n{1}'.format(printFact(a, opp, b), jst))
-        if op[1] == u'<->':
-            opp = (op[0], u'-|>')
-            jst = queryDatabase(a, opp, b)
-            if jst:
-                print(u'CONTRADICTING fact known! Justification for the fact "{0}":\n{1}'.format(printFact(a, opp, b), jst))
-            else:
-                jst = queryDatabase(b, opp, a)
-                if jst:
-                    print(u'CONTRADICTING fact known! Justification for the fact "{0}":\n{1}'.format(printFact(b, opp, a), jst))
+        contradictions = []
+    
+    answer['status'] = u'unknown'
+    for c in contradictions:
+        jst = queryDatabase(c[0], c[1], c[2], justification, proof)
+        if jst:
+            answer['status'] = u'contradicted'
+            answer['contradiction'] = printFact(*c)
+            if justification:
+                answer['justification'] = jst
+            break
+    return answer
+
+def printAnswer(answer, proof=u'tree'):
+    if proof == u'json':
+        print(json.dumps(answer, sort_keys=True))
+    elif answer['status'] == u'known' and 'justification' not in answer:
+        print(u'The fact "{0}" is known.'.format(answer['fact']))
+    elif answer['status'] == u'known':
+        print(u'Justification for the fact "{0}":\n{1}'.format(answer['fact'], answer['justification']))
+    else:
+        print(u'\nError: Unknown fact "{0}"'.format(answer['fact']))
+        if answer['status'] == u'contradicted':
+            print(u'CONTRADICTING fact known! Justification for the fact "{0}":\n{1}'.format(answer['contradiction'], answer['justification']))
+
+def parseFact(q):
+    fact = queryGrammar()
+    Q = fact.parseString(q)
+    if Q[1] == u'is' and Q[2] == u'primary':
+        return None
+    
+    a,op,b = Q
+    if not isString(op):
+        op = tuple(op)
+        a,op,b = updater().standardizeFact(a, op, b)
+    return (a, op, b)
 
-if QueryFile:
-    parenth = Literal('"')
-    justification = QuotedString('"""',multiline=True) | quotedString.setParseAction(removeQuotes)
+def answerFact(a, op, b, justification=True, proof=u'tree'):
+    if op != u'form':
+        return answerQuery(a, op, b, justification, proof)
     
-    fact = name + ((Group(operator) + name + Suppress(Optional(justification))) | (Literal('form') + formType) | (Literal('is') + Literal('primary')))
+    if a not in principles:
+        error(u'{0} is an unknown principle.'.format(a))
+    if Form.isPresent(b, form[a]):
+        return {'fact': printFact(a, op, b), 'status': u'known'}
+    else:
+        return {'fact': printFact(a, op, b), 'status': u'unknown'}
+
+def errorMessage(e):
+    # The message reported for a failed request; pyparsing's own messages spell out
+    #  the whole grammar
+    if 'pyparsing' in sys.modules:
+        from pyparsing import ParseBaseException
+        if isinstance(e, ParseBaseException):
+            return u'Could not parse "{0}" (column {1})'.format(e.line, e.col)
+    return str(e)
+
+def _answerLine(request):
+    q, justification, proof = request
     
-    queries = []
-    with open(QueryFile, encoding='utf-8') as f:
-        for q in f.readlines():
-            q = q.strip()
-            if len(q) == 0 or q[0] == u'#': continue
-            
-            Q = fact.parseString(q)
-            if Q[1] == u'is' and Q[2] == u'primary': continue
-            
-            a,op,b = Q
-            if not isString(op):
-                op = tuple(op)
-                a,op,b = standardizeFact(a, op, b)
-            
-            queries.append((a, op, b, q))
+    answer = {'query': q}
+    try:
+        f = parseFact(q)
+        if f is None:
+            return None
+        answer.update(answerFact(*f, justification=justification, proof=proof))
+    except Exception as e:
+        answer['error'] = errorMessage(e)
+    return answer
+
+def _forkPool(jobs):
+    import multiprocessing
+    try:
+        context = multiprocessing.get_context('fork')
+    except AttributeError: # Python 2 always forks
+        context = multiprocessing
+    except ValueError: # No fork on this platform
+        return None
+    return context.Pool(jobs)
+
+def answerLines(lines, justification=False, jobs=1, proof=u'tree'):
+    # Worker processes are forked after the database is loaded, so they share it
+    requests = ((q, justification, proof) for q in lines)
+    pool = None
+    if jobs > 1:
+        pool = _forkPool(jobs)
     
-    if AddPrinciples:
+    if pool is None:
+        for request in requests:
+            answer = _answerLine(request)
+            if answer is not None:
+                yield answer
+    else:
+        try:
+            for answer in pool.imap(_answerLine, requests, chunksize=64):
+                if answer is not None:
+                    yield answer
+        finally:
+            pool.terminate()
+
+def checkQueryFile(queryFile, addNew=False, asJSON=False, justification=False, jobs=1, proof=u'tree'):
+    if queryFile == u'-':
+        f = sys.stdin
+    else:
+        f = open(queryFile, encoding='utf-8')
+    
+    with f:
+        lines = (q.strip() for q in f)
+        lines = [q for q in lines if len(q) > 0 and q[0] != u'#']
+    
+    # Parse with the same grammar in every worker process
+    queryGrammar()
+    updater()
+    from pyparsing import ParseException
+    
+    if addNew:
         newPrinciples = set()
         unknownPrinciples = set()
-        for (a, op, b, q) in queries:
+        for q in lines:
+            try:
+                Q = parseFact(q)
+            except ParseException:
+                continue
+            if Q is None: continue
+            a,op,b = Q
+            
             unknown = False
             
             Q = a.split(u'+')
@@ -479,85 +524,90 @@ if QueryFile:
             warning(u'Unknown principles: {0}\n'.format(u', '.join(sorted(unknownPrinciples))))
         if len(newPrinciples) > 0:
             eprint(u'Adding {0:,d} new principles...'.format(len(newPrinciples)))
-            import rmupdater
-            rmupdater.setDatabase(getDatabase())
-            for p in newPrinciples:
-                rmupdater.addPrinciple(p)
-            rmupdater.principlesList = sorted(rmupdater.principles)
-            rmupdater.deriveInferences(quiet=False)
-            setDatabase(rmupdater.getDatabase())
-    
-    for (a, op, b, q) in queries:
+            addPrinciples(newPrinciples)
+    
+    for answer in answerLines(lines, justification, jobs, proof):
+        if asJSON:
+            print(json.dumps(answer, sort_keys=True))
+            continue
+        
         s = u''
-        known = False
-        if op == u'form':
-            known = Form.isPresent(b, form[a])
-        else:
-            try:
-                known = queryDatabase(a, op, b, justification=False)
-            except Exception as e:
-                s += u'\n' + str(e)
-            
-        if not known:
-            s += u'\nUnknown fact: ' + q
-            
+        if 'error' in answer:
+            s += u'\n' + answer['error']
+        if answer.get('status') != u'known':
+            s += u'\nUnknown fact: ' + answer['query']
+        
         if len(s) > 0:
             warning(s)
     eprint(u'\nFinished.')
 
 ##################################################################################
 #
-#   IF RESTRICT: DELETE PRINCIPLES NOT IN CLASS
-#
-##################################################################################
-
-if Restrict:
-    principles &= Restrict
-    
-##################################################################################
-#
-#   IF DIAGRAM: REMOVE REDUNDANT IMPLICATIONS AND NON-IMPLICATIONS 
+#   DIAGRAMS
 #
 ##################################################################################
 
-if Implications or NonImplications or Weak or Strong:
+def restrictedPrinciples(Restrict, Omissions):
+    if Restrict:
+        rSet = set()
+        for p in Restrict.split():
+            splitP = p.split(u'+')
+            setP = set(splitP)
+            p = u'+'.join(sorted(setP))
+            
+            rSet.add(p)
+            rSet.update(splitP)
+        
+        for a in rSet:  # Give warnings if CLASS is not a subset of principles
+            if a not in principles:
+                error(a+u' is not in the database.')
+        return rSet
+    elif Omissions:
+        return principles - set(Omissions.split())
+    else:
+        return None
 
-    eprint(u'Removing redundant facts for clarity...')
-    
-    # Create print versions of functions
-    
-    simpleImplies = defaultdict(bool)
-    printImplies = defaultdict(bool)
+def _bits(mask):
+    # Positions of the bits set in mask
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+def condensePrinciples(Reducibility, principles, primary, primaryIndex):
+    # Condense principles into classes of equivalent principles, each with a
+    #  unique primary principle (updating primary and primaryIndex), and return
+    #  the relations between the primary principles as bitset rows
     
-    simpleNotImplies = defaultdict(bool)
-    printNotImplies = defaultdict(bool)
-    
-    equivalent = defaultdict(bool)
-    
-    simpleConservative = defaultdict(noForm)
-    printConservative = defaultdict(noForm)
-    
-    printWeakOpen = defaultdict(bool)
-    printStrongOpen = defaultdict(bool)
+    # Read the relations between principles once, as sets of related principles
     
+    impliesSet = dict((a, set()) for a in principles)
+    notImpliesSet = dict((a, set()) for a in principles)
+    consForm = {}
     for a in principles:
         for b in principles:
             if a == b: # Remove self-relations to not confuse DOT reader
                 continue
             
-            simpleImplies[(a,b)] = Reduction.isPresent(Reducibility, implies[(a,b)])
-            printImplies[(a,b)] = simpleImplies[(a,b)]
-            
-            simpleNotImplies[(a,b)] = Reduction.isPresent(Reducibility, notImplies[(a,b)])
-            printNotImplies[(a,b)] = simpleNotImplies[(a,b)]
-            
-            if simpleImplies[(a,b)] and simpleImplies[(b,a)]:
-                equivalent[(a,b)] = True
-                equivalent[(b,a)] = True
-            
-            simpleConservative[(a,b)] = conservative[(a,b)]
-            printConservative[(a,b)] = simpleConservative[(a,b)]
+            if Reduction.isPresent(Reducibility, implies[(a,b)]):
+                impliesSet[a].add(b)
+            if Reduction.isPresent(Reducibility, notImplies[(a,b)]):
+                notImpliesSet[a].add(b)
             
+            frm = conservative[(a,b)]
+            if frm != Form.none:
+                consForm[(a,b)] = frm
+    
+    # Condense the principles into classes of equivalent principles
+    
+    equivClass = {}
+    for a in principles:
+        equivClass[a] = set(b for b in impliesSet[a] if a in impliesSet[b])
+    equivalent = defaultdict(bool)
+    for a in principles:
+        for b in equivClass[a]:
+            equivalent[(a,b)] = True
+    
     # Assign primaries and make them unique
     
     for a in sorted(principles):
@@ -583,97 +633,160 @@ if Implications or NonImplications or Weak or Strong:
             primaryIndex.remove(x)
         primary.difference_update(toRemove)
     
-    for a in principles: # Remove facts involving non-primary principles
-        if a not in primary:
-            for b in principles:
-                printImplies[(a,b)] = False
-                printImplies[(b,a)] = False
-                
-                printNotImplies[(a,b)] = False
-                printNotImplies[(b,a)] = False
-                
-                printConservative[(a,b)] = Form.none
-
-    # Remove redundant implications
-            
-    for a in primary:
-        for b in primary:
-            for c in primary: # Remove implications obtained by transitivity
-                if simpleImplies[(b,a)] and simpleImplies[(a,c)]:
-                    printImplies[(b,c)] = False
-
-    # Remove redundant non-implications
-
-    for a in primary:
-        for b in primary:
-            if b == a: continue
-            for c in primary:
-                if c == a or c == b: continue
-                
-                if simpleNotImplies[(a,c)] and simpleImplies[(b,c)]: # If a -|> c, but b -> c, then a -|> b.
-                    printNotImplies[(a,b)] = False
-                if simpleImplies[(c,a)] and simpleNotImplies[(c,b)]: # If c -> a, but c -|> b, then a -|> b.
-                    printNotImplies[(a,b)] = False
-                
-    # Remove redundant conservation facts
-
-    for a in primary:  # Remove conservation results obtained by transitivity
-        for b in primary:
-            if b == a: continue
-            for c in primary:
-                if c == a or c == b: continue
-                
-                if simpleImplies[(a,b)]:
-                    printConservative[(b,c)] &= ~simpleConservative[(a,c)]
-                if simpleImplies[(b,c)]:
-                    printConservative[(a,b)] &= ~simpleConservative[(a,c)]
+    # Represent the relations between primary principles (one from each class) as
+    #  bitsets, with a bit for each primary principle
     
-    # Generate open implications
-
-    for a in primary:
-        for b in primary:
-            if b == a: continue
-            
-            if not simpleImplies[(a,b)] and not simpleNotImplies[(a,b)]:
-                printWeakOpen[(a,b)] = True
-                printStrongOpen[(a,b)] = True
-
-    for a in primary:
-        for b in primary:
-            if b == a: continue
-            for c in primary:
-                if c == a or c == b: continue
-                
-                if simpleImplies[(c,a)] and not simpleImplies[(c,b)] and not simpleNotImplies[(c,b)]: # c -> a, c ? b
-                    printWeakOpen[(a,b)] = False
-                if simpleImplies[(c,a)] and not simpleImplies[(b,a)] and not simpleNotImplies[(b,a)]: # c -> a, b ? a
-                    printWeakOpen[(b,c)] = False
-                
-                if simpleImplies[(a,c)] and not simpleImplies[(c,b)] and not simpleNotImplies[(c,b)]: # a -> c, c ? b
-                    printStrongOpen[(a,b)] = False
-                if simpleImplies[(a,c)] and not simpleImplies[(b,a)] and not simpleNotImplies[(b,a)]: # a -> c, b ? a
-                    printStrongOpen[(b,c)] = False
+    shown = list(primary)
+    bit = dict((a, 1 << i) for i,a in enumerate(shown))
     
-    # Find all equivalent principles
+    def bitset(related):
+        r = 0
+        for b in related:
+            if b in bit:
+                r |= bit[b]
+        return r
     
-    equivSet = defaultdict(set)
-    for a in primary:
-        for b in principles:
-            if equivalent[(a,b)]:
-                equivSet[a].add(b)
- 
-##################################################################################
-#
-#   IF DIAGRAM: PRINT OUT THE DOT FILE
-#
-##################################################################################   
-
-if Implications or NonImplications or Weak or Strong or ShowForm or Conservation:
-
-    eprint(u'Printing DOT file...')
-    eprint("\tDiagram contains {0} non-equivalent principles.".format(len(primary)))
-
-    print("""//
+    impliesRow = [bitset(impliesSet.get(a, ())) for a in shown]
+    notImpliesRow = [bitset(notImpliesSet.get(a, ())) for a in shown]
+    impliedRow = [0] * len(shown) # principles implying each principle
+    for i,a in enumerate(shown):
+        for j in _bits(impliesRow[i]):
+            impliedRow[j] |= bit[a]
+    
+    return shown, impliesRow, notImpliesRow, impliedRow, equivalent, consForm
+
+def openFrontier(impliesRow, notImpliesRow, impliedRow):
+    # Rows of the weakest and strongest open implications between the principles
+    #  of the given bitset rows
+    n = len(impliesRow)
+    everything = (1 << n) - 1
+    openRow = [everything & ~((1 << i) | impliesRow[i] | notImpliesRow[i]) for i in range(n)]
+    
+    weakRow = []
+    strongRow = []
+    for i in range(n):
+        notWeakest = 0
+        notStrongest = 0
+        for c in _bits(impliedRow[i]): # c -> a, c ? b
+            notWeakest |= openRow[c]
+        for c in _bits(impliesRow[i]): # a -> c, c ? b
+            notStrongest |= openRow[c]
+        for j in _bits(openRow[i]): # a ? c, and b -> c (weakest) or c -> b (strongest)
+            notWeakest |= impliedRow[j]
+            notStrongest |= impliesRow[j]
+        weakRow.append(openRow[i] & ~notWeakest)
+        strongRow.append(openRow[i] & ~notStrongest)
+    return weakRow, strongRow
+
+def openImplications(reducibility=u'RCA', restrict=None, omit=None):
+    # The weakest and strongest open implications between primary principles
+    #  of the loaded database, as sets of pairs (a,b) for which a -> b is open;
+    #  the same as the -w and -s diagrams, but without writing DOT
+    shownPrinciples = set(principles)
+    Restrict = restrictedPrinciples(restrict, omit)
+    if Restrict:
+        shownPrinciples &= Restrict
+    
+    shown, impliesRow, notImpliesRow, impliedRow, _, _ = condensePrinciples(
+        Reduction.fromString(reducibility), shownPrinciples, set(primary), list(primaryIndex))
+    weakRow, strongRow = openFrontier(impliesRow, notImpliesRow, impliedRow)
+    
+    weakOpen = set((a,shown[j]) for i,a in enumerate(shown) for j in _bits(weakRow[i]))
+    strongOpen = set((a,shown[j]) for i,a in enumerate(shown) for j in _bits(strongRow[i]))
+    return weakOpen, strongOpen
+
+def diagram(options):
+    # Work on copies, so the loaded database can answer later requests
+    return drawDiagram(options, set(principles), set(primary), list(primaryIndex))
+
+def drawDiagram(options, principles, primary, primaryIndex):
+    Implications = options.implications
+    NonImplications = options.nonimplications
+    Weak = options.weak
+    Strong = options.strong
+    Reducibility = Reduction.fromString(options.reducibility)
+    OnlyPrimary = options.onlyprimary
+    ShowForm = options.showform
+    Conservation = options.conservation
+    Restrict = restrictedPrinciples(options.restrict_string, options.omit_string)
+    
+    if Restrict:
+        principles &= Restrict
+    
+    out = []
+    
+    if Implications or NonImplications or Weak or Strong or ShowForm or Conservation:
+        
+        eprint(u'Removing redundant facts for clarity...')
+        
+        shown, impliesRow, notImpliesRow, impliedRow, equivalent, consForm = condensePrinciples(
+            Reducibility, principles, primary, primaryIndex)
+        
+        # Remove redundant implications, keeping the transitive reduction
+        
+        printImplies = defaultdict(bool)
+        for i,a in enumerate(shown):
+            redundant = 0
+            for j in _bits(impliesRow[i]):
+                redundant |= impliesRow[j]
+            for j in _bits(impliesRow[i] & ~redundant):
+                printImplies[(a,shown[j])] = True
+        
+        # Remove redundant non-implications
+        
+        printNotImplies = defaultdict(bool)
+        for i,a in enumerate(shown):
+            redundant = 0
+            for j in _bits(notImpliesRow[i]): # If a -|> c, but b -> c, then a -|> b.
+                redundant |= impliedRow[j]
+            for j in _bits(impliedRow[i]): # If c -> a, but c -|> b, then a -|> b.
+                redundant |= notImpliesRow[j]
+            for j in _bits(notImpliesRow[i] & ~redundant):
+                printNotImplies[(a,shown[j])] = True
+        
+        # Remove redundant conservation facts
+        
+        printConservative = defaultdict(noForm)
+        if Conservation:
+            for i,a in enumerate(shown):
+                for j,b in enumerate(shown):
+                    frm = consForm.get((a,b), Form.none)
+                    if frm == Form.none: continue
+                    
+                    for k in _bits(impliedRow[i]): # Remove conservation results obtained by transitivity
+                        frm &= ~consForm.get((shown[k],b), Form.none)
+                    for k in _bits(impliesRow[j]):
+                        frm &= ~consForm.get((a,shown[k]), Form.none)
+                    printConservative[(a,b)] = frm
+        
+        # Generate open implications
+        
+        printWeakOpen = defaultdict(bool)
+        printStrongOpen = defaultdict(bool)
+        if Weak or Strong:
+            weakRow, strongRow = openFrontier(impliesRow, notImpliesRow, impliedRow)
+            for i,a in enumerate(shown):
+                for j in _bits(weakRow[i]):
+                    printWeakOpen[(a,shown[j])] = True
+                for j in _bits(strongRow[i]):
+                    printStrongOpen[(a,shown[j])] = True
+        
+        # Find all equivalent principles
+        
+        equivSet = defaultdict(set)
+        for a in primary:
+            for b in principles:
+                if equivalent[(a,b)]:
+                    equivSet[a].add(b)
+    
+    # Write out the DOT file
+    
+    if Implications or NonImplications or Weak or Strong or ShowForm or Conservation:
+        
+        eprint(u'Printing DOT file...')
+        eprint("\tDiagram contains {0} non-equivalent principles.".format(len(primary)))
+        
+        out.append("""//
 // RM Zoo (v""" + Version + """)
 //
 
@@ -693,61 +806,342 @@ node [shape=none,color=white];
 //
 // Data
 //""")
-
-    if Implications:
         
-        for a in primary:
-            for b in primary:
-                if printImplies[(a,b)]:
-                    style = []
-                    if printNotImplies[(b,a)] and not NonImplications:
-                        style.append(u'color = "black:white:black"')
-                    if len(equivSet[a]) > 0 and not OnlyPrimary:
-                        style.append(u'minlen = 2')
-                    s = u''
-                    if len(style) > 0:
-                        s = u' [{0}]'.format(u', '.join(style))
-                    print(u'" {0} " -> " {1} "{2}'.format(a,b,s))
-                        
-    if NonImplications:
+        if Implications:
+            
+            for a in primary:
+                for b in primary:
+                    if printImplies[(a,b)]:
+                        style = []
+                        if printNotImplies[(b,a)] and not NonImplications:
+                            style.append(u'color = "black:white:black"')
+                        if len(equivSet[a]) > 0 and not OnlyPrimary:
+                            style.append(u'minlen = 2')
+                        s = u''
+                        if len(style) > 0:
+                            s = u' [{0}]'.format(u', '.join(style))
+                        out.append(u'" {0} " -> " {1} "{2}'.format(a,b,s))
         
-        for a in primary:
-            for b in primary:
-                if printNotImplies[(a,b)]:
-                        print(u'" {0} " -> " {1} " [color = "red"]'.format(a,b))
-    
-    if not OnlyPrimary:
-        for a in primary:
-            for b in equivSet[a]:
-                print(u'" {0} " -> " {1} "  [dir = both]'.format(a,b))
+        if NonImplications:
+            
+            for a in primary:
+                for b in primary:
+                    if printNotImplies[(a,b)]:
+                            out.append(u'" {0} " -> " {1} " [color = "red"]'.format(a,b))
+        
+        if not OnlyPrimary:
+            for a in primary:
+                for b in equivSet[a]:
+                    out.append(u'" {0} " -> " {1} "  [dir = both]'.format(a,b))
+        
+        if Weak:
+            for a in primary:
+                for b in primary:
+                    if printWeakOpen[(a,b)]:
+                        out.append(u'" {0} " -> " {1} "  [color = "green"]'.format(a,b))
+        
+        if Strong:
+            for a in primary:
+                for b in primary:
+                    if printStrongOpen[(a,b)]:
+                        out.append(u'" {0} " -> " {1} "  [color = "orange"]'.format(a,b))
+        
+        if ShowForm:
+            for a in principles:
+                if a in form:
+                    if form[a] != Form.none:
+                        out.append(u'" {0} " [shape=box, style=filled, fillcolor={1}]'.format(a, formColor(_FORM_COLOR, form[a])))
+        
+        
+        if Conservation:
+            for a in primary:
+                for b in primary:
+                    if a == b: continue
                     
-    if Weak:
-        for a in primary:
-            for b in primary:
-                if printWeakOpen[(a,b)]:
-                    print(u'" {0} " -> " {1} "  [color = "green"]'.format(a,b))
-                
-    if Strong:
-        for a in primary:
-            for b in primary:
-                if printStrongOpen[(a,b)]:
-                    print(u'" {0} " -> " {1} "  [color = "orange"]'.format(a,b))
+                    if printConservative[(a,b)] != Form.none:
+                        out.append(u'" {0} " -> " {1} "  [color = "{2}"]'.format(a,b, formColor(_CONS_COLOR, printConservative[(a,b)])))
         
-    if ShowForm:
-        for a in principles:
-            if a in form:
-                if form[a] != Form.none:
-                    print(u'" {0} " [shape=box, style=filled, fillcolor={1}]'.format(a, _FORM_COLOR[form[a]]))
-                
+        out.append(u'}')
     
-    if Conservation:
-        for a in primary:
-            for b in primary:
-                if a == b: continue
+    return u''.join(line + u'\n' for line in out)
+
+##################################################################################
+#
+#   SERVER
+#
+##################################################################################
+
+# Requests share the loaded database (and its justification caches), so they
+#  are answered one at a time
+databaseLock = threading.Lock()
+
+def refreshDatabase(databaseName):
+    global databaseStamp
+    try:
+        stamp = fileStamp(databaseName)
+    except OSError:
+        return
+    if stamp == databaseStamp:
+        return
+    
+    # rmupdater replaces the database atomically, so the new file is complete
+    eprint(u'Database changed; reloading...')
+    try:
+        loadDatabase(databaseName)
+    except Exception as e:
+        eprint(u'Reload failed; keeping the previous database.\n' + str(e))
+        databaseStamp = stamp
+
+def answerRequest(request, databaseName):
+    response = {'request': request}
+    try:
+        with databaseLock:
+            refreshDatabase(databaseName)
+            
+            if request.startswith(u'-'):
+                parser = optionParser(serving=True)
+                parser.error = error
+                (options, args) = parser.parse_args(shlex.split(request))
+                if len(args) > 0:
+                    error(u'Requests cannot name a database.')
+                if options.query_file or options.add_principles:
+                    error(u'Options -F and --force are not available to requests.')
+                checkOptions(parser, options)
+            else:
+                options = None
+            
+            if options is None:
+                response.update(answerFact(*parseQuery(request)))
+            elif options.query_string:
+                response.update(answerFact(*parseQuery(options.query_string), proof=options.proof))
+            else:
+                response['dot'] = diagram(options)
+    except Exception as e:
+        response['error'] = errorMessage(e)
+    return json.dumps(response, sort_keys=True)
+
+def serveStream(inFile, outFile, databaseName):
+    for request in inFile:
+        request = request.strip()
+        if len(request) == 0: continue
+        
+        outFile.write(answerRequest(request, databaseName) + u'\n')
+        outFile.flush()
+
+def isSocket(path):
+    return stat.S_ISSOCK(os.stat(path).st_mode)
+
+def serveSocket(socketName, databaseName):
+    try:
+        import socketserver
+    except ImportError:
+        import SocketServer as socketserver
+    
+    class RequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for request in self.rfile:
+                request = request.decode('utf-8').strip()
+                if len(request) == 0: continue
                 
-                if printConservative[(a,b)] != Form.none:
-                    print(u'" {0} " -> " {1} "  [color = "{2}"]'.format(a,b, _CONS_COLOR[printConservative[(a,b)]]))
+                self.wfile.write((answerRequest(request, databaseName) + u'\n').encode('utf-8'))
+                self.wfile.flush()
+    
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+    
+    # Replace a socket left behind by an earlier server, but nothing else
+    if os.path.exists(socketName) and isSocket(socketName):
+        os.remove(socketName)
+    server = Server(socketName, RequestHandler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(socketName)
 
-    print(u'}')
-    eprint(u'Finished.')
+##################################################################################
+#
+#   GET OPTIONS
+#
+##################################################################################
+
+from optparse import OptionParser, OptionGroup
+
+def optionParser(serving=False):
+    if serving:
+        parser = OptionParser(u'Usage: [options]', add_help_option=False)
+    else:
+        parser = OptionParser(u'Usage: %prog [options] [database]', version=u'%prog {0} ({1})'.format(Version, Date))
+    
+    parser.set_defaults(implications=False,nonimplications=False,omega=False,onlyprimary=False,weak=False,strong=False,showform=False,conservation=False,add_principles=False,json=False,justify=False,jobs=None,serve=False,socket_name=None,timings=False)
+    
+    parser.add_option('-i', action='store_true', dest='implications',
+        help=u'Display implications between principles.')
+    parser.add_option('-n', action='store_true', dest='nonimplications',
+        help=u'Display non-implications between principles.')
+    parser.add_option('-w', action='store_true', dest='weak',
+        help=u'Display weakest non-redundant open implications.')
+    parser.add_option('-s', action='store_true', dest='strong',
+        help=u'Display strongest non-redundant open implications.')
+    parser.add_option('-t', dest='reducibility', default='RCA',
+        help=u'Display facts relative to REDUCIBILITY-implications.')
+    parser.add_option('-o', action='store_const', dest='reducibility', const='w',
+        help=u'Display only facts that hold in omega models.')
+    parser.add_option('-p', action='store_true', dest='onlyprimary',
+        help=u'Display only facts about primary principles.')
+    
+    parser.add_option('-f', action='store_true', dest='showform',
+        help=u'Indicate syntactic forms of principles.')
+    parser.add_option('-c', action='store_true', dest='conservation',
+        help=u'Display known conservation results.')
+    
+    parser.add_option('-r', dest='restrict_string', metavar='CLASS',
+        help=u'Restrict to only the principles in CLASS.')
+    parser.add_option('--omit', dest='omit_string', metavar='CLASS',
+        help=u'Omit all principles in CLASS.')
+    
+    parser.add_option('-q', dest='query_string', metavar='FACT',
+        help=u'Show whether FACT is known, and if so, its justification.')
+    parser.add_option('-F', dest='query_file', metavar='FILE',
+        help=u'Query whether all facts in FILE (or standard input, if FILE is -) are known, and return a list of all unknown facts.')
+    
+    parser.add_option('--proof', dest='proof', type='choice', choices=['tree', 'dag', 'json'], default='tree', metavar='FORMAT',
+        help=u'Show justifications as a tree with every lemma in full (tree), as numbered lemmas that are each shown once (dag), or as numbered lemmas in JSON (json). (default: tree)')
+    
+    parser.add_option('--force', action='store_true', dest='add_principles',
+        help=u'Allow queries involving novel conjunctions from the database. (WARNING: slow)')
+    
+    if not serving:
+        parser.add_option('--json', action='store_true', dest='json',
+            help=u'With -F, write the status of each fact (known, contradicted, or unknown) as one line of JSON.')
+        parser.add_option('--justify', action='store_true', dest='justify',
+            help=u'With -F and --json, include the justification of each known or contradicted fact.')
+        parser.add_option('-j', '--jobs', dest='jobs', type='int', metavar='N',
+            help=u'With -F, answer queries in N processes. (default: one per CPU)')
+        parser.add_option('--serve', action='store_true', dest='serve',
+            help=u'Keep the database loaded, and answer requests (facts to query, or sets of options) from standard input, one per line, with one JSON object per line.')
+        parser.add_option('--socket', dest='socket_name', metavar='PATH',
+            help=u'With --serve, answer requests from any number of clients over a Unix socket at PATH.')
+        parser.add_option('--timings', action='store_true', dest='timings',
+            help=u'Report the time taken by each phase of the run: imports, loading the database, building the query grammar, and answering.')
+    
+    return parser
+
+def checkOptions(parser, options):
+    Implications = options.implications
+    NonImplications = options.nonimplications
+    Weak = options.weak
+    Strong = options.strong
+    OnlyPrimary = options.onlyprimary
+    ShowForm = options.showform
+    Conservation = options.conservation
+    Restrict = options.restrict_string
+    Omissions = options.omit_string
+    Query = options.query_string
+    QueryFile = options.query_file
+    
+    # Give errors if bad options chosen
+    
+    if options.serve:
+        if Implications or NonImplications or OnlyPrimary or Restrict or Omissions or Weak or Strong or ShowForm or Conservation or Query or QueryFile or options.proof != u'tree':
+            parser.error(u'Option --serve does not work with any other option (except --socket).')
+        if options.socket_name and os.path.exists(options.socket_name) and not isSocket(options.socket_name):
+            parser.error(u'"{0}" already exists, and is not a socket.'.format(options.socket_name))
+        return
+    if options.socket_name:
+        parser.error(u'Option --socket only works with --serve.')
+    if options.json or options.jobs is not None:
+        if not QueryFile:
+            parser.error(u'Options --json and --jobs only work with -F.')
+    if options.justify and not options.json:
+        parser.error(u'Option --justify only works with --json.')
+    if options.proof != u'tree' and not Query and not options.justify:
+        parser.error(u'Option --proof only works with -q, or with -F and --justify.')
+    if options.jobs is not None and options.jobs < 1:
+        parser.error(u'Option --jobs must be at least 1.')
+    
+    if not Implications and not NonImplications and not OnlyPrimary and not Restrict and not Weak and not Strong and not ShowForm and not Conservation and not Query and not QueryFile:
+        parser.error(u'No options selected.')
+    if OnlyPrimary:
+        if not Implications and not NonImplications and not Weak and not Strong and not ShowForm and not Conservation:
+            parser.error(u'Option -p only works if one of -i, -n, -w, -s, -f, or -c is selected.')
+    if Restrict or Omissions:
+        if Restrict and Omissions:
+            parser.error(u'Options -r and --omit are incompatible.')
+        if not Implications and not NonImplications and not Weak and not Strong and not ShowForm and not Conservation:
+            parser.error(u'Options -r and --omit only work if one of -i, -n, -w, -s, -f, or -c is selected.')
+    if Query:
+        if Implications or NonImplications or Weak or Strong or ShowForm or Conservation or Restrict or OnlyPrimary or QueryFile:
+            parser.error(u'Option -q does not work with any other option (except --force and --proof).')
+    if QueryFile:
+        if Implications or NonImplications or Weak or Strong or ShowForm or Conservation or Restrict or OnlyPrimary or Query:
+            parser.error(u'Option -F does not work with any other option (except --force).')
+
+def reportTimings():
+    eprint(u'\nTimings:')
+    for phase, elapsed in phaseTimes.items():
+        eprint(u'\t{0}: {1:.6f} s'.format(phase, elapsed))
+    eprint(u'\ttotal: {0:.6f} s'.format(timekeeper() - importStart))
+
+def main():
+    eprint(u'\nRM Zoo (v{0})'.format(Version))
+    
+    parser = optionParser()
+    (options, args) = parser.parse_args()
+    checkOptions(parser, options)
+    
+    if len(args) > 1:
+        parser.error(u'Too many arguments.')
+    if len(args) > 0:
+        databaseTitle = args[0]
+    else:
+        eprint(u'No database title specified; defaulting to "database".')
+        databaseTitle = 'database'
+    
+    if os.path.splitext(databaseTitle)[1] == '':
+        databaseName = databaseTitle + os.extsep + 'dat'
+    else:
+        databaseName = databaseTitle
+    
+    eprint(u'Importing and organizing data...')
+    start = timekeeper()
+    loadDatabase(databaseName)
+    recordPhase(u'database', start)
+    
+    if options.serve:
+        if options.socket_name:
+            eprint(u'Serving requests on {0}...'.format(options.socket_name))
+            serveSocket(options.socket_name, databaseName)
+        else:
+            eprint(u'Serving requests...')
+            serveStream(sys.stdin, sys.stdout, databaseName)
+        return
+    
+    if options.query_string:
+        a, op, b = parseQuery(options.query_string)
+        if options.add_principles and op != u'form':
+            forceQuery(a, b)
+        start = timekeeper()
+        printAnswer(answerFact(a, op, b, proof=options.proof), options.proof)
+        recordPhase(u'query', start)
+    elif options.query_file:
+        jobs = options.jobs
+        if jobs is None:
+            import multiprocessing
+            jobs = multiprocessing.cpu_count()
+        start = timekeeper()
+        checkQueryFile(options.query_file, options.add_principles, options.json, options.justify, jobs, options.proof)
+        recordPhase(u'queries', start)
+    else:
+        start = timekeeper()
+        print(diagram(options), end=u'')
+        recordPhase(u'diagram', start)
+        eprint(u'Finished.')
+    
+    if options.timings:
+        reportTimings()
 
+if __name__ == '__main__':
+    main()
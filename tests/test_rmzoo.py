@@ -0,0 +1,108 @@
+from __future__ import print_function
+
+import json, os, shutil, socket, subprocess, sys, tempfile, time, unittest
+
+from io import open
+
+scriptDirectory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+testResults = u'''RT22 is primary
+COH is primary
+WKL is primary
+RT22 form rPi12
+COH form Sig03
+WKL form Pi12
+RT22 -> COH "Mileti (2004)"
+WKL Pi11c RCA "Harrington"
+'''
+
+def runScript(args, input=None):
+    command = [sys.executable, os.path.join(scriptDirectory, args[0])] + list(args[1:])
+    proc = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = proc.communicate(input.encode('utf-8') if input is not None else None)
+    if proc.returncode != 0:
+        raise AssertionError(u'{0} failed:\n{1}'.format(u' '.join(args), err.decode('utf-8', 'replace')))
+    return out.decode('utf-8')
+
+class ZooTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp(prefix='rmzoo')
+        resultsName = os.path.join(cls.directory, u'results.txt')
+        with open(resultsName, mode='w', encoding='utf-8') as f:
+            f.write(testResults)
+        cls.databaseName = os.path.join(cls.directory, u'zoo.dat')
+        runScript(['rmupdater.py', '-q', resultsName, cls.databaseName])
+    
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+class ServeTest(ZooTestCase):
+    formRequests = [u'RT22 form rPi12', u'RT22 is rPi12', u'WKL form rPi12']
+    
+    def checkFormAnswers(self, lines):
+        answers = [json.loads(line) for line in lines]
+        self.assertEqual([answer['request'] for answer in answers], self.formRequests)
+        self.assertEqual([answer.get('error') for answer in answers], [None, None, None])
+        self.assertEqual([answer['status'] for answer in answers], [u'known', u'known', u'unknown'])
+    
+    def test_form_query_on_stdin(self):
+        out = runScript(['rmzoo.py', '--serve', self.databaseName], input=u'\n'.join(self.formRequests) + u'\n')
+        self.checkFormAnswers(out.splitlines())
+    
+    def test_form_query_over_socket(self):
+        socketName = os.path.join(self.directory, u'zoo.sock')
+        command = [sys.executable, os.path.join(scriptDirectory, 'rmzoo.py'), '--serve', '--socket', socketName, self.databaseName]
+        with open(os.devnull, mode='wb') as devnull:
+            proc = subprocess.Popen(command, stdin=devnull, stdout=devnull, stderr=devnull)
+        try:
+            for k in range(100):
+                if os.path.exists(socketName): break
+                time.sleep(0.1)
+            
+            client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            client.connect(socketName)
+            try:
+                client.sendall((u'\n'.join(self.formRequests) + u'\n').encode('utf-8'))
+                client.shutdown(socket.SHUT_WR)
+                received = b''
+                while True:
+                    data = client.recv(4096)
+                    if not data: break
+                    received += data
+            finally:
+                client.close()
+            self.checkFormAnswers(received.decode('utf-8').splitlines())
+        finally:
+            proc.terminate()
+            proc.wait()
+    
+    def test_query_matches_serve(self):
+        out = runScript(['rmzoo.py', '-q', u'RT22 is rPi12', self.databaseName])
+        self.assertIn(u'"RT22 form rPi12" is known', out)
+
+class DiagramTest(ZooTestCase):
+    def nodeColors(self, dot):
+        colors = {}
+        for line in dot.splitlines():
+            if u'fillcolor=' in line:
+                colors[line.split(u'"')[1].strip()] = line.split(u'fillcolor=')[1].rstrip(u']')
+        return colors
+    
+    def test_forms_alone(self):
+        dot = runScript(['rmzoo.py', '-f', self.databaseName])
+        # Sig03 has no color of its own, but implies Pi11; Pi12 has no color
+        self.assertEqual(self.nodeColors(dot), {u'RT22': u'cyan', u'COH': u'pink', u'WKL': u'white'})
+    
+    def test_conservation_alone(self):
+        dot = runScript(['rmzoo.py', '-c', self.databaseName])
+        self.assertIn(u'" WKL " -> " RCA "  [color = "pink"]', dot)
+    
+    def test_conservation_with_forms(self):
+        dot = runScript(['rmzoo.py', '-c', '-f', self.databaseName])
+        self.assertEqual(self.nodeColors(dot)[u'COH'], u'pink')
+        self.assertIn(u'" WKL " -> " RCA "  [color = "pink"]', dot)
+
+if __name__ == '__main__':
+    unittest.main()